@@ -0,0 +1,258 @@
+"""Run tasks from a JSONL file through one of the agent teams, without a prompt loop.
+
+Every input line is a JSON object with a "task" (and optionally an "id";
+the line number is used otherwise) or a plain JSON string. Results are
+appended to the output JSONL as each task finishes, one line per task with
+its status, result and timing. A line that cannot be read is recorded as
+an error. Rerunning with the same output file skips the tasks already
+recorded there, so a crashed batch resumes where it stopped.
+
+Usage: python batch_runner.py tasks.jsonl results.jsonl [--team code_agent] [--concurrency 4] [--timeout 600]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, Optional, Set, Tuple
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from execution_scheduler import job_context
+from executor_pool import get_executor_pool, stop_executor_pools
+from llm_cache import cache_from_env
+from tracing import trace_client, trace_from_env
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+
+DEFAULT_TIMEOUT = 600
+
+
+@dataclass
+class BatchTask:
+    id: str
+    line: int
+    task: str
+    # Set for a line that could not be read; the task is recorded as failed without running.
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    id: str
+    line: int
+    task: str
+    status: str
+    result: Optional[str]
+    error: Optional[str]
+    started: float
+    seconds: float
+
+
+def read_tasks(path: str) -> Iterator[BatchTask]:
+    """Stream the tasks of a JSONL file, skipping blank lines."""
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if isinstance(record, str):
+                    record = {"task": record}
+                task = BatchTask(id=str(record.get("id", f"line-{line_number}")), line=line_number, task=record["task"])
+            except (ValueError, AttributeError, KeyError) as e:
+                error = f"Malformed input line: {type(e).__name__}: {e}"
+                task = BatchTask(id=f"line-{line_number}", line=line_number, task=line.strip(), error=error)
+            yield task
+
+
+def completed_ids(path: str, retry_errors: bool = False) -> Set[str]:
+    """Ids already recorded in an output file, after dropping a line cut off by a crash."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[: data.rfind(b"\n") + 1]
+    ids = set()
+    for line in data.decode().splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get("status") == OK or not retry_errors:
+            ids.add(record["id"])
+    return ids
+
+
+class CodeAgentRunner:
+    """Runs tasks as concurrent sessions of one CodeAgent."""
+
+    def __init__(self, model_client: ChatCompletionClient, concurrency: int, workdir: str) -> None:
+        from code_agent_core import CodeAgent
+
+        # One warm executor worker per task in flight, up to the CPU count.
+        get_executor_pool(work_dir=workdir, size=min(concurrency, os.cpu_count() or 1))
+        self._agent = CodeAgent(workdir=workdir, model_client=model_client)
+        self._setup = False
+
+    async def run(self, task: str, task_id: str, timeout: float | None) -> str:
+        if not self._setup:
+            self._setup = True
+            await self._agent.setup()
+        # On timeout the session is closed, which stops its agents.
+        return await self._agent.run(task, task_id=task_id, timeout=timeout)
+
+    async def close(self) -> None:
+        await self._agent.stop()
+
+
+class SwarmRunner:
+    """Runs tasks on a pool of Swarm teams, since a team runs one task at a time."""
+
+    def __init__(self, create_team: Callable, model_client: ChatCompletionClient, concurrency: int) -> None:
+        self._teams: asyncio.Queue = asyncio.Queue()
+        for _ in range(concurrency):
+            self._teams.put_nowait(create_team(model_client))
+
+    async def run(self, task: str, task_id: str, timeout: float | None) -> str:
+        from execute_code_tool import release_workspace
+
+        team = await self._teams.get()
+        # Cancelling wait_for() would not stop the team's agents; cancelling its token does.
+        token = CancellationToken()
+        timer = asyncio.get_running_loop().call_later(timeout, token.cancel) if timeout else None
+        try:
+            result = await team.run(task=task, cancellation_token=token)
+            return str(result.messages[-1].content) if result.messages else ""
+        except asyncio.CancelledError:
+            if not token.is_cancelled():
+                raise
+            raise asyncio.TimeoutError() from None
+        finally:
+            if timer is not None:
+                timer.cancel()
+            await team.reset()
+            self._teams.put_nowait(team)
+            release_workspace(task_id)
+
+    async def close(self) -> None:
+        pass
+
+
+def writer_tester_swarm_runner(model_client: ChatCompletionClient, concurrency: int, workdir: str) -> SwarmRunner:
+    from execute_code_tool import set_work_dir
+    from reliable_code_writer_swarm import create_team
+
+    set_work_dir(workdir)
+    return SwarmRunner(create_team, model_client, concurrency)
+
+
+# Teams that ask the user for input mid-task (MetaAgent, CodeAgentGroup) cannot run unattended.
+TEAMS = {
+    "code_agent": CodeAgentRunner,
+    "writer_tester_swarm": writer_tester_swarm_runner,
+}
+
+
+async def run_batch(
+    runner,
+    tasks: Iterator[BatchTask],
+    output_path: str,
+    concurrency: int = 4,
+    timeout: float | None = DEFAULT_TIMEOUT,
+    skip: Set[str] = frozenset(),
+) -> Tuple[int, int]:
+    """Run tasks with at most concurrency in flight; returns (done, failed).
+
+    Each task runs in its own execution session, named after its id.
+    """
+    queue: asyncio.Queue[Optional[BatchTask]] = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {"done": 0, "failed": 0}
+
+    async def feed() -> None:
+        # Read lazily, so a file of thousands of tasks is never held in memory.
+        for task in tasks:
+            if task.id not in skip:
+                await queue.put(task)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work(output) -> None:
+        while (task := await queue.get()) is not None:
+            started = time.time()
+            start = time.perf_counter()
+            result, error, status = None, None, OK
+            try:
+                if task.error is not None:
+                    status, error = ERROR, task.error
+                else:
+                    with job_context(session=task.id):
+                        result = await runner.run(task.task, task.id, timeout)
+            except asyncio.TimeoutError:
+                status, error = TIMEOUT, f"Task timed out after {timeout} seconds."
+            except Exception as e:
+                status, error = ERROR, f"{type(e).__name__}: {e}"
+            record = BatchResult(task.id, task.line, task.task, status, result, error, started, time.perf_counter() - start)
+            output.write(json.dumps(asdict(record)) + "\n")
+            output.flush()
+            counts["done"] += 1
+            counts["failed"] += status != OK
+            print(f"[{counts['done']}] {task.id}: {status} in {record.seconds:.1f}s", file=sys.stderr)
+
+    with open(output_path, "a") as output:
+        await asyncio.gather(feed(), *[work(output) for _ in range(concurrency)])
+    return counts["done"], counts["failed"]
+
+
+def create_model_client() -> ChatCompletionClient:
+    model_client = OpenAIChatCompletionClient(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url="https://api.deepseek.com",
+        model="deepseek-chat",
+        model_capabilities={
+            "vision": False,
+            "function_calling": True,
+            "json_output": True,
+        },
+    )
+    trace_from_env()
+    return trace_client(cache_from_env(model_client))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="input JSONL file")
+    parser.add_argument("output", help="output JSONL file, appended to and used to resume")
+    parser.add_argument("--team", choices=list(TEAMS), default="code_agent")
+    parser.add_argument("--concurrency", type=int, default=4, help="tasks in flight at once")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds per task")
+    parser.add_argument("--workdir", default="coding", help="work directory of the executors")
+    parser.add_argument("--retry-errors", action="store_true", help="rerun tasks recorded as failed")
+    args = parser.parse_args()
+
+    skip = completed_ids(args.output, retry_errors=args.retry_errors)
+    if skip:
+        print(f"Resuming: {len(skip)} task(s) already in {args.output}.", file=sys.stderr)
+    runner = TEAMS[args.team](create_model_client(), args.concurrency, args.workdir)
+    start = time.perf_counter()
+    try:
+        done, failed = await run_batch(
+            runner, read_tasks(args.tasks), args.output, args.concurrency, args.timeout, skip
+        )
+    finally:
+        await runner.close()
+        await stop_executor_pools()
+    seconds = time.perf_counter() - start
+    print(f"{done} task(s), {failed} failed, in {seconds:.1f}s.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,447 @@
+"""Offline end-to-end benchmarks for the agent teams.
+
+A scripted ChatCompletionClient with injected latency stands in for the
+model, so the numbers measure what the orchestration itself adds: runtime
+dispatch, handoffs, executor spin-up and history growth. Every team runs in
+its own child process so its peak RSS is not shared with the others.
+
+Usage: python benchmarks/bench_agents.py [--team NAME ...] [--tasks N] [--latency S] [--json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Mapping, Optional, Sequence, Union
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from autogen_core import (
+    AgentId,
+    CancellationToken,
+    ClosureAgent,
+    ClosureContext,
+    DefaultInterventionHandler,
+    DefaultSubscription,
+    DefaultTopicId,
+    FunctionCall,
+    MessageContext,
+    SingleThreadedAgentRuntime,
+)
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+    SystemMessage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+Reply = Union[str, List[FunctionCall]]
+
+
+def call(tool_name: str, /, **arguments: Any) -> FunctionCall:
+    return FunctionCall(id="", name=tool_name, arguments=json.dumps(arguments))
+
+
+class ScriptedChatCompletionClient(ChatCompletionClient):
+    """Answers from a script instead of a model, after an injected delay.
+
+    script maps a phrase of an agent's system message to the replies that
+    agent gives on its first, second, ... call; the last reply repeats.
+    """
+
+    def __init__(self, script: Dict[str, List[Reply]], latency: float = 0.0, chunk_size: int = 16) -> None:
+        self._script = script
+        self._latency = latency
+        self._chunk_size = chunk_size
+        self._turns: Dict[str, int] = {}
+        self._usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.calls = 0
+
+    def reset(self) -> None:
+        self._turns.clear()
+        self.calls = 0
+
+    def _reply(self, messages: Sequence[LLMMessage]) -> Reply:
+        system = "\n".join(m.content for m in messages if isinstance(m, SystemMessage))
+        for phrase, replies in self._script.items():
+            if phrase in system:
+                turn = self._turns.get(phrase, 0)
+                self._turns[phrase] = turn + 1
+                reply = replies[min(turn, len(replies) - 1)]
+                if isinstance(reply, list):
+                    # Fresh ids per call, as a model would hand out.
+                    reply = [
+                        FunctionCall(id=f"call_{self.calls}_{i}", name=c.name, arguments=c.arguments)
+                        for i, c in enumerate(reply)
+                    ]
+                return reply
+        raise KeyError(f"No scripted reply for system message: {system[:80]!r}")
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self.calls += 1
+        content = self._reply(messages)
+        await asyncio.sleep(self._latency)
+        usage = RequestUsage(prompt_tokens=self.count_tokens(messages), completion_tokens=len(str(content)) // 4)
+        self._usage = RequestUsage(
+            prompt_tokens=self._usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._usage.completion_tokens + usage.completion_tokens,
+        )
+        finish_reason = "function_calls" if isinstance(content, list) else "stop"
+        return CreateResult(finish_reason=finish_reason, content=content, usage=usage, cached=False)
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        result = await self.create(messages, tools=tools)
+        if isinstance(result.content, str):
+            for i in range(0, len(result.content), self._chunk_size):
+                yield result.content[i : i + self._chunk_size]
+        yield result
+
+    def actual_usage(self) -> RequestUsage:
+        return self._usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return sum(len(str(m.content)) for m in messages) // 4
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return 128000 - self.count_tokens(messages)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return ModelCapabilities(vision=False, function_calling=True, json_output=True)
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return ModelInfo(vision=False, function_calling=True, json_output=True, family="unknown")
+
+
+class HopRecorder(DefaultInterventionHandler):
+    """Timestamps every message the runtime delivers; the gaps are the hops."""
+
+    def __init__(self) -> None:
+        self.times: List[float] = []
+
+    def mark(self) -> None:
+        self.times.append(time.perf_counter())
+
+    async def on_send(self, message: Any, *, sender: AgentId | None, recipient: AgentId) -> Any:
+        self.mark()
+        return message
+
+    async def on_publish(self, message: Any, *, sender: AgentId | None) -> Any:
+        self.mark()
+        return message
+
+
+class TaskStats:
+    def __init__(self) -> None:
+        self.wall: List[float] = []
+        self.llm_calls: List[int] = []
+        self.messages: List[int] = []
+        self.hops: List[float] = []
+
+    def add(self, wall: float, llm_calls: int, times: List[float]) -> None:
+        self.wall.append(wall)
+        self.llm_calls.append(llm_calls)
+        self.messages.append(len(times))
+        self.hops.extend(b - a for a, b in zip(times, times[1:]))
+
+    def summary(self, latency: float) -> Dict[str, Any]:
+        hops = sorted(self.hops) or [0.0]
+        wall = statistics.mean(self.wall)
+        llm_calls = statistics.mean(self.llm_calls)
+        return {
+            "tasks": len(self.wall),
+            "wall_seconds_per_task": round(wall, 4),
+            # Everything that is not the injected model latency.
+            "orchestration_seconds_per_task": round(wall - llm_calls * latency, 4),
+            "llm_calls_per_task": llm_calls,
+            "messages_per_task": statistics.mean(self.messages),
+            "hop_latency_ms": {
+                "mean": round(statistics.mean(hops) * 1000, 3),
+                "p50": round(hops[len(hops) // 2] * 1000, 3),
+                "p95": round(hops[min(len(hops) - 1, int(len(hops) * 0.95))] * 1000, 3),
+                "max": round(hops[-1] * 1000, 3),
+            },
+        }
+
+
+CODE = "print(sum(range(10)))"
+TEST_CODE = """from solution import add
+
+
+def test_add():
+    assert add(1, 2) == 3
+
+
+def test_add_negative():
+    assert add(-1, 1) == 0
+"""
+
+
+async def bench_code_agent(tasks: int, latency: float) -> TaskStats:
+    from code_agent_core import CodeAgent
+
+    client = ScriptedChatCompletionClient(
+        {
+            "Write Python or Bash script": [f"```python\n{CODE}\n```"],
+            "code execution result reviewer": ["APPROVE"],
+        },
+        latency,
+    )
+    agent = CodeAgent(workdir="coding", model_client=client)
+    recorder = HopRecorder()
+    agent.runtime = SingleThreadedAgentRuntime(intervention_handlers=[recorder])
+    await agent.setup()
+    stats = TaskStats()
+    for i in range(tasks):
+        client.reset()
+        recorder.times = []
+        start = time.perf_counter()
+        await agent.run(f"Print the sum of the numbers below 10 ({i}).")
+        stats.add(time.perf_counter() - start, client.calls, recorder.times)
+    await agent.stop()
+    return stats
+
+
+async def bench_meta_agent(tasks: int, latency: float) -> TaskStats:
+    from meta_agent import FinalResultMessage, MetaAgent, UserTaskMessage
+
+    client = ScriptedChatCompletionClient(
+        {
+            "meta agent": [
+                [
+                    call("make_agent", name="solver", system_message="You are the solver."),
+                    call("make_reviewer_agent", name="checker", system_message="You are the checker."),
+                ]
+            ],
+            "You are the solver.": [[call("execute_code", code=CODE, language="python")]],
+            "You are the checker.": ["APPROVE"],
+        },
+        latency,
+    )
+    # One runtime for the whole session, so teams left behind by earlier tasks would show up.
+    recorder = HopRecorder()
+    runtime = SingleThreadedAgentRuntime(intervention_handlers=[recorder])
+    await MetaAgent.register(runtime, "MetaAgent", lambda: MetaAgent(model_client=client))
+    results: asyncio.Queue[str] = asyncio.Queue()
+
+    # The default topic also carries the user tasks and the teams' own messages;
+    # only the final results are wanted, the rest is ignored without a warning each.
+    async def collect(_agent: ClosureContext, message: FinalResultMessage, ctx: MessageContext) -> None:
+        if isinstance(message, FinalResultMessage):
+            await results.put(message.result)
+
+    await ClosureAgent.register_closure(
+        runtime, "collect", collect, subscriptions=lambda: [DefaultSubscription()], unknown_type_policy="ignore"
+    )
+    runtime.start()
+    stats = TaskStats()
+    for i in range(tasks):
+        client.reset()
+        recorder.times = []
+        start = time.perf_counter()
+        await runtime.publish_message(UserTaskMessage(user_task=f"Print the sum of the numbers below 10 ({i})."), DefaultTopicId())
+        await results.get()
+        stats.add(time.perf_counter() - start, client.calls, recorder.times)
+    await runtime.stop_when_idle()
+    return stats
+
+
+async def bench_react_agent(tasks: int, latency: float) -> TaskStats:
+    from react_agent import ReactAgent, UserTaskMessage
+
+    client = ScriptedChatCompletionClient(
+        {"ReAct paradigm": [[call("execute_code", code=CODE, language="python")], "The sum is 45."]},
+        latency,
+    )
+    recorder = HopRecorder()
+    runtime = SingleThreadedAgentRuntime(intervention_handlers=[recorder])
+    await ReactAgent.register(runtime, "react_agent", lambda: ReactAgent(model_client=client))
+    stats = TaskStats()
+    for i in range(tasks):
+        client.reset()
+        recorder.times = []
+        runtime.start()
+        start = time.perf_counter()
+        # A fresh topic source gives every task a fresh agent instance and history.
+        await runtime.publish_message(UserTaskMessage(content=f"Sum the numbers below 10 ({i})."), DefaultTopicId(source=f"task{i}"))
+        await runtime.stop_when_idle()
+        stats.add(time.perf_counter() - start, client.calls, recorder.times)
+    return stats
+
+
+async def run_swarm(team: Any, client: ScriptedChatCompletionClient, tasks: int, task: str) -> TaskStats:
+    stats = TaskStats()
+    for i in range(tasks):
+        client.reset()
+        times: List[float] = []
+        start = time.perf_counter()
+        async for _ in team.run_stream(task=f"{task} ({i})"):
+            times.append(time.perf_counter())
+        stats.add(time.perf_counter() - start, client.calls, times[:-1])
+        await team.reset()
+    return stats
+
+
+async def bench_code_agent_group(tasks: int, latency: float) -> TaskStats:
+    from code_assistant import CodeAgentGroup
+
+    client = ScriptedChatCompletionClient(
+        {
+            "Write a Python or Bash script": [[call("get_system_info")], [call("transfer_to_security_agent")]],
+            "Review the code provided by the coder_agent for security": [[call("transfer_to_executor_agent")]],
+            "Execute the code provided by the coder_agent": [
+                [call("execute_code", code=CODE, language="python"), call("transfer_to_reviewer_agent")]
+            ],
+            "Review the code written by the coder_agent": [[call("transfer_to_summarizer_agent")]],
+            "Summarize the final result": ["The sum is 45. TERMINATE"],
+        },
+        latency,
+    )
+    group = CodeAgentGroup(model_client=client)
+    return await run_swarm(group.team, client, tasks, "Print the sum of the numbers below 10.")
+
+
+async def bench_writer_tester_swarm(tasks: int, latency: float) -> TaskStats:
+    from reliable_code_writer_swarm import create_team
+
+    work_dir = os.path.abspath("swarm")
+    os.makedirs(work_dir, exist_ok=True)
+    solution = os.path.join(work_dir, "solution.py")
+    tests = os.path.join(work_dir, "test_solution.py")
+    client = ScriptedChatCompletionClient(
+        {
+            "write code based on the user's request": [
+                [call("save_code", code="def add(a, b):\n    return a + b\n", file_path=solution), call("transfer_to_code_tester_agent")]
+            ],
+            "Read the code from file": [
+                [call("read_code", file_path=solution), call("write_test_code", file_path=tests, test_code=TEST_CODE)],
+                [call("execute_test_code", file_path=tests)],
+                [call("transfer_to_user")],
+            ],
+        },
+        latency,
+    )
+    return await run_swarm(create_team(client), client, tasks, "Write an add function.")
+
+
+TEAMS: Dict[str, Callable[[int, float], Any]] = {
+    "code_agent": bench_code_agent,
+    "meta_agent": bench_meta_agent,
+    "react_agent": bench_react_agent,
+    "code_agent_group": bench_code_agent_group,
+    "writer_tester_swarm": bench_writer_tester_swarm,
+}
+
+
+async def run_team(name: str, tasks: int, latency: float, verbose: bool) -> Dict[str, Any]:
+    from executor_pool import stop_executor_pools
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        try:
+            stats = await TEAMS[name](tasks, latency)
+        finally:
+            await stop_executor_pools()
+    result = {"team": name, **stats.summary(latency)}
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["children_peak_rss_kb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return result
+
+
+def run_isolated(name: str, tasks: int, latency: float) -> Dict[str, Any]:
+    """Run one team in a child process, so peak RSS belongs to that team alone."""
+    args = [sys.executable, os.path.abspath(__file__), "--in-process", "--json",
+            "--team", name, "--tasks", str(tasks), "--latency", str(latency)]
+    proc = subprocess.run(args, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"team": name, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout)["results"][0]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    print(f"{'team':<22}{'wall s':>9}{'overhead s':>12}{'llm calls':>11}{'messages':>10}{'hop p50 ms':>12}{'hop p95 ms':>12}{'rss MB':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['team']:<22}  error: {r['error']}")
+            continue
+        print(
+            f"{r['team']:<22}{r['wall_seconds_per_task']:>9.3f}{r['orchestration_seconds_per_task']:>12.3f}"
+            f"{r['llm_calls_per_task']:>11.1f}{r['messages_per_task']:>10.1f}"
+            f"{r['hop_latency_ms']['p50']:>12.2f}{r['hop_latency_ms']['p95']:>12.2f}{r['peak_rss_kb'] / 1024:>9.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--team", action="append", choices=list(TEAMS), help="team to run (repeatable, default all)")
+    parser.add_argument("--tasks", type=int, default=3, help="tasks per team")
+    parser.add_argument("--latency", type=float, default=0.0, help="injected seconds per model call")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    parser.add_argument("--in-process", action="store_true", help="run in this process instead of one child per team")
+    parser.add_argument("--verbose", action="store_true", help="keep the agents' own output")
+    args = parser.parse_args()
+
+    teams = args.team or list(TEAMS)
+    if args.in_process:
+        # The teams write code files and executor work dirs relative to the cwd.
+        with tempfile.TemporaryDirectory(prefix="bench_agents_") as work_dir:
+            os.chdir(work_dir)
+            results = [asyncio.run(run_team(name, args.tasks, args.latency, args.verbose)) for name in teams]
+    else:
+        results = [run_isolated(name, args.tasks, args.latency) for name in teams]
+
+    if args.json:
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "tasks": args.tasks,
+            "latency": args.latency,
+            "results": results,
+        }
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Microbenchmarks for code_block_parser against the original regex extractor.
+
+Usage: python benchmarks/bench_code_block_parser.py [--repeat N] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen_core.code_executor import CodeBlock
+
+from code_block_parser import CodeBlockParser, parse_code_blocks
+
+
+def regex_extract(markdown_text: str) -> List[CodeBlock]:
+    """The extractor code_agent_core used before the incremental parser."""
+    pattern = re.compile(r"```(?:\s*([\w\+\-]+))?\n([\s\S]*?)```")
+    matches = pattern.findall(markdown_text)
+    code_blocks: List[CodeBlock] = []
+    for match in matches:
+        language = match[0].strip() if match[0] else ""
+        code_blocks.append(CodeBlock(code=match[1], language=language))
+    return code_blocks
+
+
+def regex_extract_streaming(chunks: List[str]) -> List[CodeBlock]:
+    """Rescan the accumulated text after every chunk, as a naive streaming extractor would."""
+    pattern = re.compile(r"```(?:\s*([\w\+\-]+))?\n([\s\S]*?)```")
+    text = ""
+    start = 0
+    code_blocks: List[CodeBlock] = []
+    for chunk in chunks:
+        text += chunk
+        for match in pattern.finditer(text, start):
+            code_blocks.append(CodeBlock(code=match.group(2), language=match.group(1) or ""))
+            start = match.end()
+    return code_blocks
+
+
+def parser_streaming(chunks: List[str]) -> List[CodeBlock]:
+    parser = CodeBlockParser()
+    code_blocks: List[CodeBlock] = []
+    for chunk in chunks:
+        code_blocks.extend(parser.feed(chunk))
+    return code_blocks + parser.close()
+
+
+def make_llm_output(blocks: int, lines_per_block: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for i in range(blocks):
+        parts.append(f"Step {i}: here is some explanation of what the next script does.\n" * rng.randint(1, 4))
+        language = rng.choice(["python", "bash", "py"])
+        body = "".join(f"value_{j} = compute({j}, {rng.random():.6f})  # line {j}\n" for j in range(lines_per_block))
+        parts.append(f"```{language}\n{body}```\n")
+    return "".join(parts)
+
+
+def chunked(text: str, size: int) -> List[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+CASES = {
+    "small: 2 blocks x 20 lines": (2, 20),
+    "medium: 10 blocks x 100 lines": (10, 100),
+    "large: 20 blocks x 300 lines": (20, 300),
+}
+
+
+def run(repeat: int) -> List[dict]:
+    results = []
+    for name, (blocks, lines) in CASES.items():
+        text = make_llm_output(blocks, lines)
+        chunks = chunked(text, 16)
+        assert [b.code for b in parse_code_blocks(text)] == [b.code for b in regex_extract(text)]
+        candidates = {
+            "regex (whole message)": lambda: regex_extract(text),
+            "parser (whole message)": lambda: parse_code_blocks(text),
+            "regex rescan (16-char chunks)": lambda: regex_extract_streaming(chunks),
+            "parser feed (16-char chunks)": lambda: parser_streaming(chunks),
+        }
+        for label, func in candidates.items():
+            number = max(1, 2000 // (blocks * lines // 10 + 1))
+            best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+            results.append({"case": name, "bytes": len(text), "impl": label, "seconds": best})
+    return results
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = arg_parser.parse_args()
+
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['case']:<32} {result['bytes']:>9} B  {result['impl']:<32} {result['seconds'] * 1e6:>12.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import List
+
+WORKER = "worker"
+REVIEWER = "reviewer"
+
+_URL = re.compile(r"https?://\S+")
+# A path starts with /, ./, ../ or ~/, or has a file extension; "and/or" or "TCP/IP" is not one.
+_PATH = re.compile(r"(?<![\w/.~])(?:~|\.{1,2})?/[\w.\-/]*|\b\w[\w\-]*(?:/[\w\-]+)*\.[a-z][a-z0-9]{1,4}\b")
+_EXTENSION = re.compile(r"\.([a-z][a-z0-9]{1,4})$")
+# Quotes only at word boundaries, so the apostrophes in "what's" and "it's" are not quotes.
+_QUOTED = re.compile(r"(?<!\w)\"[^\"]*\"(?!\w)|(?<!\w)'[^']*'(?!\w)")
+# Counts such as "the 5 largest"; dotted versions such as 3.11 are kept.
+_NUMBER = re.compile(r"(?<![\w.])\d+(?!\.?\w)")
+_WORD = re.compile(r"<[\w.\-]+>|[a-z]+|\d+(?:\.\d+)+")
+_STOPWORDS = frozenset(
+    "a an the of in on at to for from by with and or me my please can you i it this that these those is are be "
+    "some all any into about".split()
+)
+
+
+def _path_placeholder(match: re.Match) -> str:
+    path = match.group()
+    if "/" not in path:
+        # A bare file name, e.g. setup.py, usually names what the task is about.
+        return f" <{path}> "
+    extension = _EXTENSION.search(path.rstrip("/"))
+    return f" <path.{extension.group(1)}> " if extension else " <path> "
+
+
+def task_signature(task: str) -> str:
+    """Normalize a task so recurring task types map to the same key.
+
+    URLs, paths, quoted strings and counts become placeholders, stop words
+    are dropped and the remaining words are sorted, so "Find the 5 largest
+    files in /tmp" and "find the 10 largest files in ~/Downloads" match.
+    What decides the kind of task is kept: bare file names, the extension
+    of a path and versions such as 3.11.
+    """
+    text = task.lower()
+    text = _URL.sub(" <url> ", text)
+    text = _QUOTED.sub(" <str> ", text)
+    text = _PATH.sub(_path_placeholder, text)
+    text = _NUMBER.sub(" <num> ", text)
+    words = sorted({word for word in _WORD.findall(text) if word not in _STOPWORDS})
+    return hashlib.sha256(" ".join(words).encode()).hexdigest()
+
+
+@dataclass
+class AgentBlueprint:
+    kind: str
+    name: str
+    system_message: str
+    tools: List[str] = field(default_factory=list)
+
+
+class BlueprintStore:
+    """Agent definitions made by the MetaAgent, keyed by task signature, in SQLite.
+
+    Entries older than ``ttl`` seconds are dropped, and the least recently
+    used ones are evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, path: str = ".meta_blueprints.sqlite", max_entries: int = 500, ttl: float | None = 30 * 24 * 3600) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS blueprints (
+                signature TEXT PRIMARY KEY,
+                blueprints TEXT NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task: str) -> List[AgentBlueprint] | None:
+        signature = task_signature(task)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT blueprints, created FROM blueprints WHERE signature = ?", (signature,)).fetchone()
+            if row is not None and self._ttl is not None and now - row[1] > self._ttl:
+                self._db.execute("DELETE FROM blueprints WHERE signature = ?", (signature,))
+                row = None
+            if row is not None:
+                self._db.execute("UPDATE blueprints SET uses = uses + 1, accessed = ? WHERE signature = ?", (now, signature))
+            self._db.commit()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [AgentBlueprint(**blueprint) for blueprint in json.loads(row[0])]
+
+    def put(self, task: str, blueprints: List[AgentBlueprint]) -> None:
+        now = time.time()
+        data = json.dumps([asdict(blueprint) for blueprint in blueprints])
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blueprints (signature, blueprints, uses, created, accessed) VALUES (?, ?, 0, ?, ?)",
+                (task_signature(task), data, now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def discard(self, task: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM blueprints WHERE signature = ?", (task_signature(task),))
+            self._db.commit()
+
+    def _evict(self) -> None:
+        if self._ttl is not None:
+            self._db.execute("DELETE FROM blueprints WHERE created < ?", (time.time() - self._ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM blueprints").fetchone()
+        if count > self._max_entries:
+            self._db.execute(
+                "DELETE FROM blueprints WHERE signature IN (SELECT signature FROM blueprints ORDER BY accessed LIMIT ?)",
+                (count - self._max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM blueprints").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import Callable, Iterator, List
+
+from autogen_core.models import LLMMessage, SystemMessage, UserMessage
+
+# Kinds of entries, from the cheapest to drop to the most important.
+TOOL_OUTPUT = "tool_output"
+CODE = "code"
+MESSAGE = "message"
+TASK = "task"
+
+
+def estimate_tokens(message: LLMMessage) -> int:
+    """Rough token count (about four characters per token), no tokenizer needed."""
+    return len(str(message.content)) // 4 + 4
+
+
+def _elide(text: str, keep: int, note: str) -> str:
+    if len(text) <= keep * 2:
+        return text
+    return f"{text[:keep]}\n...[{note}]...\n{text[-keep:]}"
+
+
+@dataclass
+class _Entry:
+    message: LLMMessage
+    kind: str
+    tokens: int
+    compacted: bool = False
+
+
+class ChatHistory:
+    """The chat history of one agent, kept under a token budget.
+
+    When the budget is exceeded, older entries are compacted in three steps:
+    stale tool outputs are shortened, then all but the latest code version,
+    and finally the oldest turns are folded into a single summary message.
+    The system message and the last ``keep_last`` entries are never touched.
+    """
+
+    def __init__(
+        self,
+        system_message: SystemMessage | None = None,
+        token_budget: int = 8000,
+        keep_last: int = 4,
+        token_counter: Callable[[LLMMessage], int] = estimate_tokens,
+    ) -> None:
+        self._system_message = system_message
+        self._token_budget = token_budget
+        self._keep_last = keep_last
+        self._count = token_counter
+        self._entries: List[_Entry] = []
+
+    @property
+    def messages(self) -> List[LLMMessage]:
+        messages = [self._system_message] if self._system_message is not None else []
+        return messages + [entry.message for entry in self._entries]
+
+    @property
+    def tokens(self) -> int:
+        system_tokens = self._count(self._system_message) if self._system_message is not None else 0
+        return system_tokens + sum(entry.tokens for entry in self._entries)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def __iter__(self) -> Iterator[LLMMessage]:
+        return iter(self.messages)
+
+    def append(self, message: LLMMessage, kind: str = MESSAGE) -> None:
+        self._entries.append(_Entry(message, kind, self._count(message)))
+        if self.tokens > self._token_budget:
+            self.compact()
+
+    def clear(self) -> None:
+        """Forget the conversation but keep the system message."""
+        self._entries = []
+
+    def _replace(self, entry: _Entry, content: str) -> None:
+        entry.message = entry.message.model_copy(update={"content": content})
+        entry.tokens = self._count(entry.message)
+        entry.compacted = True
+
+    def _shorten(self, kind: str, keep: int, note: str) -> None:
+        candidates = self._entries[: -self._keep_last] if self._keep_last else self._entries
+        for entry in candidates:
+            if self.tokens <= self._token_budget:
+                return
+            if entry.kind == kind and not entry.compacted and isinstance(entry.message.content, str):
+                self._replace(entry, _elide(entry.message.content, keep, note))
+
+    def _summarize_oldest(self) -> None:
+        while self.tokens > self._token_budget and len(self._entries) > self._keep_last + 1:
+            # Fold the two oldest entries into one, so the summary stays a single message.
+            first, second = self._entries[0], self._entries[1]
+            lines = []
+            for entry in (first, second):
+                if entry.message.type == "UserMessage" and entry.message.source == "summary":
+                    lines.extend(entry.message.content.splitlines()[1:])
+                else:
+                    text = " ".join(str(entry.message.content).split())
+                    lines.append(f"- {entry.message.type}: {text[:120]}")
+            summary = UserMessage(
+                content="Summary of earlier conversation:\n" + "\n".join(lines[-8:]),
+                source="summary",
+            )
+            self._entries[0:2] = [_Entry(summary, TASK, self._count(summary), compacted=True)]
+
+    def compact(self) -> None:
+        self._shorten(TOOL_OUTPUT, keep=200, note="earlier output truncated")
+        self._shorten(CODE, keep=120, note="earlier code version omitted")
+        self._summarize_oldest()
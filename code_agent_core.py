@@ -1,31 +1,42 @@
-import re
 import os
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import tempfile
-from typing import List
+import uuid
+from typing import Any, Dict, List, Set, Tuple
 from autogen_core import (
+    AgentRuntime,
     DefaultTopicId,
     MessageContext,
-    RoutedAgent,
     SingleThreadedAgentRuntime,
     default_subscription,
     message_handler,
     ClosureAgent,
     ClosureContext,
     DefaultSubscription,
+    CancellationToken,
 )
-from autogen_core.code_executor import CodeBlock, CodeExecutor
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
 from autogen_core.models import (
     AssistantMessage,
     ChatCompletionClient,
-    LLMMessage,
     SystemMessage,
     UserMessage,
 )
-from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 
+from execution_scheduler import job_context
+from executor_pool import get_executor_pool, stop_executor_pools
+from llm_cache import cache_from_env
+from tracing import TracedAgent, trace_client, trace_from_env
+from result_cache import CachingCodeExecutor, ExecutionResultCache
+from chat_history import CODE, TASK, TOOL_OUTPUT, ChatHistory
+from output_shaping import OutputShaper
+from python_kernel import KernelCodeExecutor
+from pre_review import PreReviewer
+from code_block_parser import CodeBlockParser, parse_code_blocks
+from runtime_internals import forget_agents
+
 
 @dataclass
 class CodingMessage:
@@ -37,6 +48,18 @@ class CodingMessage:
 class CodeExecutionMessage:
     user_task: str
     code_message: str
+    # Number of blocks already sent ahead as CodeBlockMessage while streaming.
+    streamed_blocks: int = 0
+    # Number of the assistant reply, which its streamed blocks carry too.
+    seq: int = 0
+
+
+@dataclass
+class CodeBlockMessage:
+    user_task: str
+    code: str
+    language: str
+    seq: int = 0
 
 
 @dataclass
@@ -44,6 +67,7 @@ class CodeExecutionResultMessage:
     user_task: str
     code: str
     code_execution_result: str
+    exit_code: int = 0
 
 
 @dataclass
@@ -51,19 +75,95 @@ class FinalResult:
     value: str
 
 
+class SessionTracker:
+    """The sessions a CodeAgent is running and the tasks working on each of them.
+
+    Closing a session cancels its tasks, so an abandoned or timed out task
+    stops calling the model and running code.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+
+    def open(self, session: str) -> None:
+        self._tasks[session] = set()
+
+    def is_open(self, session: str) -> bool:
+        return session in self._tasks
+
+    def add_task(self, session: str, task: asyncio.Task) -> None:
+        tasks = self._tasks.get(session)
+        if tasks is None:
+            task.cancel()
+            return
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def close(self, session: str) -> None:
+        """Cancel the session's tasks and wait until they have finished."""
+        current = asyncio.current_task()
+        tasks = [task for task in self._tasks.pop(session, ()) if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def drop_session_agents(runtime: AgentRuntime, session: str) -> None:
+    """Drop the agents instantiated for a session, releasing their chat histories."""
+    # Every @default_subscription agent gets one instance per topic source,
+    # so the session's agents are the ones keyed by it.
+    forget_agents(runtime, agents=lambda agent_id: agent_id.key == session, topics=lambda topic: topic.source == session)
+
+
+class SessionAgent(TracedAgent):
+    """A TracedAgent that ends its session with a FinalResult when a handler fails.
+
+    Otherwise CodeAgent.run would wait forever, as the runtime only logs
+    handler errors. With ``sessions``, each handler is tracked under its
+    session. A message still queued when its session closed re-creates the
+    session's agents on delivery; they are dropped again and the message
+    ignored.
+    """
+
+    def __init__(self, description: str, sessions: SessionTracker | None = None) -> None:
+        super().__init__(description)
+        self._sessions = sessions
+
+    async def on_message_impl(self, message: Any, ctx: MessageContext) -> Any:
+        if self._sessions is not None:
+            if not self._sessions.is_open(self.id.key):
+                drop_session_agents(self.runtime, self.id.key)
+                return None
+            self._sessions.add_task(self.id.key, asyncio.current_task())
+        try:
+            return await super().on_message_impl(message, ctx)
+        except Exception as e:
+            await self.publish_message(FinalResult(value=f"Task failed: {type(e).__name__}: {e}"), DefaultTopicId())
+            raise
+
+
 @default_subscription
-class Assistant(RoutedAgent):
-    def __init__(self, model_client: ChatCompletionClient) -> None:
-        super().__init__("An assistant agent.")
+class Assistant(SessionAgent):
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        token_budget: int = 8000,
+        stream: bool = False,
+        sessions: SessionTracker | None = None,
+    ) -> None:
+        super().__init__("An assistant agent.", sessions)
         self._model_client = model_client
-        self._chat_history: List[LLMMessage] = [
+        self._stream = stream
+        self._seq = 0
+        self._chat_history = ChatHistory(
             SystemMessage(
                 content="""Write Python or Bash script in markdown block based on the user's task and feedback, and it will be executed.
 Always save figures to file in the current directory. 
 All code required to complete this task must be contained within a single response.
 Do not include any additional text outside of the code block.""",
-            )
-        ]
+            ),
+            token_budget=token_budget,
+        )
 
     @message_handler
     async def handle_message(self, message: CodingMessage, ctx: MessageContext) -> None:
@@ -71,67 +171,188 @@ Do not include any additional text outside of the code block.""",
             UserMessage(
                 content=f"The user's task: {message.user_task}\n The feedback:{message.feedbak}",
                 source="user",
-            )
+            ),
+            kind=TASK,
         )
-        result = await self._model_client.create(self._chat_history)
-        print(f"\n{'-'*80}\nAssistant:\n{result.content}")
-        self._chat_history.append(AssistantMessage(content=result.content, source="assistant"))  # type: ignore
-        await self.publish_message(CodeExecutionMessage(user_task=message.user_task, code_message=result.content), DefaultTopicId())  # type: ignore
+        self._seq += 1
+        if self._stream:
+            content, streamed_blocks = await self._create_streaming(message.user_task, self._seq)
+        else:
+            result = await self._model_client.create(self._chat_history.messages)
+            content, streamed_blocks = result.content, 0
+        print(f"\n{'-'*80}\nAssistant:\n{content}")
+        self._chat_history.append(AssistantMessage(content=content, source="assistant"), kind=CODE)  # type: ignore
+        await self.publish_message(CodeExecutionMessage(user_task=message.user_task, code_message=content, streamed_blocks=streamed_blocks, seq=self._seq), DefaultTopicId())  # type: ignore
+
+    async def _create_streaming(self, user_task: str, seq: int) -> Tuple[str, int]:
+        """Stream the completion, sending each code block to the executor once its closing fence arrives."""
+        parser = CodeBlockParser()
+        chunks: List[str] = []
+        streamed_blocks = 0
+        final_result = None
+
+        async def send(code_blocks: List[CodeBlock]) -> None:
+            nonlocal streamed_blocks
+            for code_block in code_blocks:
+                streamed_blocks += 1
+                await self.publish_message(
+                    CodeBlockMessage(user_task=user_task, code=code_block.code, language=code_block.language, seq=seq),
+                    DefaultTopicId(),
+                )
+
+        async for chunk in self._model_client.create_stream(self._chat_history.messages):
+            if not isinstance(chunk, str):
+                final_result = chunk
+                continue
+            chunks.append(chunk)
+            await send(parser.feed(chunk))
+        await send(parser.close())
+        text = "".join(chunks)
+        if final_result is not None and isinstance(final_result.content, str):
+            text = final_result.content
+        return text, streamed_blocks
 
 
 def extract_markdown_code_blocks(markdown_text: str) -> List[CodeBlock]:
-    pattern = re.compile(r"```(?:\s*([\w\+\-]+))?\n([\s\S]*?)```")
-    matches = pattern.findall(markdown_text)
-    code_blocks: List[CodeBlock] = []
-    for match in matches:
-        language = match[0].strip() if match[0] else ""
-        code_content = match[1]
-        code_blocks.append(CodeBlock(code=code_content, language=language))
-    return code_blocks
+    return parse_code_blocks(markdown_text)
+
+
+@dataclass
+class StreamedRun:
+    """The blocks of one streamed reply, run in order on a chain of tasks as they arrive."""
+
+    blocks: int = 0
+    task: asyncio.Task | None = None
+    result: CodeResult = field(default_factory=lambda: CodeResult(exit_code=0, output=""))
+    arrived: asyncio.Event = field(default_factory=asyncio.Event)
 
 
 @default_subscription
-class Executor(RoutedAgent):
-    def __init__(self, code_executor: CodeExecutor) -> None:
-        super().__init__("An executor agent.")
+class Executor(SessionAgent):
+    def __init__(
+        self,
+        code_executor: CodeExecutor,
+        output_shaper: OutputShaper | None = None,
+        sessions: SessionTracker | None = None,
+    ) -> None:
+        super().__init__("An executor agent.", sessions)
         self._code_executor = code_executor
+        if output_shaper is None:
+            output_shaper = OutputShaper(spill_dir=getattr(code_executor, "work_dir", None))
+        self._output_shaper = output_shaper
+        # Streamed blocks by the seq of their reply; the CodeExecutionMessage may arrive first.
+        self._streams: Dict[int, StreamedRun] = {}
+
+    @message_handler
+    async def handle_code_block(self, message: CodeBlockMessage, ctx: MessageContext) -> None:
+        code_block = CodeBlock(code=message.code, language=message.language)
+        run = self._streams.setdefault(message.seq, StreamedRun())
+        # The task copies the context, so its run is queued under this session. The
+        # agent key is the session, also when a dispatcher sent the message without a topic.
+        with job_context(session=self.id.key):
+            run.task = asyncio.create_task(self._execute_after(run, run.task, code_block, ctx.cancellation_token))
+        if self._sessions is not None:
+            self._sessions.add_task(self.id.key, run.task)
+        run.blocks += 1
+        run.arrived.set()
+
+    async def _execute(self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken) -> CodeResult:
+        try:
+            return await self._code_executor.execute_code_blocks(code_blocks, cancellation_token=cancellation_token)
+        except Exception as e:
+            # Reported like a failed run, so the reviewer still gets a result.
+            return CodeResult(exit_code=1, output=f"\nThe code could not be executed: {type(e).__name__}: {e}")
+
+    async def _execute_after(
+        self,
+        run: StreamedRun,
+        previous: asyncio.Task | None,
+        code_block: CodeBlock,
+        cancellation_token: CancellationToken,
+    ) -> None:
+        if previous is not None:
+            await previous
+        # Like execute_code_blocks, stop at the first failing block.
+        if run.result.exit_code != 0:
+            return
+        result = await self._execute([code_block], cancellation_token)
+        run.result = CodeResult(exit_code=result.exit_code, output=run.result.output + result.output)
+
+    async def _collect_streamed_result(self, seq: int, blocks: int) -> CodeResult:
+        run = self._streams.setdefault(seq, StreamedRun())
+        try:
+            while run.blocks < blocks:
+                run.arrived.clear()
+                await run.arrived.wait()
+            await run.task
+            return run.result
+        finally:
+            del self._streams[seq]
 
     @message_handler
     async def handle_message(
         self, message: CodeExecutionMessage, ctx: MessageContext
     ) -> None:
-        code_blocks = extract_markdown_code_blocks(message.code_message)
-        if code_blocks:
-            result = await self._code_executor.execute_code_blocks(
-                code_blocks, cancellation_token=ctx.cancellation_token
-            )
-            print(f"\n{'-'*80}\nExecutor:\n{result.output}")
-            await self.publish_message(
-                CodeExecutionResultMessage(
-                    user_task=message.user_task,
-                    code=message.code_message,
-                    code_execution_result=result.output,
-                ),
-                DefaultTopicId(),
-            )
+        if message.streamed_blocks:
+            result = await self._collect_streamed_result(message.seq, message.streamed_blocks)
+        else:
+            code_blocks = extract_markdown_code_blocks(message.code_message)
+            if not code_blocks:
+                # Goes to the reviewer like a failed run, so the retry limit still ends the task.
+                await self.publish_message(
+                    CodeExecutionResultMessage(
+                        user_task=message.user_task,
+                        code=message.code_message,
+                        code_execution_result="No code block found. Reply with the code in a markdown code block.",
+                        exit_code=1,
+                    ),
+                    DefaultTopicId(),
+                )
+                return
+            with job_context(session=self.id.key):
+                result = await self._execute(code_blocks, ctx.cancellation_token)
+        spill_dir = None
+        if hasattr(self._code_executor, "work_dir_for"):
+            spill_dir = self._code_executor.work_dir_for(self.id.key)
+        output = self._output_shaper.shape(result.output, spill_dir=spill_dir)
+        print(f"\n{'-'*80}\nExecutor:\n{output}")
+        await self.publish_message(
+            CodeExecutionResultMessage(
+                user_task=message.user_task,
+                code=message.code_message,
+                code_execution_result=output,
+                exit_code=result.exit_code,
+            ),
+            DefaultTopicId(),
+        )
 
 
 @default_subscription
-class CodeExecutionResultReviewer(RoutedAgent):
+class CodeExecutionResultReviewer(SessionAgent):
     _try_count = 0
     _try_count_max = 3
 
-    def __init__(self, model_client, try_count_max=3) -> None:
-        super().__init__("A code execution result reviewer agent.")
+    def __init__(
+        self,
+        model_client,
+        try_count_max=3,
+        token_budget: int = 8000,
+        pre_reviewer: PreReviewer | None = None,
+        sessions: SessionTracker | None = None,
+    ) -> None:
+        super().__init__("A code execution result reviewer agent.", sessions)
         self._model_client = model_client
         self._try_count_max = try_count_max
-        self._chat_history: List[LLMMessage] = [
+        # Obvious failures are answered by rules; only plausible results reach the model.
+        self._pre_reviewer = pre_reviewer if pre_reviewer is not None else PreReviewer()
+        self._chat_history = ChatHistory(
             SystemMessage(
                 content=""" You are a code execution result reviewer.
                 Consider the user's task and code execution result, Respond with 'APPROVE' to when the code execution result is correct and meets the user's task. Otherwise, Provide constructive feedback that can fix the code to meet the user's task.
                 """,
-            )
-        ]
+            ),
+            token_budget=token_budget,
+        )
 
     @message_handler
     async def handle_message(
@@ -141,12 +362,20 @@ class CodeExecutionResultReviewer(RoutedAgent):
             AssistantMessage(
                 content=f"The user's task: {message.user_task} \n The code:{message.code}\n The code execution result:{message.code_execution_result}",
                 source=ctx.sender.type,
-            )
+            ),
+            kind=TOOL_OUTPUT,
         )
-        result = await self._model_client.create(self._chat_history)
-        print(f"\n{'-'*80}\nReviewer:\n{result.content}")
+        feedback = self._pre_reviewer.review(
+            message.code_execution_result, exit_code=message.exit_code, code=message.code
+        )
+        if feedback is not None:
+            print(f"\n{'-'*80}\nReviewer (rules):\n{feedback}")
+        else:
+            result = await self._model_client.create(self._chat_history.messages)
+            print(f"\n{'-'*80}\nReviewer:\n{result.content}")
+            feedback = result.content
 
-        if "APPROVE" == result.content:
+        if "APPROVE" == feedback:
             await self.publish_message(
                 FinalResult(
                     value=message.code_execution_result,
@@ -166,38 +395,85 @@ class CodeExecutionResultReviewer(RoutedAgent):
                 )
             else:
                 await self.publish_message(
-                    CodingMessage(user_task=message.user_task, feedbak=result.content),
+                    CodingMessage(user_task=message.user_task, feedbak=feedback),
                     DefaultTopicId(),
                 )
 
 
+def build_code_executor(
+    workdir: str,
+    kernel: bool = False,
+    result_cache: ExecutionResultCache | None = None,
+    pool_size: int | None = None,
+) -> CodeExecutor:
+    """The executor the Executor agent runs code with, on the shared pool for workdir."""
+    code_executor = get_executor_pool(work_dir=workdir, size=pool_size)
+    if kernel:
+        # Every task keeps one interpreter; its results depend on earlier runs, so no result cache.
+        return KernelCodeExecutor(code_executor)
+    if result_cache is not None:
+        # Resent code after a review round is answered from the cache.
+        return CachingCodeExecutor(code_executor, result_cache)
+    return code_executor
+
+
 class CodeAgent:
     def __init__(
-        self, workdir: str, model_client: OpenAIChatCompletionClient, try_count_max=3
+        self,
+        workdir: str,
+        model_client: OpenAIChatCompletionClient,
+        try_count_max=3,
+        result_cache: ExecutionResultCache | None = None,
+        token_budget: int = 8000,
+        stream: bool = False,
+        pre_reviewer: PreReviewer | None = None,
+        output_shaper: OutputShaper | None = None,
+        kernel: bool = False,
     ):
         self.model_client = model_client
-        self.runtime = SingleThreadedAgentRuntime()
+        self.pre_reviewer = pre_reviewer
+        self.output_shaper = output_shaper
+        self.token_budget = token_budget
+        self.stream = stream
+        self.sessions = SessionTracker()
         self.try_count_max = try_count_max
-        self.code_executor = LocalCommandLineCodeExecutor(work_dir=workdir)
-        self.queue = asyncio.Queue[
-            FinalResult
-            | CodingMessage
-            | CodeExecutionMessage
-            | CodeExecutionResultMessage
-        ]()
+        self.workdir = workdir
+        self.result_cache = result_cache
+        self.kernel = kernel
+        self.runtime = self._create_runtime()
+        # Built on first use, since subclasses may run the executors elsewhere.
+        self._code_executor: CodeExecutor | None = None
+        # One pending future per task, keyed by the topic source of its session.
+        self._results: Dict[str, asyncio.Future[FinalResult]] = {}
+        self._started = False
+
+    def _create_runtime(self) -> AgentRuntime:
+        return SingleThreadedAgentRuntime()
+
+    @property
+    def code_executor(self) -> CodeExecutor:
+        if self._code_executor is None:
+            self._code_executor = build_code_executor(self.workdir, kernel=self.kernel, result_cache=self.result_cache)
+        return self._code_executor
 
     async def setup(self):
         await Assistant.register(
-            self.runtime, "assistant", lambda: Assistant(self.model_client)
-        )
-        await Executor.register(
-            self.runtime, "executor", lambda: Executor(self.code_executor)
+            self.runtime,
+            "assistant",
+            lambda: Assistant(
+                self.model_client, token_budget=self.token_budget, stream=self.stream, sessions=self.sessions
+            ),
         )
+        await self._register_executor()
         await CodeExecutionResultReviewer.register(
             self.runtime,
             "reviewer",
             lambda: CodeExecutionResultReviewer(
-                self.model_client, try_count_max=self.try_count_max
+                self.model_client,
+                try_count_max=self.try_count_max,
+                token_budget=self.token_budget,
+                pre_reviewer=self.pre_reviewer,
+                sessions=self.sessions,
             ),
         )
 
@@ -213,7 +489,9 @@ class CodeAgent:
         ) -> None:
             # only output the final result
             if isinstance(message, FinalResult):
-                await self.queue.put(message)
+                future = self._results.get(ctx.topic_id.source)
+                if future is not None and not future.done():
+                    future.set_result(message)
 
         await ClosureAgent.register_closure(
             self.runtime,
@@ -222,16 +500,53 @@ class CodeAgent:
             subscriptions=lambda: [DefaultSubscription()],
         )
 
-    async def run(self, task: str) -> str:
-        self.runtime.start()
-        await self.runtime.publish_message(
-            CodingMessage(user_task=task),
-            DefaultTopicId(),
+    async def _register_executor(self) -> None:
+        await Executor.register(
+            self.runtime,
+            "executor",
+            lambda: Executor(self.code_executor, self.output_shaper, sessions=self.sessions),
         )
-        await self.runtime.stop_when_idle()
-        finall_result = await self.queue.get()
+
+    async def close_session(self, task_id: str) -> None:
+        """Stop a task's handlers and drop its agents, releasing their chat histories."""
+        await self.sessions.close(task_id)
+        drop_session_agents(self.runtime, task_id)
+        if hasattr(self._code_executor, "release_session"):
+            self._code_executor.release_session(task_id)
+
+    async def run(self, task: str, task_id: str | None = None, timeout: float | None = None) -> str:
+        """Run one task in its own session; safe to call concurrently.
+
+        Raises asyncio.TimeoutError when the task takes longer than timeout
+        seconds. The session is stopped however run() ends.
+        """
+        task_id = task_id or uuid.uuid4().hex
+        if task_id in self._results:
+            raise ValueError(f"Task {task_id} is already running.")
+        if not self._started:
+            self.runtime.start()
+            self._started = True
+        future = asyncio.get_running_loop().create_future()
+        self._results[task_id] = future
+        self.sessions.open(task_id)
+        try:
+            await self.runtime.publish_message(
+                CodingMessage(user_task=task),
+                DefaultTopicId(source=task_id),
+            )
+            finall_result = await asyncio.wait_for(future, timeout)
+        finally:
+            del self._results[task_id]
+            await self.close_session(task_id)
         return finall_result.value
 
+    async def stop(self) -> None:
+        if self._started:
+            await self.runtime.stop_when_idle()
+            self._started = False
+        if self.kernel and self._code_executor is not None:
+            await self._code_executor.stop()
+
 
 async def main() -> None:
     os.environ["OPENAI_API_KEY"] = ""
@@ -249,15 +564,20 @@ async def main() -> None:
             "json_output": True,
         },
     )
-    work_dir = tempfile.mkdtemp()
-    code_agent = CodeAgent(model_client=model_client, workdir=work_dir)
-    await code_agent.setup()
-    while True:
-        task = input("Enter a task: ")
-        if task.lower() in ["exit", "quit"]:
-            break
-        result = await code_agent.run(task=task)
-        print(result)
+    trace_from_env()
+    model_client = trace_client(cache_from_env(model_client))
+    # Removed on exit; every task gets its own workspace inside it.
+    with tempfile.TemporaryDirectory() as work_dir:
+        code_agent = CodeAgent(model_client=model_client, workdir=work_dir)
+        await code_agent.setup()
+        while True:
+            task = input("Enter a task: ")
+            if task.lower() in ["exit", "quit"]:
+                break
+            result = await code_agent.run(task=task)
+            print(result)
+        await code_agent.stop()
+        await stop_executor_pools()
 
 
 if __name__ == "__main__":
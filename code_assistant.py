@@ -1,17 +1,10 @@
-from asyncio import subprocess
 from typing import AsyncGenerator, List, Sequence
 import os
-import subprocess
-import psutil
 import asyncio
-import platform
-import socket
 
-from autogen_agentchat.agents import CodeExecutorAgent, AssistantAgent, UserProxyAgent
+from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
 from autogen_agentchat.base import Response
-from autogen_agentchat.messages import AgentMessage, ChatMessage, TextMessage
-from autogen_core import CancellationToken
-from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
+from autogen_agentchat.messages import AgentMessage, ChatMessage
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from typing_extensions import Annotated
 from autogen_core.tools import FunctionTool
@@ -23,6 +16,11 @@ from autogen_agentchat.conditions import (
 )
 from autogen_agentchat.ui import Console
 
+from execute_code_tool import execute_code
+from llm_cache import cache_from_env
+from tracing import trace_client, trace_from_env
+from system_profile import get_system_profile
+
 
 class CodeAgentGroup:
     def __init__(self, model_client: OpenAIChatCompletionClient):
@@ -43,61 +41,11 @@ class CodeAgentGroup:
 
         self.user = UserProxyAgent(name="user", input_func=user_input)
 
-        def get_system_info():
-
-            # OS information
-            system = platform.system()
-            node = platform.node()
-            release = platform.release()
-            version = platform.version()
-            machine = platform.machine()
-            processor = platform.processor()
-            # Hardware information
-            cpu_count = psutil.cpu_count()
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage("/")
-            # Python information
-            python_version = platform.python_version()
-            # bash information
-            bash_version = (
-                subprocess.check_output(["bash", "--version"])
-                .decode("utf-8")
-                .split("\n")[0]
-            )
-            # Network information
-            ip_address = socket.gethostbyname(socket.gethostname())
-            # File system information
-            #file_system = psutil.disk_partitions()
-            # Environment information
-            #environment = os.environ
-
-            #environment = "\n".join([f"{k}: {v}" for k, v in environment.items()])
-            # Package information
-            #package = subprocess.check_output(["pip", "list"]).decode("utf-8")
-            
-            file_system = "Unknown"
-            environment = "Unknown"
-            package = "Unknown"
+        # Probed in the background now; tool calls read the cached profile.
+        system_profile = get_system_profile()
 
-            info = f"""System Information:
-            
-System: {system}
-Node: {node}
-Release: {release}
-Version: {version}
-Machine: {machine}
-Processor: {processor}
-CPU Count: {cpu_count}
-Memory: {memory}
-Disk: {disk}
-Python Version: {python_version}
-Bash Version: {bash_version}
-IP Address: {ip_address}
-File System: {file_system}
-Environment: {environment}
-Package: {package}"""
-
-            return info
+        def get_system_info():
+            return system_profile.render()
 
         system_info_tool = FunctionTool(
             name="get_system_info",
@@ -200,20 +148,7 @@ Package: {package}"""
         code: Annotated[str, "Code to execute"],
         language: Annotated[str, "Language of the code"] = "python",
     ):
-        code_executor = LocalCommandLineCodeExecutor(work_dir="coding")
-        code_executor_agent = CodeExecutorAgent(
-            "code_executor", code_executor=code_executor
-        )
-
-        code = f"```{language}\n{code}```"
-
-        # Run the agent with a given code snippet.
-        task = TextMessage(
-            content=code,
-            source="user",
-        )
-        response = await code_executor_agent.on_messages([task], CancellationToken())
-        return response.chat_message.content
+        return await execute_code(code, language)
 
     async def run_task(self, task: str):
         return self.team.run_stream(task=task)
@@ -249,5 +184,7 @@ if __name__ == "__main__":
             "json_output": True,
         },
     )
+    trace_from_env()
+    model_client = trace_client(cache_from_env(model_client))
     agent_group = CodeAgentGroup(model_client=model_client)
     asyncio.run(main())
@@ -0,0 +1,122 @@
+import re
+from typing import Dict, List, Tuple
+
+from autogen_core.code_executor import CodeBlock
+
+LANGUAGE_ALIASES: Dict[str, str] = {
+    "py": "python",
+    "py3": "python",
+    "python3": "python",
+    "ipython": "python",
+    "shell": "sh",
+    "console": "sh",
+    "zsh": "bash",
+}
+
+# A fence line: up to three spaces of indentation, three or more backticks or
+# tildes, then an optional info string.
+FENCE_LINE = re.compile(r"^ {0,3}(`{3,}|~{3,})([^\n]*?)\r?$", re.MULTILINE)
+# A closing fence at the end of a code line, e.g. "print(1)```", as models often write it.
+TRAILING_FENCE = re.compile(r"^[^\n]*?[^`~\s](`{3,}|~{3,})[ \t]*\r?$", re.MULTILINE)
+
+
+def normalize_language(info: str, aliases: Dict[str, str] = LANGUAGE_ALIASES) -> str:
+    words = info.strip().split()
+    language = words[0].lower().lstrip("{.").rstrip("}") if words else ""
+    return aliases.get(language, language)
+
+
+class CodeBlockParser:
+    """Incremental markdown code block parser.
+
+    Feed text chunks as they arrive; every call returns the blocks whose
+    closing fence was completed by that chunk. Each character is scanned
+    once, consumed text is dropped, and a block opened with a longer fence
+    (e.g. four backticks) may contain shorter fences as plain code. A block
+    that is still open when the next block opens, or at close(), ends at
+    the first code line that ends with its closing fence, if any.
+    """
+
+    def __init__(self, aliases: Dict[str, str] = LANGUAGE_ALIASES, include_unterminated: bool = False) -> None:
+        self._aliases = aliases
+        self._include_unterminated = include_unterminated
+        self._buffer = ""
+        self._pos = 0
+        # (fence character, fence length, language) of the block being read.
+        self._open: Tuple[str, int, str] | None = None
+        self._block_start = 0
+
+    @property
+    def in_block(self) -> bool:
+        return self._open is not None
+
+    def feed(self, chunk: str) -> List[CodeBlock]:
+        self._buffer += chunk
+        buffer = self._buffer
+        code_blocks: List[CodeBlock] = []
+        while True:
+            match = FENCE_LINE.search(buffer, self._pos)
+            if match is None or match.end() == len(buffer):
+                # Only complete lines are final; rescan the trailing partial line next time.
+                self._pos = max(self._pos, buffer.rfind("\n") + 1)
+                break
+            fence, info = match.group(1), match.group(2)
+            if self._open is not None and info.strip() and (trailing := self._trailing_fence(match.start())):
+                # A block opens inside the open one, so that one ended on a code line, e.g. "print(1)```".
+                code = buffer[self._block_start : trailing.start(1)] + "\n"
+                code_blocks.append(CodeBlock(code=code, language=self._open[2]))
+                self._open = None
+            if self._open is None:
+                if fence[0] == "`" and "`" in info:
+                    # Not a fence, e.g. an inline ```code``` span.
+                    self._pos = match.end() + 1
+                    continue
+                self._open = (fence[0], len(fence), normalize_language(info, self._aliases))
+                self._block_start = match.end() + 1
+            elif fence[0] == self._open[0] and len(fence) >= self._open[1] and not info.strip():
+                code = buffer[self._block_start : match.start()]
+                code_blocks.append(CodeBlock(code=code, language=self._open[2]))
+                self._open = None
+            self._pos = match.end() + 1
+
+        if self._open is None:
+            self._buffer = buffer[self._pos :]
+            self._pos = 0
+        elif self._block_start > 0:
+            self._buffer = buffer[self._block_start :]
+            self._pos -= self._block_start
+            self._block_start = 0
+        return code_blocks
+
+    def _trailing_fence(self, end: int | None = None) -> re.Match | None:
+        end = len(self._buffer) if end is None else end
+        for match in TRAILING_FENCE.finditer(self._buffer, self._block_start, end):
+            fence = match.group(1)
+            if fence[0] == self._open[0] and len(fence) >= self._open[1]:
+                return match
+        return None
+
+    def close(self) -> List[CodeBlock]:
+        """Flush the trailing line; an unterminated block is returned only if include_unterminated."""
+        code_blocks = self.feed("\n") if self._buffer and not self._buffer.endswith("\n") else []
+        while self._open is not None and (match := self._trailing_fence()) is not None:
+            code = self._buffer[self._block_start : match.start(1)] + "\n"
+            code_blocks.append(CodeBlock(code=code, language=self._open[2]))
+            rest = self._buffer[match.end() + 1 :]
+            self._buffer = ""
+            self._pos = 0
+            self._open = None
+            self._block_start = 0
+            code_blocks += self.feed(rest)
+        if self._open is not None and self._include_unterminated:
+            code_blocks.append(CodeBlock(code=self._buffer[self._block_start :], language=self._open[2]))
+        self._buffer = ""
+        self._pos = 0
+        self._open = None
+        self._block_start = 0
+        return code_blocks
+
+
+def parse_code_blocks(markdown_text: str, include_unterminated: bool = False) -> List[CodeBlock]:
+    parser = CodeBlockParser(include_unterminated=include_unterminated)
+    return parser.feed(markdown_text) + parser.close()
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from autogen_core import (
+    AgentId,
+    AgentRuntime,
+    MessageContext,
+    default_subscription,
+    message_handler,
+    try_get_known_serializers_for_type,
+)
+
+try:
+    import grpc
+    from autogen_ext.runtimes.grpc import GrpcWorkerAgentRuntime, GrpcWorkerAgentRuntimeHost
+except ImportError as e:
+    raise ImportError(
+        "distributed_code_agent needs autogen's gRPC runtime; install it with: pip install 'autogen-ext[grpc]'"
+    ) from e
+
+from code_agent_core import (
+    CodeAgent,
+    CodeBlockMessage,
+    CodeExecutionMessage,
+    CodeExecutionResultMessage,
+    CodingMessage,
+    FinalResult,
+)
+from output_shaping import OutputShaper
+from result_cache import ExecutionResultCache
+from tracing import TracedAgent
+
+EXECUTOR_WORKER_SCRIPT = str(Path(__file__).with_name("executor_worker.py"))
+CODE_AGENT_MESSAGES = [
+    CodingMessage,
+    CodeExecutionMessage,
+    CodeBlockMessage,
+    CodeExecutionResultMessage,
+    FinalResult,
+]
+
+
+def worker_options(
+    kernel: bool = False,
+    result_cache: ExecutionResultCache | None = None,
+    output_shaper: OutputShaper | None = None,
+) -> Dict:
+    """The executor settings of a CodeAgent, as executor_worker.py reads them from its command line."""
+    options: Dict = {"kernel": kernel}
+    if result_cache is not None:
+        options["result_cache"] = {"max_entries": result_cache.max_entries, "max_bytes": result_cache.max_bytes}
+    if output_shaper is not None:
+        options["output_shaper"] = {
+            "token_budget": output_shaper.token_budget,
+            "spill_dir": str(output_shaper.spill_dir) if output_shaper.spill_dir is not None else None,
+            "head_fraction": output_shaper.head_fraction,
+        }
+    return options
+
+
+def add_code_agent_serializers(runtime: GrpcWorkerAgentRuntime) -> None:
+    for message_type in CODE_AGENT_MESSAGES:
+        runtime.add_message_serializer(try_get_known_serializers_for_type(message_type))
+
+
+def release_executor(load: Dict[str, int], sessions: Dict[str, str], session: str) -> None:
+    executor_type = sessions.pop(session, None)
+    if executor_type is not None:
+        load[executor_type] -= 1
+
+
+@default_subscription
+class ExecutorDispatcher(TracedAgent):
+    """Forwards code execution messages to the remote Executor types.
+
+    A session sticks to one executor from its first streamed block until its
+    CodeExecutionMessage is done, since the Executor keeps the streamed
+    blocks' results; with ``sticky`` it stays until the session is released,
+    e.g. to keep using its kernel. New sessions go to the executor with the
+    fewest running sessions.
+    """
+
+    def __init__(
+        self, executor_types: List[str], load: Dict[str, int], sessions: Dict[str, str], sticky: bool = False
+    ) -> None:
+        super().__init__("Dispatches code execution to executor processes.")
+        self._executor_types = executor_types
+        # Shared by every dispatcher instance (one per session).
+        self._load = load
+        self._sessions = sessions
+        self._sticky = sticky
+
+    def _executor_for(self, session: str) -> str:
+        if session not in self._sessions:
+            executor_type = min(self._executor_types, key=lambda executor_type: self._load[executor_type])
+            self._sessions[session] = executor_type
+            self._load[executor_type] += 1
+        return self._sessions[session]
+
+    def _release(self, session: str) -> None:
+        release_executor(self._load, self._sessions, session)
+
+    @message_handler
+    async def handle_code_block(self, message: CodeBlockMessage, ctx: MessageContext) -> None:
+        session = ctx.topic_id.source
+        await self.send_message(message, AgentId(self._executor_for(session), session))
+
+    @message_handler
+    async def handle_code_execution(self, message: CodeExecutionMessage, ctx: MessageContext) -> None:
+        session = ctx.topic_id.source
+        try:
+            await self.send_message(message, AgentId(self._executor_for(session), session))
+        finally:
+            if not self._sticky:
+                self._release(session)
+
+
+class DistributedCodeAgent(CodeAgent):
+    """A CodeAgent whose Executors run in separate worker processes.
+
+    The agent starts a host runtime on ``host_address`` and connects to it
+    itself with the assistant and the reviewer. Each of the ``executor_workers``
+    processes registers its own Executor type, so execution capacity scales
+    with cores while orchestration stays in this process. ``kernel``,
+    ``result_cache`` and ``output_shaper`` apply to the workers' Executors;
+    each worker keeps its own cache with the bounds of ``result_cache``, so
+    the hit counts of that object stay at zero. With ``kernel`` a session
+    keeps its executor, and so its kernel, until it ends.
+    """
+
+    def __init__(
+        self,
+        workdir: str,
+        model_client,
+        executor_workers: int = os.cpu_count() or 1,
+        host_address: str = "localhost:50051",
+        pool_size: int = 1,
+        **kwargs,
+    ) -> None:
+        self.host_address = host_address
+        self.pool_size = pool_size
+        self.executor_types = [f"executor_{i}" for i in range(executor_workers)]
+        self.host = GrpcWorkerAgentRuntimeHost(address=host_address)
+        super().__init__(workdir=workdir, model_client=model_client, **kwargs)
+        self._workers: List[asyncio.subprocess.Process] = []
+        self._executor_load = {executor_type: 0 for executor_type in self.executor_types}
+        self._executor_sessions: Dict[str, str] = {}
+
+    def _create_runtime(self) -> AgentRuntime:
+        runtime = GrpcWorkerAgentRuntime(host_address=self.host_address)
+        add_code_agent_serializers(runtime)
+        return runtime
+
+    async def _start_worker(self, executor_type: str) -> asyncio.subprocess.Process:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-u",
+            EXECUTOR_WORKER_SCRIPT,
+            self.host_address,
+            executor_type,
+            self.workdir,
+            str(self.pool_size),
+            json.dumps(worker_options(self.kernel, self.result_cache, self.output_shaper)),
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        line = await proc.stdout.readline()
+        if not line or json.loads(line).get("ready") != executor_type:
+            raise RuntimeError(f"Executor worker {executor_type} failed to start.")
+        return proc
+
+    async def _wait_for_host(self, timeout: float = 10.0) -> None:
+        """Wait until the host accepts connections; host.start() only schedules its server."""
+        async with grpc.aio.insecure_channel(self.host_address) as channel:
+            try:
+                await asyncio.wait_for(channel.channel_ready(), timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"The host runtime did not start listening on {self.host_address}.") from None
+
+    async def setup(self):
+        self.host.start()
+        await self._wait_for_host()
+        self.runtime.start()
+        self._started = True
+        self._workers = list(
+            await asyncio.gather(*[self._start_worker(executor_type) for executor_type in self.executor_types])
+        )
+        await super().setup()
+
+    async def _register_executor(self) -> None:
+        await ExecutorDispatcher.register(
+            self.runtime,
+            "executor",
+            lambda: ExecutorDispatcher(
+                self.executor_types, self._executor_load, self._executor_sessions, sticky=self.kernel
+            ),
+        )
+
+    async def close_session(self, task_id: str) -> None:
+        await super().close_session(task_id)
+        release_executor(self._executor_load, self._executor_sessions, task_id)
+
+    async def stop(self) -> None:
+        if self._started:
+            await self.runtime.stop()
+            self._started = False
+        for proc in self._workers:
+            if proc.returncode is None:
+                proc.send_signal(signal.SIGTERM)
+        await asyncio.gather(*[proc.wait() for proc in self._workers])
+        self._workers = []
+        await self.host.stop()
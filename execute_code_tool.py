@@ -1,25 +1,81 @@
 from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeResult
 from typing_extensions import Annotated
-from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
-from autogen_agentchat.agents import CodeExecutorAgent
-from autogen_agentchat.messages import TextMessage
+
+from execution_scheduler import current_session
+from executor_pool import get_executor_pool
+from output_shaping import OutputShaper
+from python_kernel import get_kernel_executor
+from result_cache import CachingCodeExecutor, ExecutionResultCache
+
+WORK_DIR = "coding"
+
+_result_cache: ExecutionResultCache | None = None
+_kernel_mode = False
+# Large outputs are cut to head and tail; the full output is spilled next to the code files.
+output_shaper = OutputShaper(spill_dir=WORK_DIR)
+
+
+def set_work_dir(work_dir: str) -> None:
+    """Run execute_code under work_dir instead of "coding"."""
+    global WORK_DIR
+    WORK_DIR = work_dir
+
+
+def enable_result_cache(cache: ExecutionResultCache | None = None) -> ExecutionResultCache:
+    """Serve repeated execute_code calls from a result cache (off by default)."""
+    global _result_cache
+    _result_cache = cache or ExecutionResultCache()
+    return _result_cache
+
+
+def disable_result_cache() -> None:
+    global _result_cache
+    _result_cache = None
+
+
+def enable_kernel_mode() -> None:
+    """Run Python code in a persistent kernel per session, keeping its state between calls.
+
+    Results depend on earlier runs then, so the result cache is not used.
+    """
+    global _kernel_mode
+    _kernel_mode = True
+
+
+def disable_kernel_mode() -> None:
+    global _kernel_mode
+    _kernel_mode = False
+
+
+def format_code_result(result: CodeResult) -> str:
+    # Same wording as autogen_agentchat's CodeExecutorAgent.
+    if result.output.strip() == "":
+        return f"The script ran but produced no output to console. The POSIX exit code was: {result.exit_code}. If you were expecting output, consider revising the script to ensure content is printed to stdout."
+    if result.exit_code != 0:
+        return f"The script ran, then exited with an error (POSIX exit code: {result.exit_code})\nIts output was:\n{result.output}"
+    return result.output
 
 
 async def execute_code(
     code: Annotated[str, "Code to execute"],
     language: Annotated[str, "Language of the code"] = "python",
 ):
-    code_executor = LocalCommandLineCodeExecutor(work_dir="coding")
-    code_executor_agent = CodeExecutorAgent(
-        "code_executor", code_executor=code_executor
+    # Borrow a warm worker from the shared pool instead of spawning a new executor.
+    pool = get_executor_pool(work_dir=WORK_DIR)
+    code_executor = pool
+    if _kernel_mode:
+        code_executor = get_kernel_executor(work_dir=WORK_DIR)
+    elif _result_cache is not None:
+        code_executor = CachingCodeExecutor(code_executor, _result_cache)
+    result = await code_executor.execute_code_blocks(
+        [CodeBlock(code=code, language=language)], CancellationToken()
     )
+    return output_shaper.shape(format_code_result(result), spill_dir=pool.work_dir_for(current_session()))
 
-    code = f"```{language}\n{code}```"
 
-    # Run the agent with a given code snippet.
-    task = TextMessage(
-        content=code,
-        source="user",
-    )
-    response = await code_executor_agent.on_messages([task], CancellationToken())
-    return response.chat_message.content
+def release_workspace(session: str) -> None:
+    """Stop the session's kernel, if any, and let its workspace be garbage collected."""
+    # Regardless of kernel mode, which may have changed since the session ran;
+    # this also releases the workspace in the shared pool.
+    get_kernel_executor(work_dir=WORK_DIR).release_session(session)
@@ -1,24 +1,250 @@
-
+import asyncio
 import json
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Mapping, Sequence
 from autogen_core import CancellationToken, FunctionCall
 from autogen_core.models import (
     FunctionExecutionResult,
 )
+from autogen_core.tools import Tool
 
-async def execute_tool_call(tools,
-        tool_call: FunctionCall, cancellation_token: CancellationToken
-    ) -> FunctionExecutionResult:
+from tracing import TOOL, tracer
+
+Validator = Callable[[Any, str], str | None]
+
+_JSON_TYPES: Dict[str, Callable[[Any], bool]] = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+
+def compile_validator(schema: Mapping[str, Any]) -> Validator:
+    """Turn a JSON schema (the subset tool schemas use) into a checking function.
+
+    The returned function takes a value and its path and returns an error
+    message, or None when the value is valid.
+    """
+    checks: List[Validator] = []
+
+    if "anyOf" in schema or "oneOf" in schema:
+        options = [compile_validator(option) for option in schema.get("anyOf", schema.get("oneOf"))]
+
+        def check_any(value, path):
+            errors = [option(value, path) for option in options]
+            if all(errors):
+                return errors[0]
+            return None
+
+        checks.append(check_any)
+
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        type_checks = [_JSON_TYPES[t] for t in types if t in _JSON_TYPES]
+
+        def check_type(value, path):
+            if type_checks and not any(is_type(value) for is_type in type_checks):
+                return f"{path} must be of type {' or '.join(types)}, got {type(value).__name__}"
+            return None
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, path):
+            return None if value in allowed else f"{path} must be one of {allowed}"
+
+        checks.append(check_enum)
+
+    if "items" in schema:
+        check_item = compile_validator(schema["items"])
+
+        def check_items(value, path):
+            if isinstance(value, list):
+                for i, item in enumerate(value):
+                    error = check_item(item, f"{path}[{i}]")
+                    if error:
+                        return error
+            return None
+
+        checks.append(check_items)
+
+    if "properties" in schema or "required" in schema:
+        properties = {name: compile_validator(sub) for name, sub in schema.get("properties", {}).items()}
+        required = list(schema.get("required", []))
+        closed = schema.get("additionalProperties") is False
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return None
+            missing = [name for name in required if name not in value]
+            if missing:
+                return f"{path} is missing required argument(s): {', '.join(missing)}"
+            if closed:
+                unknown = [name for name in value if name not in properties]
+                if unknown:
+                    return f"{path} has unknown argument(s): {', '.join(unknown)}"
+            for name, check in properties.items():
+                if name in value:
+                    error = check(value[name], f"{path}.{name}" if path else name)
+                    if error:
+                        return error
+            return None
+
+        checks.append(check_object)
+
+    def validate(value, path=""):
+        for check in checks:
+            error = check(value, path or "arguments")
+            if error:
+                return error
+        return None
+
+    return validate
+
+
+class ToolRegistry:
+    """Tools indexed by name, with argument validators compiled from their schemas.
+
+    Malformed calls are answered with an error result before the tool runs.
+    dispatch() executes a batch of calls concurrently, limited globally and
+    per tool, with a timeout per tool.
+    """
+
+    def __init__(
+        self,
+        tools: Sequence[Tool] | None = None,
+        max_concurrency: int = 8,
+        default_timeout: float | None = None,
+        timeouts: Mapping[str, float] | None = None,
+        concurrency_limits: Mapping[str, int] | None = None,
+    ) -> None:
+        self._tools: Dict[str, Tool] = {}
+        self._validators: Dict[str, Validator] = {}
+        self._max_concurrency = max_concurrency
+        self._default_timeout = default_timeout
+        self._timeouts = dict(timeouts or {})
+        self._concurrency_limits = dict(concurrency_limits or {})
+        self._semaphore: asyncio.Semaphore | None = None
+        self._tool_semaphores: Dict[str, asyncio.Semaphore] = {}
+        for tool in tools or []:
+            self.register(tool)
+
+    def register(self, tool: Tool, timeout: float | None = None, max_concurrency: int | None = None) -> None:
+        self._tools[tool.name] = tool
+        self._validators[tool.name] = compile_validator(tool.schema.get("parameters", {}))
+        if timeout is not None:
+            self._timeouts[tool.name] = timeout
+        if max_concurrency is not None:
+            self._concurrency_limits[tool.name] = max_concurrency
+        self._tool_semaphores.pop(tool.name, None)
+
+    @property
+    def tools(self) -> List[Tool]:
+        return list(self._tools.values())
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def get(self, name: str) -> Tool | None:
+        return self._tools.get(name)
+
+    def validate(self, tool_call: FunctionCall) -> Dict[str, Any]:
+        """Parse and check the arguments of a call, raising ValueError when malformed."""
+        if not self._tools:
+            raise ValueError("No tools are available.")
+        if tool_call.name not in self._tools:
+            raise ValueError(f"The tool '{tool_call.name}' is not available.")
+        try:
+            arguments = json.loads(tool_call.arguments) if tool_call.arguments else {}
+        except json.JSONDecodeError as e:
+            raise ValueError(f"The arguments of '{tool_call.name}' are not valid JSON: {e}") from e
+        if not isinstance(arguments, dict):
+            raise ValueError(f"The arguments of '{tool_call.name}' must be a JSON object.")
+        error = self._validators[tool_call.name](arguments, "")
+        if error:
+            raise ValueError(f"Invalid arguments for '{tool_call.name}': {error}")
+        return arguments
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphore
+
+    def _get_tool_semaphore(self, name: str) -> asyncio.Semaphore | None:
+        if name not in self._concurrency_limits:
+            return None
+        if name not in self._tool_semaphores:
+            self._tool_semaphores[name] = asyncio.Semaphore(self._concurrency_limits[name])
+        return self._tool_semaphores[name]
+
+    async def execute(self, tool_call: FunctionCall, cancellation_token: CancellationToken) -> FunctionExecutionResult:
         """Execute a tool call and return the result."""
-        #print(f"Executing tool call: {tool_call.name}")
+        with tracer.span(tool_call.name, TOOL, call_id=tool_call.id) as span:
+            result = await self._execute(tool_call, cancellation_token)
+            if span is not None and result.content.startswith("Error:"):
+                span.attrs["error"] = result.content[:200]
+        return result
+
+    async def _execute(self, tool_call: FunctionCall, cancellation_token: CancellationToken) -> FunctionExecutionResult:
+        timeout = self._timeouts.get(tool_call.name, self._default_timeout)
         try:
-            if not tools:
-                raise ValueError("No tools are available.")
-            tool = next((t for t in tools if t.name == tool_call.name), None)
-            if tool is None:
-                raise ValueError(f"The tool '{tool_call.name}' is not available.")
-            arguments = json.loads(tool_call.arguments)
-            result = await tool.run_json(arguments, cancellation_token)
+            arguments = self.validate(tool_call)
+            tool = self._tools[tool_call.name]
+            tool_semaphore = self._get_tool_semaphore(tool_call.name)
+            async with self._get_semaphore():
+                if tool_semaphore is not None:
+                    async with tool_semaphore:
+                        result = await asyncio.wait_for(tool.run_json(arguments, cancellation_token), timeout)
+                else:
+                    result = await asyncio.wait_for(tool.run_json(arguments, cancellation_token), timeout)
             result_as_str = tool.return_value_as_string(result)
             return FunctionExecutionResult(content=result_as_str, call_id=tool_call.id)
+        except asyncio.TimeoutError:
+            return FunctionExecutionResult(
+                content=f"Error: The tool '{tool_call.name}' timed out after {timeout} seconds.", call_id=tool_call.id
+            )
         except Exception as e:
             return FunctionExecutionResult(content=f"Error: {e}", call_id=tool_call.id)
+
+    async def dispatch(
+        self, tool_calls: Sequence[FunctionCall], cancellation_token: CancellationToken
+    ) -> List[FunctionExecutionResult]:
+        """Execute a batch of tool calls concurrently; results keep the order of the calls."""
+        return list(await asyncio.gather(*[self.execute(call, cancellation_token) for call in tool_calls]))
+
+
+# Registries built by execute_tool_call(), by the tools they hold, so validators are compiled once per tool list.
+_registries: OrderedDict[tuple[Tool, ...], ToolRegistry] = OrderedDict()
+_MAX_REGISTRIES = 32
+
+
+def _registry_for(tools: Sequence[Tool]) -> ToolRegistry:
+    key = tuple(tools)
+    registry = _registries.get(key)
+    if registry is None:
+        registry = _registries[key] = ToolRegistry(tools)
+        if len(_registries) > _MAX_REGISTRIES:
+            _registries.popitem(last=False)
+    _registries.move_to_end(key)
+    return registry
+
+
+async def execute_tool_call(tools,
+        tool_call: FunctionCall, cancellation_token: CancellationToken
+    ) -> FunctionExecutionResult:
+        """Execute a tool call and return the result.
+
+        Kept for older callers; build a ToolRegistry once and use its
+        execute() or dispatch() instead.
+        """
+        registry = tools if isinstance(tools, ToolRegistry) else _registry_for(tools)
+        return await registry.execute(tool_call, cancellation_token)
@@ -0,0 +1,250 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, DefaultDict, Dict, Iterator, Optional
+
+# Priorities, lower runs first.
+TEST = 0
+EXPLORATORY = 1
+
+DEFAULT_SESSION = "default"
+
+_session: contextvars.ContextVar[str] = contextvars.ContextVar("execution_session", default=DEFAULT_SESSION)
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("execution_priority", default=EXPLORATORY)
+
+
+def current_session() -> str:
+    return _session.get()
+
+
+@contextmanager
+def job_context(session: Optional[str] = None, priority: Optional[int] = None) -> Iterator[None]:
+    """Set the session and priority of the executions started inside the block."""
+    tokens = []
+    if session is not None:
+        tokens.append((_session, _session.set(session)))
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+@dataclass
+class Limits:
+    """rlimits applied to the process of one job; None leaves a limit unset."""
+
+    memory_mb: Optional[int] = None
+    cpu_seconds: Optional[int] = None
+    file_size_mb: Optional[int] = None
+    open_files: Optional[int] = None
+
+    def to_rlimits(self) -> Dict[str, int]:
+        rlimits = {}
+        if self.memory_mb is not None:
+            rlimits["RLIMIT_AS"] = self.memory_mb * 1024 * 1024
+        if self.cpu_seconds is not None:
+            rlimits["RLIMIT_CPU"] = self.cpu_seconds
+        if self.file_size_mb is not None:
+            rlimits["RLIMIT_FSIZE"] = self.file_size_mb * 1024 * 1024
+        if self.open_files is not None:
+            rlimits["RLIMIT_NOFILE"] = self.open_files
+        return rlimits
+
+
+def _physical_memory_mb() -> int:
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError):
+        return 4096
+
+
+@dataclass
+class Job:
+    session: str
+    priority: int
+    cpu: int
+    memory_mb: int
+    limits: Limits
+    seq: int
+    queued_at: float = field(default_factory=time.perf_counter)
+    started_at: float = 0.0
+
+    @property
+    def rlimits(self) -> Dict[str, int]:
+        return self.limits.to_rlimits()
+
+
+@dataclass
+class SchedulerStats:
+    queued: int
+    queued_by_priority: Dict[int, int]
+    running: int
+    cpu_in_use: int
+    memory_in_use_mb: int
+    admitted: int
+    max_queued: int
+    mean_wait_seconds: float
+    max_wait_seconds: float
+
+
+class ExecutionScheduler:
+    """Admission control for every code execution and test run.
+
+    A job waits until its CPU and memory slots are free. Waiting jobs are
+    admitted by priority, then by fair share: the session with the fewest
+    running jobs goes first, so one chatty session cannot starve the others.
+    The next job in that order blocks the ones behind it, so a large job is
+    not overtaken forever by small ones.
+    """
+
+    def __init__(
+        self,
+        cpu_slots: int | None = None,
+        memory_mb: int | None = None,
+        default_job_memory_mb: int = 512,
+        default_limits: Limits | None = None,
+    ) -> None:
+        self.cpu_slots = max(1, cpu_slots or os.cpu_count() or 1)
+        # Leave room for the agents themselves.
+        self.memory_mb = memory_mb or int(_physical_memory_mb() * 0.8)
+        self.default_job_memory_mb = default_job_memory_mb
+        self.default_limits = default_limits or Limits()
+        self._seq = itertools.count()
+        self._waiting: Dict[int, tuple[Job, asyncio.Future]] = {}
+        self._running: Dict[int, Job] = {}
+        self._running_by_session: DefaultDict[str, int] = defaultdict(int)
+        self._cpu_in_use = 0
+        self._memory_in_use = 0
+        self.admitted = 0
+        self.max_queued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def set_cpu_slots(self, cpu_slots: int) -> None:
+        """Change the number of CPU slots; waiting jobs that now fit are admitted right away."""
+        self.cpu_slots = max(1, cpu_slots)
+        self._dispatch()
+
+    def _fits(self, job: Job) -> bool:
+        if not self._running:
+            # An oversized job still runs, alone.
+            return True
+        return self._cpu_in_use + job.cpu <= self.cpu_slots and self._memory_in_use + job.memory_mb <= self.memory_mb
+
+    def _next(self) -> Optional[Job]:
+        if not self._waiting:
+            return None
+        return min(
+            (job for job, _ in self._waiting.values()),
+            key=lambda job: (job.priority, self._running_by_session[job.session], job.seq),
+        )
+
+    def _dispatch(self) -> None:
+        while True:
+            job = self._next()
+            if job is None or not self._fits(job):
+                return
+            _, future = self._waiting.pop(job.seq)
+            if future.done():
+                # Cancelled while waiting; its task has not resumed yet.
+                continue
+            self._start(job)
+            future.set_result(None)
+
+    def _start(self, job: Job) -> None:
+        job.started_at = time.perf_counter()
+        self._running[job.seq] = job
+        self._running_by_session[job.session] += 1
+        self._cpu_in_use += job.cpu
+        self._memory_in_use += job.memory_mb
+        wait = job.started_at - job.queued_at
+        self.admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+    def _finish(self, job: Job) -> None:
+        if self._running.pop(job.seq, None) is None:
+            return
+        self._running_by_session[job.session] -= 1
+        if not self._running_by_session[job.session]:
+            del self._running_by_session[job.session]
+        self._cpu_in_use -= job.cpu
+        self._memory_in_use -= job.memory_mb
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        session: Optional[str] = None,
+        priority: Optional[int] = None,
+        cpu: int = 1,
+        memory_mb: Optional[int] = None,
+        limits: Limits | None = None,
+    ) -> AsyncIterator[Job]:
+        """Wait for admission and hold the job's slots for the block.
+
+        session and priority default to the ones set with job_context().
+        """
+        job = Job(
+            session=session if session is not None else _session.get(),
+            priority=priority if priority is not None else _priority.get(),
+            cpu=cpu,
+            memory_mb=memory_mb if memory_mb is not None else self.default_job_memory_mb,
+            limits=limits if limits is not None else self.default_limits,
+            seq=next(self._seq),
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[job.seq] = (job, future)
+        self.max_queued = max(self.max_queued, len(self._waiting))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if self._waiting.pop(job.seq, None) is None:
+                # Admitted just before the cancellation arrived.
+                self._finish(job)
+            raise
+        try:
+            yield job
+        finally:
+            self._finish(job)
+
+    def stats(self) -> SchedulerStats:
+        queued_by_priority: DefaultDict[int, int] = defaultdict(int)
+        for job, _ in self._waiting.values():
+            queued_by_priority[job.priority] += 1
+        return SchedulerStats(
+            queued=len(self._waiting),
+            queued_by_priority=dict(queued_by_priority),
+            running=len(self._running),
+            cpu_in_use=self._cpu_in_use,
+            memory_in_use_mb=self._memory_in_use,
+            admitted=self.admitted,
+            max_queued=self.max_queued,
+            mean_wait_seconds=self._total_wait / self.admitted if self.admitted else 0.0,
+            max_wait_seconds=self._max_wait,
+        )
+
+
+_scheduler: ExecutionScheduler | None = None
+
+
+def get_scheduler() -> ExecutionScheduler:
+    """Return the process-wide scheduler shared by all execution paths."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ExecutionScheduler()
+    return _scheduler
+
+
+def set_scheduler(scheduler: ExecutionScheduler) -> None:
+    global _scheduler
+    _scheduler = scheduler
@@ -0,0 +1,387 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+from hashlib import sha256
+from pathlib import Path
+from typing import Dict, List, Sequence, Set
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock
+from autogen_ext.code_executors.local import CommandLineCodeResult
+
+from execution_scheduler import DEFAULT_SESSION, current_session, get_scheduler
+from import_stats import PYTHON_VARIANTS, find_missing_modules, import_stats, missing_modules_output
+from tracing import CODE, tracer
+from workspaces import WorkspaceManager, workspaces_from_env
+
+WORKER_SCRIPT = str(Path(__file__).with_name("pool_worker.py"))
+SUPPORTED_LANGUAGES = ["bash", "shell", "sh", "python"]
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+def write_code_file(work_dir: Path, code: str, lang: str) -> Path:
+    code_hash = sha256(code.encode()).hexdigest()
+    filename = f"tmp_code_{code_hash}.{'py' if lang == 'python' else lang}"
+    written_file = (work_dir / filename).resolve()
+    written_file.write_text(code, encoding="utf-8")
+    return written_file
+
+
+class PoolWorker:
+    """A pre-started python process that runs code files on request."""
+
+    def __init__(
+        self, preload: Sequence[str] = (), script: str = WORKER_SCRIPT, rlimits: Dict[str, int] | None = None
+    ) -> None:
+        self._preload = list(preload)
+        self.loaded: Set[str] = set(self._preload)
+        self._script = script
+        self._rlimits = rlimits or {}
+        self._proc: asyncio.subprocess.Process | None = None
+
+    async def start(self) -> None:
+        env = None
+        if self._rlimits:
+            # The worker applies them to itself; a preexec_fn is unsafe while threads run.
+            env = {**os.environ, "WORKER_RLIMITS": json.dumps(self._rlimits)}
+        self._proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-u",
+            self._script,
+            *self._preload,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            limit=2**26,
+            env=env,
+        )
+        await self._read()
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None
+
+    async def _read(self) -> Dict:
+        line = await self._proc.stdout.readline()
+        if not line:
+            raise WorkerCrashed("The executor worker exited unexpectedly.")
+        return json.loads(line)
+
+    async def request(self, payload: Dict) -> Dict:
+        self._proc.stdin.write((json.dumps(payload) + "\n").encode())
+        await self._proc.stdin.drain()
+        response = await self._read()
+        if "error" in response:
+            raise WorkerCrashed(response["error"])
+        return response
+
+    async def stop(self) -> None:
+        if not self.alive:
+            return
+        self._proc.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self._proc.wait(), 5)
+        except asyncio.TimeoutError:
+            await self.kill()
+
+    def abandon(self) -> None:
+        """Kill the worker's process group without waiting, e.g. when its event loop is gone."""
+        if self._proc is None or self._proc.returncode is not None:
+            return
+        try:
+            os.killpg(self._proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def kill(self) -> None:
+        """Kill the worker and everything it started, without waiting for it to exit cleanly."""
+        if not self.alive:
+            return
+        try:
+            os.killpg(self._proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self._proc.kill()
+        await self._proc.wait()
+
+
+class ExecutorPool:
+    """A CodeExecutor backed by a fixed number of warm worker processes.
+
+    Tool calls borrow an idle worker, run their code blocks on it and hand it
+    back, so interpreter startup is paid when the pool starts instead of on
+    every execution.
+    """
+
+    def __init__(
+        self,
+        work_dir: str | Path = "coding",
+        size: int | None = None,
+        timeout: int = 60,
+        preload: Sequence[str] = (),
+        workspaces: WorkspaceManager | None = None,
+        prewarm: bool = True,
+    ) -> None:
+        self._work_dir = Path(work_dir)
+        self._work_dir.mkdir(parents=True, exist_ok=True)
+        # Without a workspace manager every run shares work_dir.
+        self._workspaces = workspaces
+        # Idle workers import the modules executed code uses most.
+        self._prewarm = prewarm
+        self._prewarm_task: asyncio.Task | None = None
+        self._size = size or min(4, os.cpu_count() or 1)
+        self._timeout = timeout
+        self._preload = list(preload)
+        self._idle: asyncio.Queue[PoolWorker] = asyncio.Queue()
+        self._workers: List[PoolWorker] = []
+        self._start_lock = asyncio.Lock()
+        self._started = False
+        # The queue, lock and worker pipes belong to the loop the pool was started on.
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop | None:
+        return self._loop
+
+    @property
+    def work_dir(self) -> Path:
+        return self._work_dir
+
+    @property
+    def workspaces(self) -> WorkspaceManager | None:
+        return self._workspaces
+
+    def work_dir_for(self, session: str) -> Path:
+        """The directory the runs of session use as cwd; runs outside a session use work_dir itself."""
+        if self._workspaces is None or session == DEFAULT_SESSION:
+            return self._work_dir
+        return self._workspaces.path(session)
+
+    def work_dir_of(self, session: str) -> Path:
+        """Like work_dir_for, but without creating the workspace or marking the session in use."""
+        if self._workspaces is None or session == DEFAULT_SESSION:
+            return self._work_dir
+        return self._workspaces.path_of(session)
+
+    def release_session(self, session: str) -> None:
+        """Let the workspace of a finished session be garbage collected."""
+        if self._workspaces is not None:
+            self._workspaces.release(session)
+
+    @property
+    def timeout(self) -> int:
+        return self._timeout
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _modules_to_preload(self) -> List[str]:
+        modules = list(self._preload)
+        if self._prewarm:
+            modules += [module for module in import_stats.hot() if module not in modules]
+        return modules
+
+    async def _spawn(self) -> PoolWorker:
+        worker = PoolWorker(self._modules_to_preload())
+        await worker.start()
+        self._workers.append(worker)
+        return worker
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._started:
+                return
+            self._loop = asyncio.get_running_loop()
+            workers = await asyncio.gather(*[self._spawn() for _ in range(self._size)])
+            for worker in workers:
+                self._idle.put_nowait(worker)
+            self._started = True
+
+    async def stop(self) -> None:
+        if self._prewarm_task is not None:
+            self._prewarm_task.cancel()
+            await asyncio.gather(self._prewarm_task, return_exceptions=True)
+            self._prewarm_task = None
+        async with self._start_lock:
+            await asyncio.gather(*[worker.stop() for worker in self._workers])
+            self._workers = []
+            self._idle = asyncio.Queue()
+            self._started = False
+            self._loop = None
+
+    def abandon(self) -> None:
+        """Kill the workers of a pool whose event loop has closed; it cannot be stopped cleanly."""
+        for worker in self._workers:
+            worker.abandon()
+        self._workers = []
+
+    async def restart(self) -> None:
+        await self.stop()
+        await self.start()
+
+    async def _discard(self, worker: PoolWorker) -> None:
+        """Replace a broken or cancelled worker so the pool keeps its size."""
+        if worker in self._workers:
+            self._workers.remove(worker)
+        await worker.stop()
+        if self._started:
+            self._idle.put_nowait(await self._spawn())
+
+    async def prewarm(self) -> None:
+        """Preload the hot modules in idle workers, one worker at a time."""
+        modules = self._modules_to_preload()
+        for _ in range(self._idle.qsize()):
+            try:
+                worker = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            todo = [module for module in modules if module not in worker.loaded]
+            try:
+                if todo:
+                    # Marked even when an import fails, so it is not retried on every run.
+                    worker.loaded.update(todo)
+                    await worker.request({"op": "preload", "modules": todo})
+            except WorkerCrashed:
+                await self._discard(worker)
+                continue
+            self.release(worker)
+
+    def _schedule_prewarm(self) -> None:
+        if not self._prewarm or not self._started:
+            return
+        if self._prewarm_task is not None and not self._prewarm_task.done():
+            return
+        modules = self._modules_to_preload()
+        if any(module not in worker.loaded for worker in self._workers for module in modules):
+            self._prewarm_task = asyncio.create_task(self.prewarm())
+
+    async def acquire(self) -> PoolWorker:
+        await self.start()
+        return await self._idle.get()
+
+    def release(self, worker: PoolWorker) -> None:
+        if worker in self._workers:
+            self._idle.put_nowait(worker)
+
+    async def _run_on(self, worker: PoolWorker, payload: Dict, cancellation_token: CancellationToken) -> Dict:
+        task = asyncio.create_task(worker.request(payload))
+        cancellation_token.link_future(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            await self._discard(worker)
+            raise
+        except WorkerCrashed as e:
+            await self._discard(worker)
+            return {"exit_code": 1, "output": f"\n{e}"}
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CommandLineCodeResult:
+        languages = ",".join(code_block.language for code_block in code_blocks)
+        with tracer.span("execute_code_blocks", CODE, blocks=len(code_blocks), languages=languages) as span:
+            import_stats.record(code_blocks)
+            # Report every missing module at once instead of one failed run per module.
+            missing = find_missing_modules(code_blocks, self.work_dir_for(current_session()))
+            if missing:
+                result = CommandLineCodeResult(exit_code=1, output=missing_modules_output(missing), code_file=None)
+            else:
+                async with get_scheduler().slot() as job:
+                    work_dir = self.work_dir_for(job.session)
+                    result = await self._execute_code_blocks(code_blocks, cancellation_token, work_dir, job.rlimits)
+                self._schedule_prewarm()
+            if span is not None:
+                span.attrs["exit_code"] = result.exit_code
+                span.attrs["missing_modules"] = len(missing)
+        return result
+
+    async def _execute_code_blocks(
+        self,
+        code_blocks: List[CodeBlock],
+        cancellation_token: CancellationToken,
+        work_dir: Path,
+        rlimits: Dict[str, int],
+    ) -> CommandLineCodeResult:
+        logs_all = ""
+        file_names: List[Path] = []
+        exitcode = 0
+        worker = await self.acquire()
+        try:
+            for code_block in code_blocks:
+                lang = code_block.language.lower()
+                if lang in PYTHON_VARIANTS:
+                    lang = "python"
+                if lang not in SUPPORTED_LANGUAGES:
+                    exitcode = 1
+                    logs_all += "\n" + f"unknown language {lang}"
+                    break
+
+                written_file = write_code_file(work_dir, code_block.code, lang)
+                file_names.append(written_file)
+                payload = {
+                    "op": "run",
+                    "file": str(written_file),
+                    "language": lang,
+                    "cwd": str(work_dir.resolve()),
+                    "timeout": self._timeout,
+                    "rlimits": rlimits,
+                }
+                try:
+                    response = await self._run_on(worker, payload, cancellation_token)
+                except asyncio.CancelledError:
+                    logs_all += "\n Cancelled"
+                    exitcode = 125
+                    worker = None
+                    break
+                logs_all += response["output"]
+                exitcode = response["exit_code"]
+                if exitcode != 0:
+                    break
+        finally:
+            if worker is not None:
+                self.release(worker)
+
+        code_file = str(file_names[0]) if len(file_names) > 0 else None
+        return CommandLineCodeResult(exit_code=exitcode, output=logs_all, code_file=code_file)
+
+
+_shared_pools: Dict[str, ExecutorPool] = {}
+
+
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_executor_pool(work_dir: str | Path = "coding", size: int | None = None) -> ExecutorPool:
+    """Return the process-wide pool for work_dir, creating it on first use.
+
+    Runs inside a job_context() session get their own directory under
+    work_dir/sessions; the others run in work_dir itself, so relative paths
+    written by other tools resolve the same way. A pool
+    started on another event loop, e.g. by an earlier asyncio.run() that did
+    not call stop_executor_pools(), is replaced.
+    """
+    key = str(Path(work_dir).resolve())
+    pool = _shared_pools.get(key)
+    if pool is not None and pool.loop is not None and pool.loop is not _running_loop():
+        pool.abandon()
+        del _shared_pools[key]
+    if key not in _shared_pools:
+        _shared_pools[key] = ExecutorPool(
+            work_dir=work_dir, size=size, workspaces=workspaces_from_env(Path(work_dir) / "sessions")
+        )
+    return _shared_pools[key]
+
+
+async def stop_executor_pools() -> None:
+    """Stop every shared pool, e.g. before the event loop that owns them closes."""
+    await asyncio.gather(*[pool.stop() for pool in _shared_pools.values()])
+    _shared_pools.clear()
@@ -0,0 +1,48 @@
+"""Hosts one Executor agent type in its own process for distributed_code_agent.
+
+Usage: python executor_worker.py HOST_ADDRESS AGENT_TYPE WORK_DIR [POOL_SIZE [OPTIONS_JSON]]
+
+OPTIONS_JSON holds the executor settings of the CodeAgent, as
+distributed_code_agent.worker_options() writes them. The worker connects to
+the host runtime, registers AGENT_TYPE, prints one JSON line once it is
+ready and runs until it receives SIGTERM or SIGINT.
+"""
+import asyncio
+import json
+import sys
+from typing import Dict
+
+from code_agent_core import Executor, build_code_executor
+from distributed_code_agent import GrpcWorkerAgentRuntime, add_code_agent_serializers
+from executor_pool import get_executor_pool, stop_executor_pools
+from output_shaping import OutputShaper
+from result_cache import ExecutionResultCache
+
+
+async def main(host_address: str, agent_type: str, work_dir: str, pool_size: int, options: Dict) -> None:
+    runtime = GrpcWorkerAgentRuntime(host_address=host_address)
+    add_code_agent_serializers(runtime)
+    runtime.start()
+    result_cache = ExecutionResultCache(**options["result_cache"]) if "result_cache" in options else None
+    output_shaper = OutputShaper(**options["output_shaper"]) if "output_shaper" in options else None
+    await get_executor_pool(work_dir=work_dir, size=pool_size).start()
+    code_executor = build_code_executor(
+        work_dir, kernel=options.get("kernel", False), result_cache=result_cache, pool_size=pool_size
+    )
+    # Only reached through the dispatcher, so no subscription to the default topic.
+    await Executor.register(
+        runtime, agent_type, lambda: Executor(code_executor, output_shaper), skip_class_subscriptions=True
+    )
+    print(json.dumps({"ready": agent_type}), flush=True)
+    try:
+        await runtime.stop_when_signal()
+    finally:
+        await code_executor.stop()
+        await stop_executor_pools()
+
+
+if __name__ == "__main__":
+    host_address, agent_type, work_dir = sys.argv[1:4]
+    pool_size = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    options = json.loads(sys.argv[5]) if len(sys.argv) > 5 else {}
+    asyncio.run(main(host_address, agent_type, work_dir, pool_size, options))
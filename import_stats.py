@@ -0,0 +1,114 @@
+import ast
+import importlib.util
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Set
+
+from autogen_core.code_executor import CodeBlock
+
+# The language names executor_pool runs as Python; it imports them from here.
+PYTHON_VARIANTS = ["python", "Python", "py"]
+SHELL_LANGUAGES = ["bash", "shell", "sh"]
+# Code mentioning both may install packages, e.g. subprocess.check_call([sys.executable, "-m", "pip", "install", ...]).
+_INSTALLER = re.compile(r"\b(?:pip3?|conda|mamba|uv)\b")
+_INSTALL = re.compile(r"\binstall\b")
+
+
+def _top_level(name: str) -> str:
+    return name.split(".")[0]
+
+
+def parse_imports(code: str, module_level_only: bool = False) -> Set[str]:
+    """Full names of the modules code imports, e.g. {"pandas", "matplotlib.pyplot"}.
+
+    With module_level_only, imports nested in try blocks, conditions or
+    functions are left out: the code may be prepared for them to fail.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    nodes = tree.body if module_level_only else ast.walk(tree)
+    modules = set()
+    for node in nodes:
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.add(node.module)
+    return modules
+
+
+def is_installed(module: str, work_dir: Path | None = None) -> bool:
+    """Whether the top-level package of module can be imported, without importing it."""
+    module = _top_level(module)
+    if module in sys.stdlib_module_names or module in sys.builtin_module_names:
+        return True
+    if work_dir is not None and ((work_dir / f"{module}.py").exists() or (work_dir / module).is_dir()):
+        return True
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def find_missing_modules(code_blocks: List[CodeBlock], work_dir: Path | None = None) -> List[str]:
+    """Modules the Python blocks import unconditionally but that are not installed.
+
+    A shell block, or a block that looks like it installs packages, ends
+    the check, since it may install them before they are imported.
+    """
+    importlib.invalidate_caches()
+    missing: List[str] = []
+    for code_block in code_blocks:
+        language = code_block.language.lower()
+        if language in SHELL_LANGUAGES or (_INSTALLER.search(code_block.code) and _INSTALL.search(code_block.code)):
+            break
+        if language not in PYTHON_VARIANTS:
+            continue
+        for module in sorted({_top_level(name) for name in parse_imports(code_block.code, module_level_only=True)}):
+            if module not in missing and not is_installed(module, work_dir):
+                missing.append(module)
+    return missing
+
+
+def missing_modules_output(missing: List[str]) -> str:
+    """The output reported for a run that was not started because of missing modules."""
+    return "".join(f"ModuleNotFoundError: No module named '{module}'\n" for module in missing)
+
+
+class ImportStats:
+    """Counts how often executed code imports each module.
+
+    Modules imported at least ``min_count`` times are hot: worth importing
+    ahead of time in idle executor workers. Standard library modules other
+    than the slow ones are not counted, as they load fast anyway.
+    """
+
+    SLOW_STDLIB = frozenset({"asyncio", "email", "http", "multiprocessing", "sqlite3", "tkinter", "xml"})
+
+    def __init__(self, top: int = 8, min_count: int = 2) -> None:
+        self.top = top
+        self.min_count = min_count
+        self.counts: Counter[str] = Counter()
+
+    def record(self, code_blocks: Iterable[CodeBlock]) -> None:
+        for code_block in code_blocks:
+            if code_block.language.lower() not in PYTHON_VARIANTS:
+                continue
+            for module in parse_imports(code_block.code):
+                top_level = _top_level(module)
+                if top_level in sys.stdlib_module_names and top_level not in self.SLOW_STDLIB:
+                    continue
+                self.counts[module] += 1
+
+    def hot(self) -> List[str]:
+        return [
+            module
+            for module, count in self.counts.most_common(self.top)
+            if count >= self.min_count and is_installed(module)
+        ]
+
+
+import_stats = ImportStats()
@@ -0,0 +1,101 @@
+"""Persistent Python kernel used by python_kernel.KernelCodeExecutor.
+
+Like pool_worker, it reads one JSON request per line from stdin and writes one
+JSON response per line to stdout. Unlike pool_worker, code runs in this
+process, in one globals dict that lives as long as the kernel, so variables,
+imports and loaded data carry over from one request to the next.
+"""
+import builtins
+import json
+import os
+import signal
+import sys
+import tempfile
+import traceback
+
+from limited_exec import apply_rlimits
+from pool_worker import preload
+
+_globals = {"__name__": "__main__", "__builtins__": builtins}
+
+
+def run_code(request):
+    os.chdir(request["cwd"])
+    if request["cwd"] not in sys.path:
+        sys.path.insert(0, request["cwd"])
+    path = request["file"]
+    sys.argv = [path]
+    _globals["__file__"] = path
+    exit_code = 0
+    with tempfile.TemporaryFile() as output:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved = os.dup(1), os.dup(2)
+        # At fd level, so subprocesses and C extensions are captured too.
+        os.dup2(output.fileno(), 1)
+        os.dup2(output.fileno(), 2)
+        try:
+            with open(path) as f:
+                code = compile(f.read(), path, "exec")
+            exec(code, _globals)
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException as e:
+            # Hide the kernel's own frames so the traceback reads like a plain run.
+            tb = e.__traceback__
+            while tb is not None and tb.tb_frame.f_code.co_filename != path:
+                tb = tb.tb_next
+            traceback.print_exception(type(e), e, tb)
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+        output.seek(0)
+        text = output.read().decode("utf-8", errors="replace")
+    return {"exit_code": exit_code, "output": text}
+
+
+def handle(request):
+    if request["op"] == "preload":
+        return {"loaded": preload(request["modules"])}
+    if request["op"] == "run":
+        return run_code(request)
+    raise ValueError(f"unknown op {request['op']}")
+
+
+def main():
+    signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+    # Set by PoolWorker; the limits cover the kernel's whole life.
+    apply_rlimits(json.loads(os.environ.pop("WORKER_RLIMITS", "{}")))
+    protocol_in = os.fdopen(os.dup(0), "r")
+    protocol_out = os.fdopen(os.dup(1), "w")
+    # The code run in the kernel must not read or write the protocol streams.
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    sys.stdin = open(os.devnull)
+    os.dup2(2, 1)
+    preload([m for m in sys.argv[1:] if m])
+    protocol_out.write(json.dumps({"ready": True}) + "\n")
+    protocol_out.flush()
+    for line in protocol_in:
+        try:
+            response = handle(json.loads(line))
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        protocol_out.write(json.dumps(response) + "\n")
+        protocol_out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Runs a command under rlimits.
+
+Usage: python limited_exec.py RLIMITS_JSON COMMAND [ARG ...]
+
+RLIMITS_JSON maps resource names to limits, as Limits.to_rlimits() returns
+them. The limits are set in this process, which then execs the command.
+Setting them in a preexec_fn instead is unsafe while the parent process has
+threads running.
+"""
+import json
+import os
+import resource
+import sys
+
+
+def apply_rlimits(rlimits):
+    for name, value in rlimits.items():
+        resource.setrlimit(getattr(resource, name), (value, value))
+
+
+def main():
+    apply_rlimits(json.loads(sys.argv[1]))
+    os.execvp(sys.argv[2], sys.argv[2:])
+
+
+if __name__ == "__main__":
+    main()
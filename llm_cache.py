@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncGenerator, Literal, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+# read_write: serve hits, call the model and store on misses.
+# record: always call the model and store the response.
+# replay: serve only from the cache, a miss is an error (offline runs).
+CacheMode = Literal["read_write", "record", "replay"]
+
+
+class CacheMissError(LookupError):
+    pass
+
+
+def _normalize_message(message: LLMMessage) -> Any:
+    data = message.model_dump(mode="json")
+    if isinstance(data.get("content"), str):
+        data["content"] = data["content"].strip()
+    return data
+
+
+def _tool_schema(tool: Tool | ToolSchema) -> Any:
+    return tool.schema if isinstance(tool, Tool) else tool
+
+
+class CachingChatCompletionClient(ChatCompletionClient):
+    """Wraps a ChatCompletionClient with a persistent SQLite response cache.
+
+    Responses are keyed on the model name, the normalized message list, the
+    tool schemas and the create arguments. Entries expire after ``ttl``
+    seconds. The least recently used entries are evicted beyond
+    ``max_entries`` or ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        path: str = ".llm_cache.sqlite",
+        mode: CacheMode = "read_write",
+        ttl: float | None = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+        model: str | None = None,
+    ) -> None:
+        self._client = client
+        self._mode = mode
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._model = model or getattr(client, "_create_args", {}).get("model", type(client).__name__)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        json_output: Optional[bool],
+        extra_create_args: Mapping[str, Any],
+    ) -> str:
+        payload = {
+            "model": self._model,
+            "messages": [_normalize_message(m) for m in messages],
+            "tools": [_tool_schema(t) for t in tools],
+            "json_output": json_output,
+            "extra_create_args": dict(extra_create_args),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _load(self, key: str) -> CreateResult | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT result, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._ttl is not None and now - row[1] > self._ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        result = CreateResult.model_validate_json(row[0])
+        result.cached = True
+        return result
+
+    def _store(self, key: str, result: CreateResult) -> None:
+        data = result.model_dump_json()
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, result, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        if self._ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self._ttl,))
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self._max_entries or size > self._max_bytes:
+            row = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            count, size = count - 1, size - row[1]
+
+    def _lookup(self, key: str) -> CreateResult | None:
+        if self._mode == "record":
+            return None
+        result = self._load(key)
+        if result is None:
+            self.misses += 1
+            if self._mode == "replay":
+                raise CacheMissError("No cached response for this request (replay mode).")
+        else:
+            self.hits += 1
+        return result
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = self.make_key(messages, tools, json_output, extra_create_args)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        result = await self._client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self._store(key, result)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        key = self.make_key(messages, tools, json_output, extra_create_args)
+        cached = self._lookup(key)
+        if cached is not None:
+            if isinstance(cached.content, str):
+                yield cached.content
+            yield cached
+            return
+        async for chunk in self._client.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(chunk, CreateResult):
+                self._store(key, chunk)
+            yield chunk
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self):  # type: ignore
+        return self._client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def cache_from_env(client: ChatCompletionClient) -> ChatCompletionClient:
+    """Wrap client in a response cache when LLM_CACHE_MODE is set.
+
+    LLM_CACHE_MODE is one of read_write, record or replay; LLM_CACHE_PATH
+    selects the SQLite file (default .llm_cache.sqlite).
+    """
+    mode = os.getenv("LLM_CACHE_MODE")
+    if not mode:
+        return client
+    if mode not in ("read_write", "record", "replay"):
+        raise ValueError(f"Unknown LLM_CACHE_MODE {mode!r}")
+    return CachingChatCompletionClient(client, path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"), mode=mode)
@@ -1,20 +1,24 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import asyncio
-from typing import List
+import contextvars
+import uuid
+from typing import Dict, List
 from typing_extensions import Annotated
 from autogen_core.tools import FunctionTool
 from autogen_core import (
+    AgentId,
+    AgentRuntime,
     DefaultTopicId,
     MessageContext,
-    RoutedAgent,
     SingleThreadedAgentRuntime,
+    TopicId,
+    TypeSubscription,
     default_subscription,
     message_handler,
 )
 from autogen_core.models import (
     AssistantMessage,
     ChatCompletionClient,
-    LLMMessage,
     SystemMessage,
     UserMessage,
 )
@@ -22,8 +26,15 @@ from autogen_core import CancellationToken
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 
-from execute_tool_call import execute_tool_call
-from execute_code_tool import execute_code
+from blueprint_store import REVIEWER, WORKER, AgentBlueprint, BlueprintStore
+from execute_tool_call import ToolRegistry
+from execution_scheduler import job_context
+from pre_review import PreReviewer
+from execute_code_tool import execute_code, release_workspace
+from llm_cache import cache_from_env
+from tracing import TracedAgent, trace_client, trace_from_env
+from chat_history import MESSAGE, TASK, TOOL_OUTPUT, ChatHistory
+from runtime_internals import forget_agents
 
 @dataclass
 class UserTaskMessage:
@@ -52,29 +63,113 @@ class TaskReviewMessage:
 class FinalResultMessage:
     user_task: str
     result: str
+    approved: bool = True
 
 
 @dataclass
 class BrodcastMessage:
     message: str
 
+
+# Tools a worker can be given, by name.
+WORKER_TOOLS = {
+    "execute_code": lambda: FunctionTool(
+        execute_code,
+        name="execute_code",
+        description="Execute code in a given language.",
+    ),
+}
+
+# The task whose team make_agent / make_reviewer_agent are building.
+_current_task: contextvars.ContextVar[str] = contextvars.ContextVar("meta_agent_task")
+
+
+@dataclass
+class TaskTeam:
+    """The agents made for one task; they only subscribe to the task's topic."""
+
+    topic_type: str
+    agent_types: List[str] = field(default_factory=list)
+    subscription_ids: List[str] = field(default_factory=list)
+    blueprints: List[AgentBlueprint] = field(default_factory=list)
+    # Built from stored blueprints instead of a meta-LLM round.
+    reused: bool = False
+    user_task: str = ""
+    # Topic source of the user's task, where the final result goes.
+    source: str = "default"
+    # Fan-out: each subtask runs on its own topic source, so it gets its own
+    # worker and reviewer instances.
+    subtasks: List[str] = field(default_factory=list)
+    next_subtask: int = 0
+    sub_results: Dict[int, "FinalResultMessage"] = field(default_factory=dict)
+
+
+class OwnerSubscription:
+    """Routes every message on a topic type, whatever its source, to one agent."""
+
+    def __init__(self, topic_type: str, agent_id: AgentId) -> None:
+        self._id = str(uuid.uuid4())
+        self._topic_type = topic_type
+        self._agent_id = agent_id
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, OwnerSubscription) and self.id == other.id
+
+    def is_match(self, topic_id: TopicId) -> bool:
+        return topic_id.type == self._topic_type
+
+    def map_to_agent(self, topic_id: TopicId) -> AgentId:
+        return self._agent_id
+
+
+def task_topic_type(task_id: str) -> str:
+    return f"task_{task_id}"
+
+
+def subtask_source(index: int) -> str:
+    return f"subtask_{index}"
+
+
+def release_agent_types(runtime: AgentRuntime, agent_types: List[str], topic_type: str) -> None:
+    """Drop the instances and factories of agent types, freeing their chat histories."""
+    forget_agents(
+        runtime,
+        agents=lambda agent_id: agent_id.type in agent_types,
+        topics=lambda topic: topic.type == topic_type,
+        agent_types=agent_types,
+    )
+
 @default_subscription
-class MetaAgent(RoutedAgent):
+class MetaAgent(TracedAgent):
     def __init__(
-        self, model_client: ChatCompletionClient, min_agent_count=1, max_agent_count=2
+        self,
+        model_client: ChatCompletionClient,
+        min_agent_count=1,
+        max_agent_count=2,
+        blueprint_store: BlueprintStore | None = None,
+        max_concurrent_workers: int = 4,
+        pre_reviewer: PreReviewer | None = None,
     ) -> None:
         super().__init__("An assistant agent.")
         self._model_client = model_client
-        self._chat_history: List[LLMMessage] = [
+        self._pre_reviewer = pre_reviewer
+        self._blueprint_store = blueprint_store
+        self._max_concurrent_workers = max(1, max_concurrent_workers)
+        self._chat_history = ChatHistory(
             SystemMessage(
                 content=f""" You are a meta agent that can make other agents to solve problems. 
                 
                 - Use make_agent tool to make an agent to solve the problem. 
                 - Use make_reviewer_agent tool to make a reviewer agent to review the result of the worker agent. 
+                - Use split_task tool as well when the task splits into independent parts (e.g. several sources or files) that can be done in parallel.
                 
                 Do not solve the problem directly.""",
             )
-        ]
+        )
         self._tools = []
         make_agent_tool = FunctionTool(
             self.make_agent,
@@ -90,54 +185,101 @@ class MetaAgent(RoutedAgent):
         )
         self._tools.append(make_reviewer_agent_tool)
 
+        split_task_tool = FunctionTool(
+            self.split_task,
+            name="split_task",
+            description="Split the task into independent subtasks. Each subtask is solved in parallel by its own copy of the worker agent and reviewer agent, then the results are merged.",
+        )
+        self._tools.append(split_task_tool)
+        self._tool_registry = ToolRegistry(self._tools)
+        self._teams: Dict[str, TaskTeam] = {}
+
     async def make_agent(
         self,
         name: Annotated[str, "The name of the agent"],
         system_message: Annotated[str, "The system message of the agent"],
     ) -> None:
-        system_message += """ You should consider the feedback provide by reviewer agent and improve your work. You have access to the following tools: 
+        await self._make_worker(AgentBlueprint(WORKER, name, system_message, ["execute_code"]))
+        return "Agent made."
+
+    async def _make_worker(self, blueprint: AgentBlueprint) -> None:
+        name = blueprint.name
+        system_message = blueprint.system_message + """ You should consider the feedback provide by reviewer agent and improve your work. You have access to the following tools: 
             - execute_code: Execute code in a given language(ensure content is printed to stdout)"""
 
         print(f"making agent:\nname: {name}\nsystem_message: {system_message}")
 
-        code_executor_tool = FunctionTool(
-            execute_code,
-            name="execute_code",
-            description="Execute code in a given language.",
-        )
+        tools = [WORKER_TOOLS[tool]() for tool in blueprint.tools if tool in WORKER_TOOLS]
 
-        # register the agent
-        await WorkerAgent.register(
-            self.runtime,
+        await self._register_team_agent(
+            WorkerAgent,
             f"Worker_{name}",
             lambda: WorkerAgent(
                 name=name,
                 system_message=system_message,
                 model_client=self._model_client,
-                tools=[code_executor_tool],
+                tools=tools,
             ),
+            blueprint,
         )
-        return "Agent made."
 
     async def make_reviewer_agent(
         self,
         name: Annotated[str, "The name of the agent"],
         system_message: Annotated[str, "The system message of the agent"],
     ) -> None:
-        system_message += " Just Reply with 'APPROVE' if the result meets the task requirements, otherwise provide constructive feedback on how to improve it or another approach to take."
+        await self._make_reviewer(AgentBlueprint(REVIEWER, name, system_message))
+        return "Agent made."
+
+    async def _make_reviewer(self, blueprint: AgentBlueprint) -> None:
+        name = blueprint.name
+        system_message = blueprint.system_message + " Just Reply with 'APPROVE' if the result meets the task requirements, otherwise provide constructive feedback on how to improve it or another approach to take."
         print(f"making agent:\nname: {name}\nsystem_message: {system_message}")
 
-        # register the agent
-        await ReviewerAgent.register(
-            self.runtime,
-            f"Worker_{name}",
+        await self._register_team_agent(
+            ReviewerAgent,
+            f"Reviewer_{name}",
             lambda: ReviewerAgent(
                 name=name,
                 system_message=system_message,
                 model_client=self._model_client,
+                pre_reviewer=self._pre_reviewer,
             ),
+            blueprint,
         )
-        return "Agent made."
+
+    async def _register_team_agent(self, agent_class, name: str, factory, blueprint: AgentBlueprint) -> None:
+        """Register an agent of the current task, subscribed to the task's topic only."""
+        task_id = _current_task.get()
+        team = self._teams[task_id]
+        agent_type = f"{name}_{task_id}"
+        # The model may reuse a name within a task; agent types must be unique.
+        suffix = 1
+        while agent_type in team.agent_types:
+            suffix += 1
+            agent_type = f"{name}_{suffix}_{task_id}"
+        await agent_class.register(
+            self.runtime,
+            agent_type,
+            factory,
+            skip_class_subscriptions=True,
+            skip_direct_message_subscription=True,
+        )
+        subscription = TypeSubscription(topic_type=team.topic_type, agent_type=agent_type)
+        await self.runtime.add_subscription(subscription)
+        team.agent_types.append(agent_type)
+        team.subscription_ids.append(subscription.id)
+        team.blueprints.append(blueprint)
+
+    async def _teardown(self, task_id: str) -> None:
+        team = self._teams.pop(task_id, None)
+        if team is None:
+            return
+        for subscription_id in team.subscription_ids:
+            await self.runtime.remove_subscription(subscription_id)
+        release_agent_types(self.runtime, team.agent_types, team.topic_type)
+        # Workers run code under the task topic as their session.
+        release_workspace(team.topic_type)
 
     @message_handler
     async def handle_message(
@@ -145,39 +287,139 @@ class MetaAgent(RoutedAgent):
     ) -> None:
         if isinstance(message, BrodcastMessage):
             if message.message.lower() == "reset":
-                self._chat_history = []
+                self._chat_history.clear()
+                for task_id in list(self._teams):
+                    await self._teardown(task_id)
                 return
 
+        task_id = uuid.uuid4().hex
+        team = TaskTeam(
+            topic_type=task_topic_type(task_id), user_task=message.user_task, source=ctx.topic_id.source
+        )
+        self._teams[task_id] = team
+        # Hear the task's final results (of every subtask), to merge and tear the team down.
+        subscription = OwnerSubscription(team.topic_type, self.id)
+        await self.runtime.add_subscription(subscription)
+        team.subscription_ids.append(subscription.id)
+
+        token = _current_task.set(task_id)
+        try:
+            blueprints = None
+            if self._blueprint_store is not None:
+                blueprints = self._blueprint_store.get(message.user_task)
+            if blueprints:
+                team.reused = True
+                print(f"\n{'-'*80}\nMetaAgent:\nReusing {len(blueprints)} agent blueprint(s) made for a similar task.")
+                for blueprint in blueprints:
+                    if blueprint.kind == WORKER:
+                        await self._make_worker(blueprint)
+                    else:
+                        await self._make_reviewer(blueprint)
+            elif not await self._design_team(message.user_task):
+                await self._teardown(task_id)
+                return
+        finally:
+            _current_task.reset(token)
+
+        if team.subtasks:
+            for _ in range(min(self._max_concurrent_workers, len(team.subtasks))):
+                await self._start_next_subtask(team)
+            return
+        await self.publish_message(WorkerTaskMessage(user_task=message.user_task), TopicId(team.topic_type, team.source))  # type: ignore
+        print("published task message to worker")
+
+    async def _start_next_subtask(self, team: TaskTeam) -> None:
+        index = team.next_subtask
+        team.next_subtask += 1
+        await self.publish_message(
+            WorkerTaskMessage(
+                user_task=f"{team.subtasks[index]}\n\nThis is one part of a larger task, do only this part. The larger task: {team.user_task}"
+            ),
+            TopicId(team.topic_type, subtask_source(index)),
+        )
+        print(f"published subtask {index + 1}/{len(team.subtasks)} to worker")
+
+    async def split_task(
+        self,
+        subtasks: Annotated[List[str], "Independent, self-contained parts of the task"],
+    ) -> str:
+        team = self._teams[_current_task.get()]
+        team.subtasks = [subtask for subtask in subtasks if subtask.strip()]
+        return f"Task split into {len(team.subtasks)} subtasks."
+
+    async def _merge(self, team: TaskTeam) -> str:
+        """Combine the subtask results into one answer to the user's task."""
+        parts = "\n\n".join(
+            f"Subtask {index + 1}: {team.subtasks[index]}\n"
+            f"{'Result' if result.approved else 'Result (not approved)'}: {result.result}"
+            for index, result in sorted(team.sub_results.items())
+        )
+        result = await self._model_client.create(
+            [
+                SystemMessage(
+                    content="Merge the results of the subtasks into one answer to the task. Say which subtasks failed, if any."
+                ),
+                UserMessage(content=f"Task: {team.user_task}\n\n{parts}", source="user"),
+            ]
+        )
+        return result.content if isinstance(result.content, str) else parts
+
+    async def _design_team(self, user_task: str) -> bool:
+        """Let the model make the team's agents; False if it answered in text instead."""
         self._chat_history.append(
             UserMessage(
-                content=message.user_task,
+                content=user_task,
                 source="user",
-            )
+            ),
+            kind=TASK,
         )
 
         result = await self._model_client.create(
-            messages=self._chat_history, tools=self._tools
+            messages=self._chat_history.messages, tools=self._tools
         )
         self._chat_history.append(AssistantMessage(content=result.content, source="MetaAgent"))  # type: ignore
 
         if isinstance(result.content, str):
             print(f"\n{'-'*80}\nMetaAgent:\n{result.content}")
+            return False
+        results = await self._tool_registry.dispatch(result.content, CancellationToken())
+        print(f"\n{'-'*80}\nMetaAgent:\n{results}")
+        return True
+
+    @message_handler
+    async def handle_final_result(self, message: FinalResultMessage, ctx: MessageContext) -> None:
+        task_id = ctx.topic_id.type.removeprefix("task_")
+        if task_id not in self._teams:
+            # Our own forward on the default topic.
             return
-        if isinstance(result.content, list):
-            results = await asyncio.gather(
-                *[
-                    execute_tool_call(self._tools, call, CancellationToken())
-                    for call in result.content
-                ]
+        team = self._teams[task_id]
+        if team.subtasks:
+            index = int(ctx.topic_id.source.removeprefix("subtask_"))
+            team.sub_results[index] = message
+            # Decided before any await, so only the handler of the last result merges.
+            done = len(team.sub_results) == len(team.subtasks)
+            if team.next_subtask < len(team.subtasks):
+                await self._start_next_subtask(team)
+            if not done:
+                return
+            message = FinalResultMessage(
+                user_task=team.user_task,
+                result=await self._merge(team),
+                approved=all(result.approved for result in team.sub_results.values()),
             )
-            print(f"\n{'-'*80}\nMetaAgent:\n{results}")
-
-        await self.publish_message(WorkerTaskMessage(user_task=message.user_task), DefaultTopicId())  # type: ignore
-        print("published task message to worker")
+        # Fan-out teams are not stored: reusing them would skip the split.
+        elif self._blueprint_store is not None and team.blueprints:
+            if message.approved and not team.reused:
+                self._blueprint_store.put(message.user_task, team.blueprints)
+            elif not message.approved and team.reused:
+                # The stored team did not work for this task; design a new one next time.
+                self._blueprint_store.discard(message.user_task)
+        await self._teardown(task_id)
+        await self.publish_message(message, DefaultTopicId(source=team.source))
 
 
 @default_subscription
-class WorkerAgent(RoutedAgent):
+class WorkerAgent(TracedAgent):
     """A worker agent that can execute tasks."""
 
     def __init__(
@@ -190,8 +432,9 @@ class WorkerAgent(RoutedAgent):
         super().__init__("An assistant agent.")
         self.name = f"Worker_{name}"
         self._model_client = model_client
-        self._chat_history: List[LLMMessage] = [SystemMessage(content=system_message)]
+        self._chat_history = ChatHistory(SystemMessage(content=system_message))
         self._tools = tools
+        self._tool_registry = ToolRegistry(tools)
 
     @message_handler
     async def handle_message(
@@ -202,49 +445,53 @@ class WorkerAgent(RoutedAgent):
             self._chat_history.append(
                 UserMessage(
                     content=message.user_task, type="UserMessage", source="user"
-                )
+                ),
+                kind=TASK,
             )
         elif isinstance(message, TaskReviewMessage):
             self._chat_history.append(
                 UserMessage(content=message.review, type="UserMessage", source="user")
             )
-        result = await self._model_client.create(self._chat_history, tools=self._tools)
+        result = await self._model_client.create(self._chat_history.messages, tools=self._tools)
 
         result_contest = ""
         if isinstance(result.content, str):
             result_contest = result.content
 
         if isinstance(result.content, list):
-            results = await asyncio.gather(
-                *[
-                    execute_tool_call(self._tools, call, CancellationToken())
-                    for call in result.content
-                ]
-            )
+            # Code runs of one task share a fair-share queue, whichever worker starts them.
+            with job_context(session=ctx.topic_id.type):
+                results = await self._tool_registry.dispatch(result.content, CancellationToken())
             result_contest = "\n".join([str(result.content) for result in results])
 
         print(f"\n{'-'*80}\n{self.type}:\n{result_contest}")
         self._chat_history.append(
             AssistantMessage(
                 content=result_contest, type="AssistantMessage", source="assistant"
-            )
+            ),
+            kind=TOOL_OUTPUT if isinstance(result.content, list) else MESSAGE,
         )
         await self.runtime.publish_message(
-            TaskResultMessage(message.user_task, result_contest), DefaultTopicId()
+            TaskResultMessage(message.user_task, result_contest), DefaultTopicId(type=ctx.topic_id.type)
         )
 
 
 @default_subscription
-class ReviewerAgent(RoutedAgent):
+class ReviewerAgent(TracedAgent):
     """A reviewer agent."""
 
     def __init__(
-        self, name: str, model_client: OpenAIChatCompletionClient, system_message: str
+        self,
+        name: str,
+        model_client: OpenAIChatCompletionClient,
+        system_message: str,
+        pre_reviewer: PreReviewer | None = None,
     ) -> None:
         super().__init__("A reviewer agent.")
         self.name = f"Reviewer_{name}"
         self._model_client = model_client
-        self._chat_history: List[LLMMessage] = [SystemMessage(content=system_message)]
+        self._chat_history = ChatHistory(SystemMessage(content=system_message))
+        self._pre_reviewer = pre_reviewer if pre_reviewer is not None else PreReviewer()
         self.try_count = 0
 
     @message_handler
@@ -257,18 +504,23 @@ class ReviewerAgent(RoutedAgent):
                 content=f"task: {message.user_task}\nresult: {message.result}",
                 type="UserMessage",
                 source="user",
-            )
+            ),
+            kind=TOOL_OUTPUT,
         )
-        result = await self._model_client.create(self._chat_history)
+        # Obvious execution failures go back to the worker without a model call.
+        review = self._pre_reviewer.review(message.result)
+        if review is None:
+            result = await self._model_client.create(self._chat_history.messages)
+            review = result.content
         self._chat_history.append(
             AssistantMessage(
-                content=result.content, type="AssistantMessage", source="assistant"
+                content=review, type="AssistantMessage", source="assistant"
             )
         )
-        if result.content == "APPROVE" or result.content.__contains__("APPROVE"):
+        if review == "APPROVE" or review.__contains__("APPROVE"):
             await self.runtime.publish_message(
                 FinalResultMessage(user_task=message.user_task, result=message.result),
-                DefaultTopicId(),
+                DefaultTopicId(type=ctx.topic_id.type),
             )
         else:
             self.try_count += 1
@@ -277,23 +529,24 @@ class ReviewerAgent(RoutedAgent):
                     FinalResultMessage(
                         user_task=message.user_task,
                         result=f"The task failed after tried 3 times, Here is the final result: {message.result}",
+                        approved=False,
                     ),
-                    DefaultTopicId(),
+                    DefaultTopicId(type=ctx.topic_id.type),
                 )
             else:
                 await self.runtime.publish_message(
                     TaskReviewMessage(
                         user_task=message.user_task,
                         result=message.result,
-                        review=result.content,
+                        review=review,
                     ),
-                    DefaultTopicId(),
+                    DefaultTopicId(type=ctx.topic_id.type),
                 )
-        print(f"\n{'-'*80}\n{self.type}:\n{result.content}")
+        print(f"\n{'-'*80}\n{self.type}:\n{review}")
 
 
 @default_subscription
-class UserProxyAgent(RoutedAgent):
+class UserProxyAgent(TracedAgent):
     def __init__(self):
         super().__init__("user")
 
@@ -304,11 +557,11 @@ class UserProxyAgent(RoutedAgent):
         print(f"\n{'-'*80}\n Here is the final result:\n{message.result}")
         feedback = input("You can provide feedback or just press Enter to continue:")
         if feedback:
+            # The task's team is gone once the final result is out, so the
+            # feedback goes back to the MetaAgent as a new task.
             await self.runtime.publish_message(
-                TaskReviewMessage(
-                    user_task=message.user_task,
-                    result=message.result,
-                    review=feedback,
+                UserTaskMessage(
+                    user_task=f"{message.user_task}\n\nPrevious result:\n{message.result}\n\nFeedback: {feedback}",
                 ),
                 DefaultTopicId(),
             )
@@ -329,12 +582,16 @@ async def main():
             "json_output": True,
         },
     )
+    trace_from_env()
+    model_client = trace_client(cache_from_env(model_client))
+
+    blueprint_store = BlueprintStore()
 
     runtime = SingleThreadedAgentRuntime()
     await MetaAgent.register(
         runtime=runtime,
         type="MetaAgent",
-        factory=lambda: MetaAgent(model_client=model_client),
+        factory=lambda: MetaAgent(model_client=model_client, blueprint_store=blueprint_store),
     )
     await UserProxyAgent.register(
         runtime=runtime,
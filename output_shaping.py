@@ -0,0 +1,111 @@
+import hashlib
+from pathlib import Path
+from typing import List
+
+# About four characters per token, like chat_history.estimate_tokens.
+CHARS_PER_TOKEN = 4
+MAX_LINE_CHARS = 400
+
+
+def dedupe_lines(lines: List[str]) -> List[str]:
+    """Collapse runs of identical lines into one line with a repeat count."""
+    deduped: List[str] = []
+    i = 0
+    while i < len(lines):
+        j = i
+        while j + 1 < len(lines) and lines[j + 1] == lines[i]:
+            j += 1
+        count = j - i + 1
+        deduped.append(lines[i] if count == 1 else f"{lines[i]}  [repeated {count} times]")
+        i = j + 1
+    return deduped
+
+
+def _clip_line(line: str) -> str:
+    if len(line) <= MAX_LINE_CHARS:
+        return line
+    half = MAX_LINE_CHARS // 2
+    return f"{line[:half]} ...[{len(line) - MAX_LINE_CHARS} chars]... {line[-half:]}"
+
+
+class OutputShaper:
+    """Keeps execution output fed to the model within a token budget.
+
+    Repeated lines are collapsed and overlong lines clipped. When the output
+    is still too large, its head and tail lines are kept, or its head and
+    tail characters when not even one line fits. Whenever anything was
+    cut, the full output is spilled to a file in ``spill_dir`` and its path
+    is given in the shaped text. The tail gets the larger share since
+    errors end up there.
+    """
+
+    def __init__(self, token_budget: int = 1000, spill_dir: str | Path | None = "coding", head_fraction: float = 0.3) -> None:
+        self.token_budget = token_budget
+        self.spill_dir = Path(spill_dir) if spill_dir is not None else None
+        self.head_fraction = head_fraction
+        self.shaped = 0
+        self.spilled = 0
+
+    def spill(self, output: str, spill_dir: Path | None = None) -> Path | None:
+        spill_dir = spill_dir or self.spill_dir
+        if spill_dir is None:
+            return None
+        digest = hashlib.sha256(output.encode()).hexdigest()[:16]
+        path = spill_dir / f"output_{digest}.txt"
+        try:
+            spill_dir.mkdir(parents=True, exist_ok=True)
+            if not path.exists():
+                path.write_text(output)
+        except OSError:
+            return None
+        return path.resolve()
+
+    def _spill(self, output: str, spill_dir: str | Path | None) -> Path | None:
+        path = self.spill(output, Path(spill_dir) if spill_dir is not None else None)
+        if path is not None:
+            self.spilled += 1
+        return path
+
+    def shape(self, output: str, spill_dir: str | Path | None = None) -> str:
+        """Return output fitted to the budget; spill_dir overrides the shaper's own."""
+        budget = self.token_budget * CHARS_PER_TOKEN
+        if len(output) <= budget:
+            return output
+        self.shaped += 1
+        lines = [_clip_line(line) for line in dedupe_lines(output.splitlines())]
+        text = "\n".join(lines)
+        if len(text) <= budget:
+            path = self._spill(output, spill_dir)
+            if path is None:
+                return text
+            return f"{text}\n...[repeated lines collapsed and long lines clipped; the full output ({len(output)} chars) is in {path}]..."
+
+        head: List[str] = []
+        head_budget = int(budget * self.head_fraction)
+        size = 0
+        for line in lines:
+            if size + len(line) + 1 > head_budget:
+                break
+            head.append(line)
+            size += len(line) + 1
+        tail: List[str] = []
+        size = 0
+        for line in reversed(lines[len(head):]):
+            if size + len(line) + 1 > budget - head_budget:
+                break
+            tail.append(line)
+            size += len(line) + 1
+        tail.reverse()
+
+        if head or tail:
+            omitted = f"{len(lines) - len(head) - len(tail)} lines"
+        else:
+            # Not even one line fits, so cut the text itself.
+            head, tail = [text[:head_budget]], [text[len(text) - (budget - head_budget):]]
+            omitted = f"{len(text) - budget} chars"
+        path = self._spill(output, spill_dir)
+        if path is not None:
+            note = f"...[{omitted} omitted; the full output ({len(output)} chars) is in {path}]..."
+        else:
+            note = f"...[{omitted} omitted]..."
+        return "\n".join(head + [note] + tail)
@@ -0,0 +1,175 @@
+"""Warm worker process used by executor_pool.ExecutorPool.
+
+The worker reads one JSON request per line from stdin and writes one JSON
+response per line to stdout. Every request is run in a forked child, so the
+interpreter startup and preloaded imports are paid once per worker while each
+code block still gets a clean process.
+"""
+import importlib
+import json
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+
+from limited_exec import apply_rlimits
+
+LANGUAGE_COMMANDS = {"bash": "bash", "shell": "sh", "sh": "sh"}
+
+_current_child = None
+
+
+def _terminate(signum, frame):
+    if _current_child is not None:
+        try:
+            os.killpg(_current_child, signal.SIGKILL)
+        except OSError:
+            pass
+    os._exit(0)
+
+
+def preload(modules):
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception:
+            pass
+    return loaded
+
+
+def _run_child(request, write_fd):
+    # A forked child must never return into the worker's loop, which would
+    # then share the protocol pipes with the real worker.
+    try:
+        _child_main(request, write_fd)
+    except BaseException:
+        try:
+            os.write(write_fd, traceback.format_exc().encode("utf-8", errors="replace"))
+        except OSError:
+            pass
+    finally:
+        os._exit(1)
+
+
+def _child_main(request, write_fd):
+    os.setpgid(0, 0)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(devnull)
+    sys.stdin = open(os.devnull)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    apply_rlimits(request.get("rlimits", {}))
+    os.chdir(request["cwd"])
+    path = request["file"]
+    language = request["language"]
+    if language != "python":
+        command = LANGUAGE_COMMANDS[language]
+        os.execvp(command, [command, path])
+
+    import runpy
+
+    exit_code = 0
+    sys.argv = [path]
+    sys.path.insert(0, request["cwd"])
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # Hide the worker's own frames so the traceback reads like a plain run.
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb)
+        exit_code = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(exit_code)
+
+
+def run_file(request):
+    global _current_child
+
+    read_fd, write_fd = os.pipe()
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        _run_child(request, write_fd)
+    _current_child = pid
+    os.close(write_fd)
+
+    deadline = time.monotonic() + request["timeout"]
+    chunks = []
+    timed_out = False
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        ready, _, _ = select.select([read_fd], [], [], remaining)
+        if not ready:
+            continue
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_fd)
+
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    _, status = os.waitpid(pid, 0)
+    _current_child = None
+
+    output = b"".join(chunks).decode("utf-8", errors="replace")
+    if timed_out:
+        # Same exit code as the timeout command on linux.
+        return {"exit_code": 124, "output": output + "\n Timeout"}
+    return {"exit_code": os.waitstatus_to_exitcode(status), "output": output}
+
+
+def handle(request):
+    if request["op"] == "preload":
+        return {"loaded": preload(request["modules"])}
+    if request["op"] == "run":
+        return run_file(request)
+    raise ValueError(f"unknown op {request['op']}")
+
+
+def main():
+    signal.signal(signal.SIGTERM, _terminate)
+    apply_rlimits(json.loads(os.environ.pop("WORKER_RLIMITS", "{}")))
+    protocol_out = os.fdopen(os.dup(1), "w")
+    # Anything the worker itself prints must not corrupt the protocol stream.
+    os.dup2(2, 1)
+    preload([m for m in sys.argv[1:] if m])
+    protocol_out.write(json.dumps({"ready": True}) + "\n")
+    protocol_out.flush()
+    for line in sys.stdin:
+        try:
+            response = handle(json.loads(line))
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        protocol_out.write(json.dumps(response) + "\n")
+        protocol_out.flush()
+
+
+if __name__ == "__main__":
+    main()
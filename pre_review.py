@@ -0,0 +1,137 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+MISSING_MODULE = re.compile(r"(?:ModuleNotFoundError|ImportError): No module named '([\w.]+)'")
+TRACEBACK = re.compile(r"^Traceback \(most recent call last\):$", re.MULTILINE)
+FRAME = re.compile(r'^\s*File "([^"]+)", line (\d+)(?:, in (\S+))?\n(?:\s+(\S.*)\n)?', re.MULTILINE)
+EXCEPTION_LINE = re.compile(r"^(\w+(?:\.\w+)*(?:Error|Exception|Exit|Interrupt|Warning)\b.*)$", re.MULTILINE)
+# execute_code reports the exit code in its text (see execute_code_tool.format_code_result).
+EXIT_CODE_TEXT = re.compile(r"POSIX exit code(?: was)?: (-?\d+)")
+NO_OUTPUT_TEXT = "The script ran but produced no output to console."
+# Import names whose pip package is named differently.
+PIP_NAMES = {
+    "PIL": "pillow",
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "sklearn": "scikit-learn",
+    "yaml": "pyyaml",
+}
+
+
+@dataclass
+class ExecutionResult:
+    output: str
+    exit_code: Optional[int] = None
+    code: str = ""
+
+
+Rule = Callable[[ExecutionResult], Optional[str]]
+
+
+def exit_code_from_text(text: str) -> Optional[int]:
+    """The exit code reported in text; of several joined tool results, the first non-zero one."""
+    exit_codes = [int(exit_code) for exit_code in EXIT_CODE_TEXT.findall(text)]
+    if not exit_codes:
+        return None
+    return next((exit_code for exit_code in exit_codes if exit_code != 0), 0)
+
+
+def _tail(text: str, lines: int = 5) -> str:
+    return "\n".join(text.strip().splitlines()[-lines:])
+
+
+def pip_name(module: str) -> str:
+    module = module.split(".")[0]
+    return PIP_NAMES.get(module, module)
+
+
+def missing_module(result: ExecutionResult) -> Optional[str]:
+    if result.exit_code == 0:
+        # The script handled the ImportError, e.g. with a fallback.
+        return None
+    modules = list(dict.fromkeys(MISSING_MODULE.findall(result.output)))
+    if not modules:
+        return None
+    names = ", ".join(f"'{module}'" for module in modules)
+    packages = " ".join(dict.fromkeys(pip_name(module) for module in modules))
+    return (
+        f"The code failed because {'the module' if len(modules) == 1 else 'the modules'} {names} "
+        f"{'is' if len(modules) == 1 else 'are'} not installed. "
+        f"Install {'it' if len(modules) == 1 else 'them'} first in the same script "
+        f"(e.g. `pip install {packages}` in a bash block before the Python block) "
+        "or use the standard library instead."
+    )
+
+
+def traceback_error(result: ExecutionResult) -> Optional[str]:
+    if result.exit_code == 0:
+        # A handled exception that was logged, e.g. with traceback.print_exc().
+        return None
+    tracebacks = list(TRACEBACK.finditer(result.output))
+    if not tracebacks:
+        return None
+    text = result.output[tracebacks[-1].end():]
+    frames = FRAME.findall(text)
+    exceptions = EXCEPTION_LINE.findall(text)
+    error = exceptions[-1].strip() if exceptions else _tail(text, 1)
+    where = ""
+    if frames:
+        file_name, line, function, source = frames[-1]
+        where = f" at line {line}" + (f" in {function}" if function and function != "<module>" else "")
+        if source:
+            where += f": `{source.strip()}`"
+    return f"The code raised an exception{where}.\n{error}\nFix this error and make sure the script runs to completion."
+
+
+def nonzero_exit(result: ExecutionResult) -> Optional[str]:
+    if result.exit_code is None or result.exit_code == 0:
+        return None
+    if result.exit_code == 124:
+        return "The code timed out and was killed. Make it finish faster, e.g. avoid waiting on input, long sleeps or unbounded loops."
+    return f"The code exited with code {result.exit_code}. The end of its output was:\n{_tail(result.output)}"
+
+
+def empty_output(result: ExecutionResult) -> Optional[str]:
+    if result.exit_code == 0:
+        # A script may only save files, e.g. figures; the model reviewer decides.
+        return None
+    if result.output.strip() and NO_OUTPUT_TEXT not in result.output:
+        return None
+    return "The code ran but printed nothing, so the result cannot be checked. Print the result to stdout."
+
+
+DEFAULT_RULES: List[Rule] = [missing_module, traceback_error, nonzero_exit, empty_output]
+
+
+class PreReviewer:
+    """Rule-based review of execution results, run before the LLM reviewer.
+
+    Each rule returns feedback for the coder when it recognizes an obvious
+    failure, or None. The first feedback wins; when no rule fires the result
+    is plausible and goes to the model.
+    """
+
+    def __init__(self, rules: List[Rule] | None = None) -> None:
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.rejected = 0
+        self.passed = 0
+
+    def add_rule(self, rule: Rule, first: bool = False) -> None:
+        if first:
+            self.rules.insert(0, rule)
+        else:
+            self.rules.append(rule)
+
+    def review(self, output: str, exit_code: Optional[int] = None, code: str = "") -> Optional[str]:
+        if exit_code is None:
+            exit_code = exit_code_from_text(output)
+        result = ExecutionResult(output=output, exit_code=exit_code, code=code)
+        for rule in self.rules:
+            feedback = rule(result)
+            if feedback:
+                self.rejected += 1
+                return feedback
+        self.passed += 1
+        return None
@@ -0,0 +1,250 @@
+import asyncio
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock
+from autogen_ext.code_executors.local import CommandLineCodeResult
+
+from execution_scheduler import Limits, current_session, get_scheduler
+from import_stats import find_missing_modules, import_stats, missing_modules_output
+from executor_pool import (
+    PYTHON_VARIANTS,
+    ExecutorPool,
+    PoolWorker,
+    WorkerCrashed,
+    _running_loop,
+    get_executor_pool,
+    write_code_file,
+)
+from tracing import CODE, tracer
+from workspaces import WorkspaceManager
+
+KERNEL_SCRIPT = str(Path(__file__).with_name("kernel_worker.py"))
+STATE_LOST = "The Python kernel was restarted, so variables and imports from earlier runs are gone."
+
+
+class Kernel:
+    """A long-lived interpreter whose globals survive between runs.
+
+    It is started on first use and again after a crash or a timeout, which
+    lose its state; the output of that run says so. Once stopped it is not
+    started again.
+    """
+
+    def __init__(self, preload: Sequence[str] = (), rlimits: Dict[str, int] | None = None) -> None:
+        self._worker = PoolWorker(preload, script=KERNEL_SCRIPT, rlimits=rlimits)
+        self._lock = asyncio.Lock()
+        self._stopped = False
+        self.restarts = -1
+        self.last_used = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, payload: Dict, timeout: float) -> Dict:
+        async with self._lock:
+            if self._stopped:
+                return {"exit_code": 1, "output": f"\nThe Python kernel was stopped before this run started.\n{STATE_LOST}"}
+            self.last_used = time.monotonic()
+            try:
+                if not self._worker.alive:
+                    await self._worker.start()
+                    self.restarts += 1
+                return await asyncio.wait_for(self._worker.request(payload), timeout)
+            except asyncio.TimeoutError:
+                await self._worker.kill()
+                return {"exit_code": 124, "output": f"\n Timeout\n{STATE_LOST}"}
+            except (WorkerCrashed, ConnectionError) as e:
+                await self._worker.kill()
+                return {"exit_code": 1, "output": f"\nThe Python kernel died ({e}); e.g. it ran out of memory.\n{STATE_LOST}"}
+            except asyncio.CancelledError:
+                await self._worker.kill()
+                raise
+
+    async def stop(self) -> None:
+        """Stop the kernel once its current run, if any, has finished."""
+        async with self._lock:
+            self._stopped = True
+            await self._worker.stop()
+
+    def abandon(self) -> None:
+        self._stopped = True
+        self._worker.abandon()
+
+
+class KernelCodeExecutor:
+    """A CodeExecutor that runs Python blocks in one persistent kernel per session.
+
+    Imports, variables and fetched data stay loaded between the runs of a
+    session, so a retried script skips the work it did before. Other
+    languages run statelessly on ``pool``. The session comes from the
+    execution scheduler's job context. At most ``max_kernels`` kernels are
+    kept; the least recently used idle one is stopped to make room. When
+    every kernel is busy, a new session's kernel is started anyway, so the
+    count can exceed ``max_kernels`` until some of them go idle.
+    ``memory_mb`` caps each kernel's address space.
+    """
+
+    def __init__(
+        self,
+        pool: ExecutorPool,
+        max_kernels: int = 8,
+        timeout: float | None = None,
+        memory_mb: int | None = None,
+        preload: Sequence[str] = (),
+    ) -> None:
+        self._pool = pool
+        self._max_kernels = max_kernels
+        self._timeout = timeout or pool.timeout
+        self._memory_mb = memory_mb
+        self._preload = list(preload)
+        self._kernels: OrderedDict[str, Kernel] = OrderedDict()
+        # The kernels' pipes belong to the loop they were started on.
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def pool(self) -> ExecutorPool:
+        return self._pool
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop | None:
+        return self._loop
+
+    @property
+    def work_dir(self) -> Path:
+        return self._pool.work_dir
+
+    @property
+    def workspaces(self) -> WorkspaceManager | None:
+        return self._pool.workspaces
+
+    def work_dir_for(self, session: str) -> Path:
+        return self._pool.work_dir_for(session)
+
+    def work_dir_of(self, session: str) -> Path:
+        return self._pool.work_dir_of(session)
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    def _rlimits(self) -> Dict[str, int]:
+        rlimits = get_scheduler().default_limits.to_rlimits()
+        # CPU time adds up over the kernel's whole life; runs are bounded by the timeout instead.
+        rlimits.pop("RLIMIT_CPU", None)
+        rlimits.update(Limits(memory_mb=self._memory_mb).to_rlimits())
+        return rlimits
+
+    async def _kernel(self, session: str) -> Kernel:
+        kernel = self._kernels.get(session)
+        if kernel is None:
+            idle = [name for name, k in self._kernels.items() if not k.busy]
+            while len(self._kernels) >= self._max_kernels and idle:
+                await self._kernels.pop(idle.pop(0)).stop()
+            preload = self._preload + [module for module in import_stats.hot() if module not in self._preload]
+            kernel = self._kernels[session] = Kernel(preload, self._rlimits())
+            self._loop = asyncio.get_running_loop()
+        self._kernels.move_to_end(session)
+        return kernel
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CommandLineCodeResult:
+        languages = ",".join(code_block.language for code_block in code_blocks)
+        with tracer.span("execute_code_blocks", CODE, blocks=len(code_blocks), languages=languages, kernel=True) as span:
+            result = await self._execute_code_blocks(code_blocks, cancellation_token)
+            if span is not None:
+                span.attrs["exit_code"] = result.exit_code
+        return result
+
+    async def _execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CommandLineCodeResult:
+        session = current_session()
+        import_stats.record(code_blocks)
+        missing = find_missing_modules(code_blocks, self.work_dir_for(session))
+        if missing:
+            return CommandLineCodeResult(exit_code=1, output=missing_modules_output(missing), code_file=None)
+        logs_all = ""
+        exitcode = 0
+        code_file = None
+        for code_block in code_blocks:
+            if code_block.language.lower() not in PYTHON_VARIANTS:
+                result = await self._pool.execute_code_blocks([code_block], cancellation_token)
+                logs_all += result.output
+                exitcode = result.exit_code
+                code_file = code_file or result.code_file
+            else:
+                work_dir = self.work_dir_for(session)
+                written_file = write_code_file(work_dir, code_block.code, "python")
+                code_file = code_file or str(written_file)
+                payload = {"op": "run", "file": str(written_file), "cwd": str(work_dir.resolve())}
+                async with get_scheduler().slot():
+                    kernel = await self._kernel(session)
+                    task = asyncio.create_task(kernel.run(payload, self._timeout))
+                    cancellation_token.link_future(task)
+                    try:
+                        response = await task
+                    except asyncio.CancelledError:
+                        logs_all += f"\n Cancelled\n{STATE_LOST}"
+                        exitcode = 125
+                        break
+                logs_all += response["output"]
+                exitcode = response["exit_code"]
+            if exitcode != 0:
+                break
+        return CommandLineCodeResult(exit_code=exitcode, output=logs_all, code_file=code_file)
+
+    def release_session(self, session: str) -> None:
+        """Stop the session's kernel in the background, once its current run ends, and release its workspace."""
+        kernel = self._kernels.pop(session, None)
+        if kernel is not None:
+            asyncio.ensure_future(kernel.stop())
+        self._pool.release_session(session)
+
+    async def restart(self) -> None:
+        await self.stop()
+
+    async def stop(self) -> None:
+        kernels = list(self._kernels.values())
+        self._kernels.clear()
+        self._loop = None
+        await asyncio.gather(*[kernel.stop() for kernel in kernels])
+
+    def abandon(self) -> None:
+        """Kill the kernels of an executor whose event loop has closed."""
+        for kernel in self._kernels.values():
+            kernel.abandon()
+        self._kernels.clear()
+        self._loop = None
+
+
+_shared_kernels: Dict[str, KernelCodeExecutor] = {}
+
+
+def get_kernel_executor(work_dir: str | Path = "coding") -> KernelCodeExecutor:
+    """Return the process-wide kernel executor for work_dir, on top of its shared pool.
+
+    An executor whose kernels were started on another event loop, or whose
+    pool was replaced for that reason, is dropped and its kernels are killed.
+    """
+    key = str(Path(work_dir).resolve())
+    pool = get_executor_pool(work_dir=work_dir)
+    executor = _shared_kernels.get(key)
+    if executor is not None and (
+        executor.pool is not pool or executor.loop not in (None, _running_loop())
+    ):
+        executor.abandon()
+        executor = None
+    if executor is None:
+        executor = _shared_kernels[key] = KernelCodeExecutor(pool)
+    return executor
+
+
+async def stop_kernel_executors() -> None:
+    await asyncio.gather(*[executor.stop() for executor in _shared_kernels.values()])
+    _shared_kernels.clear()
@@ -3,7 +3,6 @@ import asyncio
 from autogen_core.tools import FunctionTool
 from autogen_core import (
     DefaultTopicId,
-    RoutedAgent,
     SingleThreadedAgentRuntime,
     default_subscription,
     message_handler,
@@ -17,8 +16,11 @@ from autogen_core import CancellationToken
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 
-from execute_tool_call import execute_tool_call
+from execute_tool_call import ToolRegistry
 from execute_code_tool import execute_code
+from llm_cache import cache_from_env
+from tracing import TracedAgent, trace_client, trace_from_env
+from chat_history import CODE, TASK, TOOL_OUTPUT, ChatHistory
 
 
 @dataclass
@@ -27,12 +29,20 @@ class UserTaskMessage:
 
 
 @default_subscription
-class ReactAgent(RoutedAgent):
-    def __init__(self, model_client: OpenAIChatCompletionClient):
+class ReactAgent(TracedAgent):
+    def __init__(
+        self,
+        model_client: OpenAIChatCompletionClient,
+        max_steps: int = 10,
+        max_seconds: float = 600,
+        max_concurrent_tools: int = 4,
+        tool_timeout: float | None = None,
+    ):
         super().__init__("react_agent")
         self._model_client = model_client
-        self._chat_history = []
-        self._chat_history.append(
+        self._max_steps = max_steps
+        self._max_seconds = max_seconds
+        self._chat_history = ChatHistory(
             SystemMessage(
                 content="""You are an AI following the ReAct paradigm.
                 You can write code and execute it to solve problems when needed. 
@@ -50,69 +60,86 @@ class ReactAgent(RoutedAgent):
                 func=execute_code,
             )
         )
+        self._tool_registry = ToolRegistry(
+            self._tools, max_concurrency=max_concurrent_tools, default_timeout=tool_timeout
+        )
 
     @message_handler
     async def on_message(self, message: UserTaskMessage, ctx) -> None:
         self._chat_history.append(
-            UserMessage(source="user", content=message.content, type="UserMessage")
+            UserMessage(source="user", content=message.content, type="UserMessage"),
+            kind=TASK,
         )
-        result = await self._model_client.create(
-            messages=self._chat_history, tools=self._tools
-        )
-        if isinstance(result.content, str):
-            print(f"\n{'-'*80}\nreact_agent:\n{result.content}")
-            return
-
-        if isinstance(result.content, list):
-            await self.do_react(result)
-
+        answer = await self.do_react()
         print("Result:")
-        print(self._chat_history[len(self._chat_history) - 1].content)
-
-    async def do_react(self, result):
-        results = await asyncio.gather(
-            *[
-                execute_tool_call(self._tools, call, CancellationToken())
-                for call in result.content
-            ]
-        )
-        print(f"\n{'-'*80}\nreact_agent:\n{results}")
-        self._chat_history.append(
-            AssistantMessage(
-                source="assistant",
-                content=f"reasioning: {result.content}",
-                type="AssistantMessage",
-            )
-        )
-        self._chat_history.append(
-            SystemMessage(
-                source="assistant",
-                content=f"action result: {results[0].content} \n Should I continue?",
-                type="SystemMessage",
+        print(answer)
+
+    async def do_react(self) -> str:
+        """Reason and act until the model answers in text or a step or time limit is hit."""
+        deadline = asyncio.get_running_loop().time() + self._max_seconds
+        cancellation_token = CancellationToken()
+        for step in range(1, self._max_steps + 1):
+            try:
+                result = await asyncio.wait_for(
+                    self._model_client.create(
+                        messages=self._chat_history.messages, tools=self._tools
+                    ),
+                    max(0, deadline - asyncio.get_running_loop().time()),
+                )
+            except asyncio.TimeoutError:
+                break
+            if isinstance(result.content, str):
+                print(f"\n{'-'*40}\nreact_agent{'-'*40}:\n{result.content}")
+                self._chat_history.append(
+                    SystemMessage(
+                        source="assistant",
+                        content=result.content,
+                        type="SystemMessage",
+                    )
+                )
+                return result.content
+
+            try:
+                results = await asyncio.wait_for(
+                    self._tool_registry.dispatch(result.content, cancellation_token),
+                    max(0, deadline - asyncio.get_running_loop().time()),
+                )
+            except asyncio.TimeoutError:
+                cancellation_token.cancel()
+                break
+            print(f"\n{'-'*80}\nreact_agent (step {step}):\n{results}")
+            # Feed back every result, not only the first, so parallel calls are not wasted.
+            names = {call.id: call.name for call in result.content}
+            action_results = "\n".join(
+                f"[{names.get(r.call_id, 'tool')} {r.call_id}] {r.content.strip()}" for r in results
             )
-        )
-        self._chat_history.append(
-            UserMessage(
-                source="user",
-                content=f"Received feedback:{results[0].content} . What should we do next?",
-                type="UserMessage",
+            self._chat_history.append(
+                AssistantMessage(
+                    source="assistant",
+                    content=f"reasioning: {result.content}",
+                    type="AssistantMessage",
+                ),
+                kind=CODE,
             )
-        )
-        result = await self._model_client.create(
-            messages=self._chat_history, tools=self._tools
-        )
-        if isinstance(result.content, str):
-            print(f"\n{'-'*40}\nreact_agent{'-'*40}:\n{result.content}")
             self._chat_history.append(
                 SystemMessage(
                     source="assistant",
-                    content=result.content,
+                    content=f"action result: {action_results} \n Should I continue?",
                     type="SystemMessage",
-                )
+                ),
+                kind=TOOL_OUTPUT,
             )
-            return
-        if isinstance(result.content, list):
-            await self.do_react(result)
+            self._chat_history.append(
+                UserMessage(
+                    source="user",
+                    content="Received feedback from the actions above. What should we do next?",
+                    type="UserMessage",
+                ),
+            )
+
+        stopped = f"Stopped without a final answer after reaching the limit of {self._max_steps} steps or {self._max_seconds} seconds."
+        print(f"\n{'-'*80}\nreact_agent:\n{stopped}")
+        return stopped
 
 
 async def main():
@@ -130,6 +157,8 @@ async def main():
             "json_output": True,
         },
     )
+    trace_from_env()
+    model_client = trace_client(cache_from_env(model_client))
 
     runtime = SingleThreadedAgentRuntime()
     await ReactAgent.register(
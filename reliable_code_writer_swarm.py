@@ -1,57 +1,45 @@
-from asyncio import subprocess
 import os
-import subprocess
+import sys
 import asyncio
 
 from autogen_agentchat.ui import Console
-from autogen_agentchat.agents import CodeExecutorAgent, AssistantAgent, UserProxyAgent
-from autogen_agentchat.messages import TextMessage
-from autogen_core import CancellationToken
-from autogen_ext.code_executors.local import LocalCommandLineCodeExecutor
+from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
+from autogen_core.models import ChatCompletionClient
 from autogen_ext.models.openai import OpenAIChatCompletionClient
-from typing_extensions import Annotated
 from autogen_core.tools import FunctionTool
 from autogen_agentchat.teams import Swarm
 from autogen_agentchat.conditions import (
     HandoffTermination,
 )
 
-
-async def main():
-    # Create the agents
-    os.environ["OPENAI_API_KEY"] = ""
-    api_key = os.getenv("OPENAI_API_KEY")
-    model_client = OpenAIChatCompletionClient(
-        api_key=api_key,
-        base_url="https://api.deepseek.com",
-        model="deepseek-chat",
-        model_capabilities={
-            "vision": False,
-            "function_calling": True,
-            "json_output": True,
-        },
-    )
-
-    async def execute_code(
-        code: Annotated[str, "Code to execute"],
-        language: Annotated[str, "Language of the code"] = "python",
-    ):
-        executor = LocalCommandLineCodeExecutor(work_dir="coding")
-        code_executor = CodeExecutorAgent(
-            "code_executor",
-            code_executor=executor,
-        )
-
-        code = f"```{language}\n{code}```"
-
-        # Run the agent with a given code snippet.
-        task = TextMessage(
-            content=code,
-            source="user",
-        )
-        response = await code_executor.on_messages([task], CancellationToken())
-        return response.chat_message.content
-
+from execute_code_tool import execute_code
+from execution_scheduler import TEST, job_context
+from llm_cache import cache_from_env
+from tracing import trace_client, trace_from_env
+from subprocess_runner import ProcessResult, run_subprocess
+from sharded_tests import can_shard, run_sharded_tests
+
+TEST_TIMEOUT = 120
+TEST_MAX_OUTPUT_BYTES = 32 * 1024
+# Run the test functions of a test file in parallel shards instead of one process.
+# Off by default; files with module level code other than definitions always run in one process.
+TEST_SHARDING = False
+TEST_FAIL_FAST = False
+
+
+def format_process_result(result: ProcessResult, timeout: float) -> str:
+    output = result.stdout
+    if result.stderr:
+        output += f"\nstderr:\n{result.stderr}"
+    if result.timed_out:
+        output += f"\nThe test run timed out after {timeout} seconds and was killed."
+    elif result.exit_code != 0:
+        output += f"\nThe test run exited with code {result.exit_code}."
+    return output
+
+
+def create_team(model_client: ChatCompletionClient) -> Swarm:
+    """Build the writer/tester swarm; it stops when an agent hands off to the user."""
     execute_code_tool = FunctionTool(
         execute_code,
         name="execute_code",
@@ -131,10 +119,19 @@ async def main():
     async def execute_test_code(file_path: str) -> str:
         """Execute the code file at the specified path."""
         try:
-            result = subprocess.run(
-                ["python", file_path], capture_output=True, text=True
-            )
-            return result.stdout
+            # Test runs are admitted ahead of exploratory code runs.
+            with job_context(priority=TEST):
+                if TEST_SHARDING and can_shard(file_path):
+                    report = await run_sharded_tests(
+                        file_path, fail_fast=TEST_FAIL_FAST, timeout=TEST_TIMEOUT
+                    )
+                    return report.format()
+                result = await run_subprocess(
+                    [sys.executable, file_path],
+                    timeout=TEST_TIMEOUT,
+                    max_output_bytes=TEST_MAX_OUTPUT_BYTES,
+                )
+            return format_process_result(result, TEST_TIMEOUT)
         except Exception as e:
             return f"Error executing code: {e}"
 
@@ -183,11 +180,31 @@ async def main():
     #             )
     # task = response.chat_message.content
 
-    team = Swarm(
+    return Swarm(
         [code_writer_agent, code_tester_agent, user_proxy_agent],
         termination_condition=termination,
     )
 
+
+async def main():
+    # Create the agents
+    os.environ["OPENAI_API_KEY"] = ""
+    api_key = os.getenv("OPENAI_API_KEY")
+    model_client = OpenAIChatCompletionClient(
+        api_key=api_key,
+        base_url="https://api.deepseek.com",
+        model="deepseek-chat",
+        model_capabilities={
+            "vision": False,
+            "function_calling": True,
+            "json_output": True,
+        },
+    )
+    trace_from_env()
+    model_client = trace_client(cache_from_env(model_client))
+
+    team = create_team(model_client)
+
     while True:
         task = input("Enter task: ")
         if task == "exit":
@@ -0,0 +1,157 @@
+import platform
+import re
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import sha256
+from importlib import metadata
+from typing import List
+
+from autogen_core import CancellationToken
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+
+from execution_scheduler import current_session
+
+# A block containing this comment is always executed, never served from cache.
+NO_CACHE_MARKER = re.compile(r"^\s*(#|//|--)\s*no-?cache\b", re.IGNORECASE | re.MULTILINE)
+
+
+@lru_cache(maxsize=None)
+def _packages_digest() -> str:
+    packages = sorted(
+        f"{dist.metadata['Name']}=={dist.version}" for dist in metadata.distributions()
+    )
+    return sha256("\n".join(packages).encode()).hexdigest()
+
+
+@lru_cache(maxsize=1024)
+def environment_fingerprint(work_dir: str = "") -> str:
+    """Identify the interpreter, installed packages and working directory."""
+    parts = [sys.executable, platform.python_version(), platform.platform(), _packages_digest(), str(work_dir)]
+    return sha256("\0".join(parts).encode()).hexdigest()
+
+
+def is_cacheable(code_block: CodeBlock) -> bool:
+    return NO_CACHE_MARKER.search(code_block.code) is None
+
+
+@dataclass
+class CachedResult:
+    exit_code: int
+    output: str
+    size: int
+
+
+class ExecutionResultCache:
+    """LRU cache of execution results, bounded by entry count and output size."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, CachedResult] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(code_blocks: List[CodeBlock], fingerprint: str) -> str:
+        digest = sha256(fingerprint.encode())
+        for block in code_blocks:
+            digest.update(b"\0" + block.language.lower().encode() + b"\0")
+            digest.update(sha256(block.code.encode()).digest())
+        return digest.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> CachedResult | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, result: CodeResult) -> None:
+        size = len(result.output.encode("utf-8", errors="replace"))
+        if size > self._max_bytes:
+            return
+        self.discard(key)
+        self._entries[key] = CachedResult(exit_code=result.exit_code, output=result.output, size=size)
+        self._bytes += size
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+
+class CachingCodeExecutor:
+    """A CodeExecutor that serves repeated code from an ExecutionResultCache.
+
+    Only successful runs are stored, so failures caused by flaky networks or
+    missing files are retried. Blocks marked with a ``# no-cache`` comment,
+    or calls made with ``cacheable=False``, always go to the wrapped executor.
+    The key includes the directory the code runs in, which is the session's
+    workspace when the wrapped executor has one per session.
+    """
+
+    def __init__(self, code_executor: CodeExecutor, cache: ExecutionResultCache) -> None:
+        self._code_executor = code_executor
+        self._cache = cache
+
+    def _fingerprint(self) -> str:
+        work_dir_of = getattr(self._code_executor, "work_dir_of", None)
+        if work_dir_of is not None:
+            return environment_fingerprint(str(work_dir_of(current_session())))
+        return environment_fingerprint(str(getattr(self._code_executor, "work_dir", "")))
+
+    @property
+    def cache(self) -> ExecutionResultCache:
+        return self._cache
+
+    def __getattr__(self, name):
+        return getattr(self._code_executor, name)
+
+    async def execute_code_blocks(
+        self,
+        code_blocks: List[CodeBlock],
+        cancellation_token: CancellationToken,
+        cacheable: bool = True,
+    ) -> CodeResult:
+        if not cacheable or not all(is_cacheable(block) for block in code_blocks):
+            return await self._code_executor.execute_code_blocks(code_blocks, cancellation_token)
+
+        key = self._cache.make_key(code_blocks, self._fingerprint())
+        cached = self._cache.get(key)
+        if cached is not None:
+            return CodeResult(exit_code=cached.exit_code, output=cached.output)
+
+        result = await self._code_executor.execute_code_blocks(code_blocks, cancellation_token)
+        if result.exit_code == 0:
+            self._cache.put(key, result)
+        return result
+
+    async def restart(self) -> None:
+        await self._code_executor.restart()
@@ -0,0 +1,50 @@
+"""Forgetting agents that an agent runtime no longer needs.
+
+autogen has no public API to drop agent instances, unregister an agent
+type or forget the recipients cached for a topic, so this reaches into the
+private attributes of SingleThreadedAgentRuntime (and the gRPC worker
+runtime, which has the same ones). They were checked against the autogen
+version pinned in requirements.txt; when they are missing, forget_agents
+raises instead of silently keeping every agent alive.
+"""
+from typing import Any, Callable, Iterable
+
+from autogen_core import AgentId, AgentRuntime, TopicId
+
+_RUNTIME_ATTRIBUTES = ("_instantiated_agents", "_agent_factories", "_subscription_manager")
+_SUBSCRIPTION_ATTRIBUTES = ("_seen_topics", "_subscribed_recipients")
+
+
+def _internals(runtime: AgentRuntime) -> tuple[Any, Any, Any]:
+    missing = [name for name in _RUNTIME_ATTRIBUTES if not hasattr(runtime, name)]
+    if not missing:
+        subscriptions = runtime._subscription_manager
+        missing = [f"_subscription_manager.{name}" for name in _SUBSCRIPTION_ATTRIBUTES if not hasattr(subscriptions, name)]
+    if missing:
+        raise RuntimeError(
+            f"{type(runtime).__name__} has no {', '.join(missing)}; forget_agents() needs the runtime "
+            "internals of the autogen version pinned in requirements.txt."
+        )
+    return runtime._instantiated_agents, runtime._agent_factories, runtime._subscription_manager
+
+
+def forget_agents(
+    runtime: AgentRuntime,
+    agents: Callable[[AgentId], bool],
+    topics: Callable[[TopicId], bool],
+    agent_types: Iterable[str] = (),
+) -> None:
+    """Drop the instances for which agents() is true, the factories of agent_types and the recipients of topics.
+
+    A dropped instance is created again by its factory when a message
+    reaches it. Forgetting a topic keeps its recipient list from being
+    rebuilt on every new subscription.
+    """
+    instances, factories, subscriptions = _internals(runtime)
+    for agent_id in [agent_id for agent_id in instances if agents(agent_id)]:
+        del instances[agent_id]
+    for agent_type in agent_types:
+        factories.pop(agent_type, None)
+    for seen in [topic for topic in subscriptions._seen_topics if topics(topic)]:
+        subscriptions._seen_topics.discard(seen)
+        subscriptions._subscribed_recipients.pop(seen, None)
@@ -0,0 +1,104 @@
+"""Runs a subset of the tests in one test file and writes a JSON report.
+
+Usage: python shard_worker.py REPORT_PATH TEST_FILE [--fail-fast] NAME [NAME ...]
+
+NAME is either a module level test function or Class.method.
+"""
+import contextlib
+import importlib.util
+import inspect
+import io
+import json
+import os
+import sys
+import time
+import traceback
+import unittest
+
+
+def load_module(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    sys.path.insert(0, directory)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    # Not run as __main__, so `if __name__ == "__main__": unittest.main()` stays inert.
+    spec.loader.exec_module(module)
+    return module
+
+
+def short_error(exc, path):
+    tb = exc.__traceback__
+    frames = [f for f in traceback.extract_tb(tb) if os.path.abspath(f.filename) == os.path.abspath(path)]
+    where = f" (line {frames[-1].lineno}: {frames[-1].line})" if frames else ""
+    message = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    return f"{message}{where}"
+
+
+def run_test(module, name, path):
+    if "." in name:
+        class_name, method_name = name.split(".", 1)
+        cls = getattr(module, class_name)
+        if issubclass(cls, unittest.TestCase):
+            result = unittest.TestResult()
+            # A suite also runs setUpClass/tearDownClass.
+            unittest.TestSuite([cls(method_name)]).run(result)
+            problems = result.failures + result.errors
+            if problems:
+                return problems[0][1].strip().splitlines()[-1]
+            return None
+        instance = cls()
+        func = getattr(instance, method_name)
+        if hasattr(instance, "setup_method"):
+            instance.setup_method(func)
+    else:
+        func = getattr(module, name)
+    try:
+        result = func()
+        if inspect.iscoroutine(result):
+            import asyncio
+
+            asyncio.run(result)
+    except Exception as e:
+        return short_error(e, path)
+    return None
+
+
+def main():
+    report_path, test_file = sys.argv[1], sys.argv[2]
+    names = sys.argv[3:]
+    fail_fast = "--fail-fast" in names
+    names = [n for n in names if n != "--fail-fast"]
+
+    results = []
+    try:
+        module = load_module(test_file)
+    except Exception as e:
+        results = [{"name": n, "ok": False, "error": f"import failed: {short_error(e, test_file)}", "seconds": 0} for n in names]
+        names = []
+    for name in names:
+        start = time.perf_counter()
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                error = run_test(module, name, test_file)
+        except Exception as e:
+            error = short_error(e, test_file)
+        results.append(
+            {
+                "name": name,
+                "ok": error is None,
+                "error": error,
+                "seconds": time.perf_counter() - start,
+                "output": output.getvalue(),
+            }
+        )
+        if error is not None and fail_fast:
+            break
+    with open(report_path, "w") as f:
+        json.dump(results, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import ast
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List
+
+from subprocess_runner import run_subprocess
+
+SHARD_WORKER = str(Path(__file__).with_name("shard_worker.py"))
+
+
+# Module level statements that only define things, so importing the module once per shard is harmless.
+DEFINITIONS = (
+    ast.Import,
+    ast.ImportFrom,
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+    ast.Assign,
+    ast.AnnAssign,
+    ast.Pass,
+)
+
+
+@dataclass
+class TestFile:
+    # Tests that can be called without arguments.
+    names: List[str] = field(default_factory=list)
+    # Tests that take arguments, e.g. pytest fixtures; the shards cannot provide them.
+    needs_arguments: List[str] = field(default_factory=list)
+    # Module level code other than definitions, e.g. test calls or prints, which every shard would repeat.
+    top_level_code: bool = False
+
+
+def _takes_arguments(node: ast.FunctionDef | ast.AsyncFunctionDef, method: bool) -> bool:
+    args = node.args
+    positional = (args.posonlyargs + args.args)[1 if method else 0 :]
+    required = len(positional) - len(args.defaults)
+    return required > 0 or any(default is None for default in args.kw_defaults)
+
+
+def _is_main_guard(node: ast.stmt) -> bool:
+    return isinstance(node, ast.If) and "__main__" in ast.unparse(node.test) and "__name__" in ast.unparse(node.test)
+
+
+def _is_docstring(node: ast.stmt) -> bool:
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+
+
+def inspect_test_file(file_path: str) -> TestFile:
+    """Find module level test_* functions and test_* methods of Test* classes."""
+    with open(file_path, "r") as f:
+        source = f.read()
+    test_file = TestFile()
+    try:
+        tree = ast.parse(source, filename=file_path)
+    except SyntaxError:
+        # Let a plain run report the syntax error.
+        return test_file
+
+    def add(name: str, node: ast.FunctionDef | ast.AsyncFunctionDef, method: bool) -> None:
+        if _takes_arguments(node, method):
+            test_file.needs_arguments.append(name)
+        else:
+            test_file.names.append(name)
+
+    for node in tree.body:
+        if not isinstance(node, DEFINITIONS) and not _is_main_guard(node) and not _is_docstring(node):
+            test_file.top_level_code = True
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            add(node.name, node, method=False)
+        elif isinstance(node, ast.ClassDef) and (
+            node.name.startswith("Test")
+            or any(getattr(base, "attr", getattr(base, "id", "")) == "TestCase" for base in node.bases)
+        ):
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith("test"):
+                    add(f"{node.name}.{item.name}", item, method=True)
+    return test_file
+
+
+def discover_tests(file_path: str) -> List[str]:
+    """The tests of a file that can be called without arguments."""
+    return inspect_test_file(file_path).names
+
+
+def can_shard(file_path: str) -> bool:
+    """Whether running the file's tests in shards behaves like one run of the file."""
+    test_file = inspect_test_file(file_path)
+    return len(test_file.names) > 1 and not test_file.top_level_code
+
+
+@dataclass
+class TestOutcome:
+    name: str
+    ok: bool
+    error: str | None = None
+    seconds: float = 0.0
+    # What the test printed to stdout and stderr.
+    output: str = ""
+    skipped: bool = False
+
+
+@dataclass
+class ShardedTestReport:
+    outcomes: List[TestOutcome] = field(default_factory=list)
+    shards: int = 0
+    seconds: float = 0.0
+    shard_errors: List[str] = field(default_factory=list)
+    stopped_early: bool = False
+
+    @property
+    def passed(self) -> int:
+        return sum(1 for outcome in self.outcomes if outcome.ok and not outcome.skipped)
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for outcome in self.outcomes if not outcome.ok)
+
+    @property
+    def skipped(self) -> int:
+        return sum(1 for outcome in self.outcomes if outcome.skipped)
+
+    def format(self, max_failures: int = 10, max_error_chars: int = 300) -> str:
+        """A small report for the agent: one summary line, the first failures and what the tests printed."""
+        status = "PASSED" if not self.failed and not self.shard_errors else "FAILED"
+        summary = f"{status}: {self.passed} passed, {self.failed} failed"
+        if self.skipped:
+            summary += f", {self.skipped} skipped"
+        lines = [f"{summary} in {self.seconds:.2f}s ({self.shards} shards)"]
+        if self.stopped_early:
+            lines.append("Stopped at the first failure (fail fast); remaining tests were not run.")
+        failures = [outcome for outcome in self.outcomes if not outcome.ok]
+        for outcome in failures[:max_failures]:
+            lines.append(f"- {outcome.name}: {(outcome.error or '')[:max_error_chars]}")
+        if len(failures) > max_failures:
+            lines.append(f"- ... and {len(failures) - max_failures} more failures")
+        for outcome in [outcome for outcome in self.outcomes if outcome.skipped][:max_failures]:
+            lines.append(f"- {outcome.name} skipped: {outcome.error}")
+        printed = [outcome for outcome in self.outcomes if outcome.output.strip()]
+        for outcome in printed[:max_failures]:
+            # The end of the output, where a failing test's last prints are.
+            lines.append(f"- {outcome.name} printed:\n{outcome.output.rstrip()[-max_error_chars:]}")
+        if len(printed) > max_failures:
+            lines.append(f"- ... and {len(printed) - max_failures} more tests printed output")
+        for error in self.shard_errors:
+            lines.append(f"- shard error: {error[:max_error_chars]}")
+        return "\n".join(lines)
+
+
+async def _run_shard(file_path: str, names: List[str], fail_fast: bool, timeout: float) -> List[TestOutcome]:
+    fd, report_path = tempfile.mkstemp(suffix=".json", prefix="shard_")
+    os.close(fd)
+    try:
+        args = [sys.executable, SHARD_WORKER, report_path, file_path, *names]
+        if fail_fast:
+            args.append("--fail-fast")
+        result = await run_subprocess(args, timeout=timeout, max_output_bytes=4096)
+        if result.timed_out:
+            raise RuntimeError(f"shard with {', '.join(names)} timed out after {timeout}s")
+        with open(report_path) as f:
+            text = f.read()
+        if not text:
+            raise RuntimeError(f"shard exited with code {result.exit_code}: {result.stderr.strip()[-300:]}")
+        return [TestOutcome(**outcome) for outcome in json.loads(text)]
+    finally:
+        os.remove(report_path)
+
+
+async def run_sharded_tests(
+    file_path: str,
+    shards: int | None = None,
+    fail_fast: bool = False,
+    timeout: float = 120,
+) -> ShardedTestReport:
+    """Split the tests of one file across worker processes and merge the results.
+
+    Every shard imports the file, so its module level code runs once per
+    shard; check can_shard() first. Tests that take arguments, e.g. pytest
+    fixtures, are reported as skipped.
+    """
+    start = time.perf_counter()
+    test_file = inspect_test_file(file_path)
+    names = test_file.names
+    shard_count = max(1, min(shards or os.cpu_count() or 1, len(names)))
+    # Round robin keeps slow neighbouring tests from landing in one shard.
+    shard_names = [names[i::shard_count] for i in range(shard_count)]
+
+    report = ShardedTestReport(shards=shard_count)
+    report.outcomes.extend(
+        TestOutcome(name=name, ok=True, error="takes arguments, e.g. pytest fixtures, which are not provided", skipped=True)
+        for name in test_file.needs_arguments
+    )
+    tasks = [
+        asyncio.create_task(_run_shard(file_path, chunk, fail_fast, timeout))
+        for chunk in shard_names
+        if chunk
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                outcomes = await next_done
+            except Exception as e:
+                report.shard_errors.append(str(e))
+                outcomes = []
+            report.outcomes.extend(outcomes)
+            if fail_fast and (report.shard_errors or any(not outcome.ok for outcome in outcomes)):
+                report.stopped_early = len(report.outcomes) < len(names) + len(test_file.needs_arguments)
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    order = {name: i for i, name in enumerate(names + test_file.needs_arguments)}
+    report.outcomes.sort(key=lambda outcome: order.get(outcome.name, len(order)))
+    report.seconds = time.perf_counter() - start
+    return report
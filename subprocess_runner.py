@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from execution_scheduler import get_scheduler
+from tracing import CODE, tracer
+
+DEFAULT_MAX_OUTPUT_BYTES = 64 * 1024
+LIMITED_EXEC = str(Path(__file__).with_name("limited_exec.py"))
+
+
+def set_concurrency_limit(limit: int) -> None:
+    """Set how many CPU slots the shared execution scheduler hands out."""
+    get_scheduler().set_cpu_slots(limit)
+
+
+def with_rlimits(args: Sequence[str], rlimits: Dict[str, int]) -> List[str]:
+    """The command that runs args under rlimits, set by a launcher that then execs args."""
+    if not rlimits:
+        return list(args)
+    # -S: the launcher only needs the standard library.
+    return [sys.executable, "-S", LIMITED_EXEC, json.dumps(rlimits), *args]
+
+
+@dataclass
+class ProcessResult:
+    exit_code: int
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+    truncated: bool = False
+
+
+class _CappedReader:
+    def __init__(self, stream: asyncio.StreamReader, max_bytes: int) -> None:
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._chunks: list[bytes] = []
+        self._kept = 0
+        self.dropped = 0
+
+    async def read_all(self) -> None:
+        while True:
+            chunk = await self._stream.read(65536)
+            if not chunk:
+                return
+            room = self._max_bytes - self._kept
+            if room > 0:
+                self._chunks.append(chunk[:room])
+                self._kept += min(room, len(chunk))
+            self.dropped += max(0, len(chunk) - max(room, 0))
+
+    def text(self) -> str:
+        text = b"".join(self._chunks).decode("utf-8", errors="replace")
+        if self.dropped:
+            text += f"\n...[{self.dropped} more bytes truncated]"
+        return text
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def run_subprocess(
+    args: Sequence[str],
+    timeout: float = 60,
+    max_output_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+    cwd: str | None = None,
+) -> ProcessResult:
+    """Run a command without blocking the event loop.
+
+    Runs wait for admission by the shared execution scheduler and get its
+    rlimits. stdout and stderr are each kept up to max_output_bytes. On
+    timeout or cancellation the whole process group is killed.
+    """
+    with tracer.span("subprocess", CODE, command=os.path.basename(args[0])) as span:
+        async with get_scheduler().slot() as job:
+            proc = await asyncio.create_subprocess_exec(
+                *with_rlimits(args, job.rlimits),
+                cwd=cwd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+            )
+            stdout = _CappedReader(proc.stdout, max_output_bytes)
+            stderr = _CappedReader(proc.stderr, max_output_bytes)
+            io = asyncio.gather(stdout.read_all(), stderr.read_all(), proc.wait())
+            timed_out = False
+            try:
+                await asyncio.wait_for(asyncio.shield(io), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                _kill_group(proc)
+                # Keep whatever was printed before the kill.
+                await io
+            except asyncio.CancelledError:
+                _kill_group(proc)
+                await asyncio.gather(io, return_exceptions=True)
+                raise
+            if span is not None:
+                span.attrs.update(exit_code=proc.returncode, timed_out=timed_out)
+            return ProcessResult(
+                # Same exit code as the timeout command on linux.
+                exit_code=124 if timed_out else proc.returncode,
+                stdout=stdout.text(),
+                stderr=stderr.text(),
+                timed_out=timed_out,
+                truncated=bool(stdout.dropped or stderr.dropped),
+            )
@@ -0,0 +1,151 @@
+import os
+import platform
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from importlib import metadata
+from typing import Any, Callable, Dict
+
+import psutil
+
+
+def _bash_version() -> str:
+    return subprocess.check_output(["bash", "--version"], timeout=5).decode("utf-8").split("\n")[0]
+
+
+def _ip_address() -> str:
+    return socket.gethostbyname(socket.gethostname())
+
+
+def _file_systems() -> str:
+    return ", ".join(
+        f"{p.mountpoint} ({p.fstype})" for p in psutil.disk_partitions(all=False)
+    )
+
+
+def _environment() -> str:
+    # Only non-sensitive facts; the full environment may hold credentials.
+    keys = ["SHELL", "VIRTUAL_ENV", "CONDA_DEFAULT_ENV", "LANG"]
+    return ", ".join(f"{k}={os.environ[k]}" for k in keys if k in os.environ) or "default"
+
+
+# Packages generated code commonly uses; only these are listed, the rest are counted.
+NOTABLE_PACKAGES = [
+    "numpy", "pandas", "scipy", "matplotlib", "seaborn", "plotly", "scikit-learn", "statsmodels",
+    "sympy", "networkx", "torch", "tensorflow", "transformers", "opencv-python", "pillow",
+    "requests", "httpx", "aiohttp", "beautifulsoup4", "lxml", "flask", "fastapi", "sqlalchemy",
+    "openpyxl", "pyyaml", "psutil", "tqdm", "pytest", "jupyter", "ipython",
+]
+
+
+def _packages() -> str:
+    versions = {}
+    for dist in metadata.distributions():
+        name = dist.metadata["Name"]
+        if name:
+            versions[name.lower().replace("_", "-")] = dist.version
+    notable = [f"{name}=={versions[name]}" for name in NOTABLE_PACKAGES if name in versions]
+    return f"{len(versions)} installed, including: {', '.join(notable) or 'none of the common ones'}"
+
+
+@dataclass
+class Probe:
+    func: Callable[[], Any]
+    # None: probed once and cached for the process lifetime; otherwise seconds until refresh.
+    ttl: float | None = None
+    # Eager probes run in the background thread at startup, the others on first use.
+    eager: bool = True
+
+
+PROBES: Dict[str, Probe] = {
+    "System": Probe(platform.system),
+    "Node": Probe(platform.node),
+    "Release": Probe(platform.release),
+    "Version": Probe(platform.version),
+    "Machine": Probe(platform.machine),
+    "Processor": Probe(platform.processor),
+    "CPU Count": Probe(psutil.cpu_count),
+    "Memory": Probe(psutil.virtual_memory, ttl=30),
+    "Disk": Probe(lambda: psutil.disk_usage("/"), ttl=30),
+    "Python Version": Probe(platform.python_version),
+    "Bash Version": Probe(_bash_version),
+    "IP Address": Probe(_ip_address),
+    "File System": Probe(_file_systems, eager=False),
+    "Environment": Probe(_environment, eager=False),
+    "Package": Probe(_packages, eager=False),
+}
+
+
+class SystemProfile:
+    """Machine facts for the coder, probed once and cached.
+
+    start() runs the eager probes in a background thread so slow ones (bash,
+    DNS) never block the event loop. Volatile fields are refreshed when their
+    TTL expires, and lazy fields are only computed when first asked for.
+    """
+
+    def __init__(self, probes: Dict[str, Probe] = PROBES, wait_timeout: float = 2.0) -> None:
+        self._probes = probes
+        self._wait_timeout = wait_timeout
+        self._values: Dict[str, Any] = {}
+        self._probed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._probe_eager, name="system-profile", daemon=True)
+            self._thread.start()
+
+    def _probe_eager(self) -> None:
+        for name, probe in self._probes.items():
+            if probe.eager:
+                self._probe(name)
+        self._ready.set()
+
+    def _probe(self, name: str) -> Any:
+        try:
+            value = self._probes[name].func()
+        except Exception as e:
+            value = f"Unknown ({type(e).__name__})"
+        with self._lock:
+            self._values[name] = value
+            self._probed_at[name] = time.monotonic()
+        return value
+
+    def get(self, name: str) -> Any:
+        probe = self._probes[name]
+        with self._lock:
+            cached = name in self._values
+            value = self._values.get(name)
+            age = time.monotonic() - self._probed_at.get(name, 0.0)
+        if not cached:
+            if probe.eager and self._thread is not None:
+                self._ready.wait(self._wait_timeout)
+                with self._lock:
+                    # Never block the caller on a slow probe (e.g. DNS); it fills in later.
+                    return self._values.get(name, "Unknown (still probing)")
+            return self._probe(name)
+        if probe.ttl is not None and age > probe.ttl:
+            return self._probe(name)
+        return value
+
+    def render(self) -> str:
+        self.start()
+        lines = "\n".join(f"{name}: {self.get(name)}" for name in self._probes)
+        return f"System Information:\n            \n{lines}"
+
+
+_profile: SystemProfile | None = None
+
+
+def get_system_profile() -> SystemProfile:
+    """Return the process-wide profile, starting its background probe on first use."""
+    global _profile
+    if _profile is None:
+        _profile = SystemProfile()
+        _profile.start()
+    return _profile
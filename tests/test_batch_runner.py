@@ -0,0 +1,21 @@
+import json
+
+from batch_runner import ERROR, OK, completed_ids, read_tasks
+
+
+def test_read_tasks_records_malformed_lines(tmp_path):
+    path = tmp_path / "tasks.jsonl"
+    path.write_text('{"id": "a", "task": "one"}\n\n"two"\n{"no task": 1}\nnot json\n')
+    tasks = list(read_tasks(str(path)))
+    assert [(task.id, task.task, task.error is None) for task in tasks[:2]] == [("a", "one", True), ("line-3", "two", True)]
+    assert [task.id for task in tasks[2:]] == ["line-4", "line-5"]
+    assert all(task.error.startswith("Malformed input line") for task in tasks[2:])
+
+
+def test_completed_ids_drops_a_line_cut_off_by_a_crash(tmp_path):
+    path = tmp_path / "results.jsonl"
+    records = [{"id": "a", "status": OK}, {"id": "b", "status": ERROR}]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records) + '{"id": "c", "sta')
+    assert completed_ids(str(path)) == {"a", "b"}
+    assert path.read_text().endswith("\n")
+    assert completed_ids(str(path), retry_errors=True) == {"a"}
@@ -0,0 +1,37 @@
+from blueprint_store import WORKER, AgentBlueprint, BlueprintStore, task_signature
+
+
+def test_tasks_that_differ_in_their_subject_do_not_share_a_signature():
+    pairs = [
+        ("What's the latest news about Tesla? It's urgent", "What's the latest news about Apple? It's urgent"),
+        ("Install pandas for python 3.11", "Install pandas for python 3.12"),
+        ("Summarize report.csv", "Summarize report.json"),
+        ("Fix the failing test in setup.py", "Fix the failing test in main.py"),
+        ("Search the docs for and/or", "Search the docs for TCP/IP"),
+    ]
+    for first, second in pairs:
+        assert task_signature(first) != task_signature(second), (first, second)
+
+
+def test_recurring_tasks_share_a_signature():
+    pairs = [
+        ("Find the 5 largest files in /tmp", "find the 10 largest files in ~/Downloads"),
+        ("Plot the prices in /data/aapl.csv", "Plot the prices in ./msft.csv"),
+        ("Count the words in 'hello world'", 'Count the words in "goodbye"'),
+        ("Fetch https://example.com/a", "Fetch https://example.org/b?c=1"),
+    ]
+    for first, second in pairs:
+        assert task_signature(first) == task_signature(second), (first, second)
+
+
+def test_blueprint_is_not_reused_for_another_subject(tmp_path):
+    store = BlueprintStore(str(tmp_path / "blueprints.sqlite"))
+    try:
+        store.put(
+            "What's the latest news about Tesla? It's urgent",
+            [AgentBlueprint(kind=WORKER, name="tesla_news", system_message="Find news about Tesla.")],
+        )
+        assert store.get("What's the latest news about Apple? It's urgent") is None
+        assert store.get("What's the latest news about Tesla? It's urgent")[0].name == "tesla_news"
+    finally:
+        store.close()
@@ -0,0 +1,24 @@
+from autogen_core.code_executor import CodeBlock
+
+from import_stats import find_missing_modules
+
+MISSING = "surely_not_an_installed_module"
+
+
+def test_missing_module_is_reported():
+    blocks = [CodeBlock(code=f"import json\nimport {MISSING}\n", language="python")]
+    assert find_missing_modules(blocks) == [MISSING]
+
+
+def test_scripts_that_install_their_packages_are_not_checked():
+    installs_itself = (
+        "import subprocess, sys\n"
+        f'subprocess.check_call([sys.executable, "-m", "pip", "install", "{MISSING}"])\n'
+        f"import {MISSING}\n"
+    )
+    assert find_missing_modules([CodeBlock(code=installs_itself, language="python")]) == []
+    blocks = [
+        CodeBlock(code=f"pip install {MISSING}", language="bash"),
+        CodeBlock(code=f"import {MISSING}", language="python"),
+    ]
+    assert find_missing_modules(blocks) == []
@@ -0,0 +1,21 @@
+from output_shaping import OutputShaper
+
+
+def test_single_long_line_keeps_head_and_tail_within_budget():
+    shaper = OutputShaper(token_budget=50, spill_dir=None)
+    output = "start" + "x" * 5000 + "end"
+    shaped = shaper.shape(output)
+    head, note, tail = shaped.split("\n")
+    assert head.startswith("start")
+    assert tail.endswith("end")
+    assert len(head) + len(tail) == 50 * 4
+    assert note.endswith("chars omitted]...")
+
+
+def test_lines_are_kept_whole_when_they_fit():
+    shaper = OutputShaper(token_budget=50, spill_dir=None)
+    output = "\n".join(f"line {i}" for i in range(100))
+    shaped = shaper.shape(output).split("\n")
+    assert shaped[0] == "line 0"
+    assert shaped[-1] == "line 99"
+    assert "lines omitted" in "\n".join(shaped)
@@ -0,0 +1,34 @@
+import asyncio
+
+from executor_pool import PoolWorker
+
+
+def _run(worker, tmp_path, code, cwd=None):
+    path = tmp_path / "script.py"
+    path.write_text(code)
+    payload = {
+        "op": "run",
+        "file": str(path),
+        "language": "python",
+        "cwd": str(cwd or tmp_path),
+        "timeout": 10,
+        "rlimits": {},
+    }
+    return worker.request(payload)
+
+
+def test_worker_recovers_after_child_fails_before_running(tmp_path):
+    async def main():
+        worker = PoolWorker()
+        await worker.start()
+        try:
+            failed = await _run(worker, tmp_path, "print(1)", cwd=tmp_path / "missing")
+            after = await _run(worker, tmp_path, "print(1)")
+        finally:
+            await worker.stop()
+        return failed, after
+
+    failed, after = asyncio.run(main())
+    assert failed["exit_code"] == 1
+    assert "FileNotFoundError" in failed["output"]
+    assert after == {"exit_code": 0, "output": "1\n"}
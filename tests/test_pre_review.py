@@ -0,0 +1,32 @@
+from pre_review import PreReviewer
+
+HANDLED_IMPORT = "ModuleNotFoundError: No module named 'yaml'\nFalling back to json.\n"
+LOGGED_TRACEBACK = (
+    "Traceback (most recent call last):\n"
+    '  File "script.py", line 3, in <module>\n'
+    "    fetch()\n"
+    "ConnectionError: retrying\n"
+    "done\n"
+)
+
+
+def test_successful_runs_are_left_to_the_model_reviewer():
+    reviewer = PreReviewer()
+    assert reviewer.review(HANDLED_IMPORT, exit_code=0) is None
+    assert reviewer.review(LOGGED_TRACEBACK, exit_code=0) is None
+    assert reviewer.review("", exit_code=0) is None
+    assert reviewer.passed == 3
+
+
+def test_exit_code_is_read_from_the_tool_result_text():
+    reviewer = PreReviewer()
+    text = f"{HANDLED_IMPORT}\nThe POSIX exit code was: 0"
+    assert reviewer.review(text) is None
+
+
+def test_failed_runs_are_rejected():
+    reviewer = PreReviewer()
+    assert "'yaml'" in reviewer.review(HANDLED_IMPORT, exit_code=1)
+    assert "ConnectionError" in reviewer.review(LOGGED_TRACEBACK, exit_code=1)
+    assert "printed nothing" in reviewer.review("", exit_code=None)
+    assert reviewer.rejected == 3
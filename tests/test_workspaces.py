@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+from workspaces import WorkspaceManager
+
+
+def test_path_of_does_not_create_or_activate(tmp_path):
+    workspaces = WorkspaceManager(tmp_path / "sessions")
+    path = workspaces.path_of("task 1")
+    assert path == workspaces.root / WorkspaceManager.dir_name("task 1")
+    assert not path.exists()
+    workspaces.path("task 1")
+    assert path.is_dir()
+
+
+def test_gc_runs_off_the_event_loop(tmp_path):
+    workspaces = WorkspaceManager(tmp_path / "sessions", quota_mb=0, gc_interval=0)
+    (workspaces.root / "stale").mkdir()
+    (workspaces.root / "stale" / "data").write_bytes(b"x" * 1024)
+    gc_threads = []
+    gc = workspaces.gc
+
+    def recording_gc():
+        gc_threads.append(threading.current_thread())
+        return gc()
+
+    workspaces.gc = recording_gc
+
+    async def main():
+        workspaces.path("task")
+        await workspaces._gc_future
+
+    asyncio.run(main())
+    assert gc_threads and gc_threads[0] is not threading.main_thread()
+    assert not (workspaces.root / "stale").exists()
+    assert (workspaces.root / "task").is_dir()
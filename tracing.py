@@ -0,0 +1,284 @@
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncGenerator, Deque, Dict, List, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken, MessageContext, RoutedAgent
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelInfo, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+# Span categories.
+HANDLER = "handler"
+LLM = "llm"
+TOOL = "tool"
+CODE = "code"
+
+_current_task: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_task", default=None)
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("trace_span", default=None)
+
+
+@dataclass
+class Span:
+    span_id: int
+    name: str
+    category: str
+    task_id: Optional[str]
+    parent_id: Optional[int]
+    start: float
+    end: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+class _SpanContext:
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        category: str,
+        task_id: Optional[str],
+        attrs: Dict[str, Any],
+        activate: bool = True,
+    ) -> None:
+        self._tracer = tracer
+        self._activate = activate
+        self._name = name
+        self._category = category
+        self._task_id = task_id
+        self._attrs = attrs
+        self._span: Optional[Span] = None
+        self._tokens: List[contextvars.Token] = []
+
+    def __enter__(self) -> Optional[Span]:
+        if not self._tracer.enabled:
+            return None
+        task_id = self._task_id if self._task_id is not None else _current_task.get()
+        self._span = Span(
+            span_id=next(self._tracer._ids),
+            name=self._name,
+            category=self._category,
+            task_id=task_id,
+            parent_id=_current_span.get(),
+            start=time.perf_counter(),
+            attrs=self._attrs,
+        )
+        if self._activate:
+            self._tokens = [_current_task.set(task_id), _current_span.set(self._span.span_id)]
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._span is None:
+            return
+        if self._tokens:
+            _current_span.reset(self._tokens[1])
+            _current_task.reset(self._tokens[0])
+        self._span.end = time.perf_counter()
+        if exc_type is not None:
+            self._span.attrs["error"] = exc_type.__name__
+        self._tracer._finish(self._span)
+
+
+class Tracer:
+    """Collects spans for message handlers, LLM calls, tool calls and code runs.
+
+    Spans nest through context variables, so an LLM call made inside a
+    handler is its child and inherits the handler's task id. Disabled
+    tracers hand out no-op spans.
+    """
+
+    def __init__(self, enabled: bool = False, max_spans: int = 100000) -> None:
+        self.enabled = enabled
+        self._spans: Deque[Span] = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # perf_counter is only meaningful relative to a reference point.
+        self._origin = time.perf_counter()
+        self._origin_wall = time.time()
+
+    def span(self, name: str, category: str, task_id: Optional[str] = None, **attrs: Any) -> _SpanContext:
+        return _SpanContext(self, name, category, task_id, attrs)
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+    def export_jsonl(self, path: str) -> None:
+        with open(path, "w") as f:
+            for span in self.spans:
+                record = asdict(span)
+                record["start"] = self._origin_wall + span.start - self._origin
+                record["end"] = self._origin_wall + span.end - self._origin
+                record["seconds"] = span.seconds
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Write the spans in Chrome trace-event format (chrome://tracing, Perfetto).
+
+        Every task gets its own track, so a task's seconds read left to right.
+        """
+        events: List[Dict[str, Any]] = []
+        tracks: Dict[Optional[str], int] = {}
+        for span in self.spans:
+            if span.task_id not in tracks:
+                tracks[span.task_id] = len(tracks) + 1
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": 1,
+                        "tid": tracks[span.task_id],
+                        "args": {"name": f"task {span.task_id}" if span.task_id else "no task"},
+                    }
+                )
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": (span.start - self._origin) * 1e6,
+                    "dur": span.seconds * 1e6,
+                    "pid": 1,
+                    "tid": tracks[span.task_id],
+                    "args": {"span_id": span.span_id, "parent_id": span.parent_id, **span.attrs},
+                }
+            )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+tracer = Tracer()
+
+
+def trace_from_env() -> None:
+    """Enable tracing when AGENT_TRACE is set and export the spans at exit.
+
+    AGENT_TRACE is a path prefix; PREFIX.jsonl and PREFIX.trace.json are written.
+    """
+    prefix = os.getenv("AGENT_TRACE")
+    if not prefix or tracer.enabled:
+        return
+    tracer.enabled = True
+
+    def export() -> None:
+        tracer.export_jsonl(f"{prefix}.jsonl")
+        tracer.export_chrome_trace(f"{prefix}.trace.json")
+
+    atexit.register(export)
+
+
+class TracedAgent(RoutedAgent):
+    """A RoutedAgent that records a span around every message it handles.
+
+    The task id of the span is the topic source of the message, which is the
+    session key of the agent instance.
+    """
+
+    async def on_message_impl(self, message: Any, ctx: MessageContext) -> Any:
+        if not tracer.enabled or type(message) not in self._handlers:
+            return await super().on_message_impl(message, ctx)
+        task_id = ctx.topic_id.source if ctx.topic_id is not None else self.id.key
+        with tracer.span(f"{self.id.type}.{type(message).__name__}", HANDLER, task_id=task_id, agent=str(self.id)):
+            return await super().on_message_impl(message, ctx)
+
+
+def _record_usage(span: Optional[Span], result: CreateResult) -> None:
+    if span is None:
+        return
+    span.attrs["prompt_tokens"] = result.usage.prompt_tokens
+    span.attrs["completion_tokens"] = result.usage.completion_tokens
+    span.attrs["cached"] = result.cached
+    span.attrs["tool_calls"] = len(result.content) if isinstance(result.content, list) else 0
+
+
+class TracingChatCompletionClient(ChatCompletionClient):
+    """Wraps a ChatCompletionClient with an LLM span per call, including token usage."""
+
+    def __init__(self, client: ChatCompletionClient) -> None:
+        self._client = client
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        with tracer.span("create", LLM, messages=len(messages), tools=len(tools)) as span:
+            result = await self._client.create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            _record_usage(span, result)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        # Not made current: the caller runs between chunks and its spans are not part of the call.
+        with _SpanContext(tracer, "create_stream", LLM, None, {"messages": len(messages), "tools": len(tools)}, activate=False) as span:
+            async for chunk in self._client.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if span is not None and "first_chunk_seconds" not in span.attrs:
+                    span.attrs["first_chunk_seconds"] = time.perf_counter() - span.start
+                if isinstance(chunk, CreateResult):
+                    _record_usage(span, chunk)
+                yield chunk
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self):  # type: ignore
+        return self._client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+def trace_client(client: ChatCompletionClient) -> ChatCompletionClient:
+    """Wrap client in LLM spans when tracing is enabled."""
+    return TracingChatCompletionClient(client) if tracer.enabled else client
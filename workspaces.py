@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+TMPFS_ROOT = Path("/dev/shm")
+_UNSAFE = re.compile(r"[^\w.\-]+")
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += _dir_size(Path(entry.path))
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+    return total
+
+
+class WorkspaceManager:
+    """One working directory per session under a common root, kept under a disk quota.
+
+    Sessions that are in use are never evicted. Released ones, and
+    directories left over from earlier runs, are deleted least recently used
+    first once the root grows beyond ``quota_mb``. With ``tmpfs`` the root is
+    moved to /dev/shm, so scratch files never touch the disk.
+    """
+
+    def __init__(self, root: str | Path, quota_mb: int = 1024, tmpfs: bool = False, gc_interval: float = 30.0) -> None:
+        root = Path(root).resolve()
+        if tmpfs and TMPFS_ROOT.is_dir():
+            digest = hashlib.sha256(str(root).encode()).hexdigest()[:12]
+            root = TMPFS_ROOT / f"agent_workspaces_{digest}"
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_mb * 1024 * 1024
+        self.gc_interval = gc_interval
+        self._active: Set[str] = set()
+        self._last_used: Dict[str, float] = {}
+        self._last_gc = 0.0
+        self._gc_future: asyncio.Future | None = None
+        self.evicted = 0
+
+    @staticmethod
+    def dir_name(session: str) -> str:
+        name = _UNSAFE.sub("_", session).strip("._")[:64] or "session"
+        if name != session:
+            # Keep sessions that sanitize to the same name apart.
+            name += "_" + hashlib.sha256(session.encode()).hexdigest()[:8]
+        return name
+
+    def path_of(self, session: str) -> Path:
+        """The session's workspace, without creating it or marking the session in use."""
+        return self.root / self.dir_name(session)
+
+    def path(self, session: str) -> Path:
+        """Return the session's workspace, creating it, and mark the session in use."""
+        name = self.dir_name(session)
+        path = self.root / name
+        path.mkdir(exist_ok=True)
+        self._active.add(name)
+        self._last_used[name] = time.time()
+        if time.monotonic() - self._last_gc > self.gc_interval:
+            self._schedule_gc()
+        return path
+
+    def _schedule_gc(self) -> None:
+        # Walking the root can take a while, so on an event loop gc runs in a thread.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.gc()
+            return
+        if self._gc_future is None or self._gc_future.done():
+            self._last_gc = time.monotonic()
+            self._gc_future = loop.run_in_executor(None, self.gc)
+
+    def release(self, session: str, delete: bool = False) -> None:
+        """Mark the session done; its workspace is kept until the quota needs the room."""
+        name = self.dir_name(session)
+        self._active.discard(name)
+        self._last_used[name] = time.time()
+        if delete:
+            shutil.rmtree(self.root / name, ignore_errors=True)
+            self._last_used.pop(name, None)
+
+    def usage(self) -> List[Tuple[str, int, float]]:
+        """(name, bytes, last used) of every workspace under the root."""
+        usage = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            last_used = self._last_used.get(entry.name)
+            if last_used is None:
+                last_used = entry.stat().st_mtime
+            usage.append((entry.name, _dir_size(Path(entry.path)), last_used))
+        return usage
+
+    def gc(self) -> int:
+        """Evict idle workspaces, oldest first, until the root fits the quota; returns bytes freed."""
+        self._last_gc = time.monotonic()
+        usage = self.usage()
+        total = sum(size for _, size, _ in usage)
+        freed = 0
+        for name, size, _ in sorted(usage, key=lambda item: item[2]):
+            if total - freed <= self.quota_bytes:
+                break
+            if name in self._active:
+                continue
+            shutil.rmtree(self.root / name, ignore_errors=True)
+            self._last_used.pop(name, None)
+            freed += size
+            self.evicted += 1
+        return freed
+
+
+def workspaces_from_env(root: str | Path) -> WorkspaceManager:
+    """Build a WorkspaceManager for root, configured by AGENT_WORKSPACE_QUOTA_MB and AGENT_WORKSPACE_TMPFS."""
+    return WorkspaceManager(
+        root,
+        quota_mb=int(os.getenv("AGENT_WORKSPACE_QUOTA_MB", "1024")),
+        tmpfs=os.getenv("AGENT_WORKSPACE_TMPFS", "") not in ("", "0", "false"),
+    )